@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+"""
+인덱스 빌드 CLI
+- Streamlit 앱이 요청 중에 PDF 파싱/임베딩을 하지 않도록, 배포 전에 인덱스 아티팩트를 만들어 둡니다.
+
+사용 예)
+    python build_index.py --all
+    python build_index.py library "[챗봇프로그램및실습] 부경대학교 규정집.pdf"
+    python build_index.py highschool my_highschool_handbook.pdf --force
+"""
+
+import argparse
+import os
+import sys
+
+from corpora import CORPORA
+from rag_embeddings import DEFAULT_BATCH_SIZE, DEFAULT_MODEL, EmbeddingCache, EmbeddingEngine
+from rag_index import INDEX_ROOT, KEEP_VERSIONS, build_index
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="PDF → 버전이 붙은 RAG 인덱스 아티팩트 빌드")
+    parser.add_argument("name", nargs="?", help="인덱스 이름 (예: library)")
+    parser.add_argument("pdf", nargs="?", help="PDF 경로 (생략하면 기본 코퍼스 경로)")
+    parser.add_argument("--all", action="store_true", help="기본 코퍼스를 모두 빌드")
+    parser.add_argument("--index-root", default=INDEX_ROOT)
+    parser.add_argument("--model", default=DEFAULT_MODEL)
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+    parser.add_argument("--embed-workers", type=int, default=1)
+    parser.add_argument("--ingest-workers", type=int, default=None)
+    parser.add_argument("--cache", default=os.environ.get("EMBED_CACHE_PATH", "./embedding_cache.sqlite"))
+    parser.add_argument("--force", action="store_true", help="PDF가 그대로여도 새 버전을 빌드")
+    parser.add_argument("--keep", type=int, default=KEEP_VERSIONS, help="남겨 둘 최근 버전 수")
+    args = parser.parse_args(argv)
+
+    if args.all:
+        targets = [(corpus.name, corpus.pdf_path) for corpus in CORPORA.values()]
+    elif args.name:
+        corpus = CORPORA.get(args.name)
+        pdf = args.pdf or (corpus.pdf_path if corpus else None)
+        if pdf is None:
+            parser.error(f"'{args.name}'의 PDF 경로를 지정해주세요.")
+        targets = [(args.name, pdf)]
+    else:
+        parser.error("인덱스 이름 또는 --all 을 지정해주세요.")
+
+    engine = EmbeddingEngine(
+        args.model,
+        batch_size=args.batch_size,
+        workers=args.embed_workers,
+        cache=EmbeddingCache(args.cache),
+    )
+    try:
+        for name, pdf in targets:
+            print(f"[{name}] {pdf}")
+            artifact = build_index(
+                pdf, name, engine,
+                index_root=args.index_root,
+                workers=args.ingest_workers,
+                force=args.force,
+                keep=args.keep,
+                progress=lambda stats: print(f"  pages={stats.pages} chunks={stats.chunks}", end="\r"),
+            )
+            build = artifact.manifest["build"]
+            print(f"  -> {artifact.path} ({artifact.manifest['count']} chunks, "
+                  f"embedded {build['embedded']}, reused {build['reused']}, {build['seconds']}s, "
+                  f"{build['pages_per_sec']} pages/s, {build['chunks_per_sec']} chunks/s)")
+    finally:
+        engine.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
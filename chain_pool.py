@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+"""
+크기가 제한된 체인 풀 (LRU)
+- st.cache_resource처럼 인자 조합마다 체인을 영원히 쌓아두지 않고, max_size개를 넘으면 가장 오래 안 쓴 것부터 버림
+- 체인은 가벼운 키(예: 모델 이름)로만 만들고, temperature/톤 같은 값은 호출할 때 넘기는 것을 전제로 함
+- 체인 생성은 풀 잠금 밖에서 (느린 생성 하나가 다른 세션의 조회를 막지 않게), 넣을 때 다시 확인해서
+  같은 키를 동시에 만들었으면 먼저 들어간 것을 씀
+- 적중/생성/제거 횟수, 생성에 걸린 시간, 생성 전후 프로세스 RSS 증가량을 stats()로 확인
+  (RSS는 rag_embeddings.resident_memory_mb 기준, 다른 스레드가 쓴 메모리도 섞일 수 있는 근사치)
+"""
+
+import threading
+import time
+from collections import OrderedDict
+
+from llm_gateway import get_gateway
+from rag_embeddings import resident_memory_mb
+
+DEFAULT_MAX_CHAINS = 8
+
+
+class ChainPool:
+    """
+    build(key) -> 체인. get(key)는 있으면 재사용하고 없으면 만들어 넣습니다.
+    """
+
+    def __init__(self, build, max_size: int = DEFAULT_MAX_CHAINS, gateway=None):
+        self.build = build
+        self.max_size = max_size
+        self.gateway = gateway or get_gateway()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.build_seconds = 0.0
+        self.build_rss_mb = 0.0
+        self._chains = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            if key in self._chains:
+                self._chains.move_to_end(key)
+                self.hits += 1
+                return self._chains[key]
+            self.misses += 1
+        started = time.perf_counter()
+        rss_before = resident_memory_mb()
+        chain = self.build(key)
+        rss_grown = max(0.0, resident_memory_mb() - rss_before)
+        with self._lock:
+            self.build_seconds += time.perf_counter() - started
+            self.build_rss_mb += rss_grown
+            if key in self._chains:
+                # 다른 세션이 그사이 먼저 만들어 넣음: 그쪽을 같이 씀
+                self._chains.move_to_end(key)
+                return self._chains[key]
+            self._chains[key] = chain
+            while len(self._chains) > self.max_size:
+                self._chains.popitem(last=False)
+                self.evictions += 1
+            return chain
+
+    def clear(self) -> None:
+        with self._lock:
+            self._chains.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            chains = len(self._chains)
+        return {
+            "chains": chains,
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "build_seconds": round(self.build_seconds, 3),
+            # 체인을 만들면서 늘어난 RSS 합과 체인 하나당 평균 (MB), 지금 프로세스 RSS
+            "build_rss_mb": round(self.build_rss_mb, 1),
+            "rss_per_chain_mb": round(self.build_rss_mb / self.misses, 1) if self.misses else 0.0,
+            "rss_mb": round(resident_memory_mb(), 1),
+            # 체인이 공유하는 게이트웨이 클라이언트 수 (모델당 하나)
+            "clients": self.gateway.stats()["clients"],
+        }
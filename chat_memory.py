@@ -0,0 +1,238 @@
+# -*- coding: utf-8 -*-
+"""
+토큰 예산 기반 대화 기록 창 + 누적 요약
+- 프롬프트에는 최근 메시지 중 token_budget 안에 들어가는 것만 보냄 (턴 수가 아니라 토큰 기준)
+- 창 밖으로 밀려난 예전 메시지는 LLM으로 누적 요약에 접어 넣음
+- 요약과 요약에 접어 넣은 메시지 수(high-water mark)는 저장소가 지원하면(SQLiteChatMessageHistory) 대화 기록과
+  같은 DB에, 아니면 세션마다 session_state에 보관 → 같은 메시지를 두 번 요약하지 않음
+- 요약 호출 한 번에 접어 넣는 양은 fold_token_limit 이하 (오래된 대화가 한꺼번에 밀려나도 여러 번에 나눠 접음)
+- 요약은 답변을 화면에 다 그린 뒤 워커 스레드에서 미리 해둠 (창이 예산의 80%를 넘으면 50%까지 접음)
+  → 다음 요청은 LLM 요약 호출 없이 [요약 + 최근 대화]만 보냄
+- 원본 메시지는 그대로 두므로 화면에는 전체 대화가 그대로 보임
+"""
+
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+
+from langchain_core.chat_history import BaseChatMessageHistory
+from langchain_core.messages import AIMessage
+from langchain_core.output_parsers import StrOutputParser
+from langchain_core.prompts import ChatPromptTemplate
+
+from llm_gateway import get_gateway
+from token_budget import estimate_message_tokens, truncate_to_tokens
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_HISTORY_TOKEN_BUDGET = int(os.environ.get("CHAT_HISTORY_TOKEN_BUDGET", 1500))
+DEFAULT_SUMMARY_TOKEN_BUDGET = 300
+DEFAULT_FOLD_TOKEN_LIMIT = int(os.environ.get("CHAT_SUMMARY_FOLD_TOKENS", 3000))
+HIGH_WATER = 0.8
+LOW_WATER = 0.5
+SUMMARY_PREFIX = "(이전 대화 요약)\n"
+
+SUMMARY_PROMPT = ChatPromptTemplate.from_messages(
+    [
+        ("system", "너는 대화 기록을 요약하는 도우미야. 지금까지의 요약과 그 뒤에 이어진 대화를 하나의 요약으로 합쳐줘. "
+                   "사용자에 대한 사실, 고민과 감정, 정해진 내용, 챗봇이 약속하거나 안내한 것을 빠뜨리지 말고 "
+                   "한국어로 {max_tokens}토큰 이내로 써줘. 요약문만 출력해."),
+        ("human", "[지금까지의 요약]\n{summary}\n\n[이어진 대화]\n{conversation}"),
+    ]
+)
+
+
+@dataclass
+class SummaryState:
+    summary: str = ""
+    summarized: int = 0
+    lock: threading.Lock = field(default_factory=threading.Lock, repr=False, compare=False)
+    pending: object = field(default=None, repr=False, compare=False)
+
+    def snapshot(self):
+        with self.lock:
+            return self.summary, self.summarized
+
+    def reset(self) -> None:
+        with self.lock:
+            self.summary = ""
+            self.summarized = 0
+
+
+# 요약 LLM 호출은 스크립트 스레드가 아니라 여기서 (모든 세션 공유)
+_compactor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="history-summary")
+
+
+def summary_state(session_state, key: str) -> SummaryState:
+    """
+    session_state[key]에 세션별 요약 상태를 만들어 두고 돌려줍니다.
+    """
+    if key not in session_state:
+        session_state[key] = SummaryState()
+    return session_state[key]
+
+
+def _pending_messages(store, start: int):
+    # 요약 안 된 뒤쪽만 필요하므로, 저장소가 부분 읽기를 지원하면 앞부분은 읽지 않음
+    if hasattr(store, "messages_from"):
+        return store.messages_from(start)
+    return store.messages[start:]
+
+
+def _message_count(store) -> int:
+    return store.count() if hasattr(store, "count") else len(store.messages)
+
+
+def _take_tokens(messages, limit: int):
+    # 앞에서부터 limit 토큰 안에 드는 메시지만 (최소 하나)
+    used = 0
+    for i, message in enumerate(messages):
+        used += estimate_message_tokens([message])
+        if i and used > limit:
+            return messages[:i]
+    return messages
+
+
+def format_conversation(messages) -> str:
+    speakers = {"human": "사용자", "ai": "챗봇"}
+    return "\n".join(f"{speakers.get(message.type, message.type)}: {message.content}" for message in messages)
+
+
+def make_summarizer(llm, max_tokens: int = DEFAULT_SUMMARY_TOKEN_BUDGET):
+    """
+    summarize(이전 요약, 새로 밀려난 메시지들) -> 새 요약 함수를 만듭니다.
+    """
+    chain = SUMMARY_PROMPT | llm | StrOutputParser()
+
+    def summarize(previous: str, messages) -> str:
+        return get_gateway().invoke(chain, {
+            "max_tokens": max_tokens,
+            "summary": previous or "(없음)",
+            "conversation": format_conversation(messages),
+        })
+    return summarize
+
+
+class WindowedChatHistory(BaseChatMessageHistory):
+    """
+    store: 실제 대화 기록 (SQLiteChatMessageHistory 등)
+    .messages 는 [요약] + 토큰 예산 안의 최근 메시지만 돌려주고, 추가/삭제는 store에 그대로 위임합니다.
+    """
+
+    def __init__(self, store, state: SummaryState, summarize=None,
+                 token_budget: int = DEFAULT_HISTORY_TOKEN_BUDGET,
+                 summary_budget: int = DEFAULT_SUMMARY_TOKEN_BUDGET,
+                 fold_token_limit: int = DEFAULT_FOLD_TOKEN_LIMIT):
+        self.store = store
+        self.state = state
+        self.summarize = summarize
+        self.token_budget = token_budget
+        self.summary_budget = summary_budget
+        self.fold_token_limit = fold_token_limit
+
+    @staticmethod
+    def _summary_messages(summary: str):
+        return [AIMessage(content=SUMMARY_PREFIX + summary)] if summary else []
+
+    def _split(self, pending, summary: str, budget: int):
+        # pending(요약 안 된 메시지)을 (창 밖으로 밀려난 것, 창 안의 것)으로 나눔
+        budget -= estimate_message_tokens(self._summary_messages(summary))
+        used = 0
+        keep = 0
+        for message in reversed(pending):
+            cost = estimate_message_tokens([message])
+            if keep and used + cost > budget:
+                break
+            used += cost
+            keep += 1
+        cut = len(pending) - keep
+        # 요약(AI 메시지) 뒤에는 사용자 메시지부터 오도록 창의 시작을 맞춤
+        if cut or summary:
+            while cut < len(pending) - 1 and pending[cut].type != "human":
+                cut += 1
+        return pending[:cut], pending[cut:]
+
+    def _state(self):
+        if hasattr(self.store, "load_summary"):
+            return self.store.load_summary()
+        summary, summarized = self.state.snapshot()
+        if summarized > _message_count(self.store):
+            # 대화가 지워졌으면 요약도 처음부터
+            self.state.reset()
+            return "", 0
+        return summary, summarized
+
+    @property
+    def messages(self):
+        summary, summarized = self._state()
+        _, recent = self._split(_pending_messages(self.store, summarized), summary, self.token_budget)
+        return self._summary_messages(summary) + recent
+
+    def _save(self, summary: str, summarized: int, expected: int) -> bool:
+        if hasattr(self.store, "save_summary"):
+            return self.store.save_summary(summary, summarized, expected)
+        with self.state.lock:
+            if self.state.summarized != expected:
+                return False
+            self.state.summary = summary
+            self.state.summarized = summarized
+        return True
+
+    def _fold(self, budget: int) -> bool:
+        summary, summarized = self._state()
+        overflow, _ = self._split(_pending_messages(self.store, summarized), summary, budget)
+        if not overflow or self.summarize is None:
+            return False
+        folded = False
+        while overflow:
+            chunk = _take_tokens(overflow, self.fold_token_limit)
+            try:
+                new_summary = self.summarize(summary, chunk)
+            except Exception as e:
+                logger.warning("history summary failed: %s", e)
+                return folded
+            new_summary = truncate_to_tokens(new_summary.strip(), self.summary_budget)
+            if not self._save(new_summary, summarized + len(chunk), expected=summarized):
+                # 요약하는 동안 대화가 지워졌거나 다른 요약이 먼저 반영됨
+                return folded
+            summary, summarized = new_summary, summarized + len(chunk)
+            overflow = overflow[len(chunk):]
+            folded = True
+        return folded
+
+    def compact(self) -> bool:
+        """
+        창 밖으로 밀려난 메시지를 지금 바로 누적 요약에 접어 넣습니다. 접어 넣은 게 있으면 True.
+        요약에 실패해도 창은 예산 안이므로 이번에는 건너뛰고 다음에 다시 시도합니다.
+        """
+        return self._fold(self.token_budget)
+
+    def needs_compaction(self) -> bool:
+        summary, summarized = self._state()
+        used = estimate_message_tokens(self._summary_messages(summary) + _pending_messages(self.store, summarized))
+        return used > self.token_budget * HIGH_WATER
+
+    def compact_in_background(self):
+        """
+        답변을 다 보여준 뒤 호출합니다. 창이 예산의 HIGH_WATER를 넘었으면 LOW_WATER까지
+        워커 스레드에서 요약해 두고, 이미 진행 중인 요약이 있으면 아무것도 하지 않습니다.
+        """
+        if self.summarize is None or not self.needs_compaction():
+            return None
+        with self.state.lock:
+            if self.state.pending is not None and not self.state.pending.done():
+                return self.state.pending
+            self.state.pending = _compactor.submit(self._fold, int(self.token_budget * LOW_WATER))
+            return self.state.pending
+
+    def prompt_tokens(self) -> int:
+        return estimate_message_tokens(self.messages)
+
+    def add_message(self, message) -> None:
+        self.store.add_message(message)
+
+    def clear(self) -> None:
+        self.store.clear()
+        self.state.reset()
@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+"""
+대화 세션 id (= 대화 기록을 여는 열쇠)
+- URL에 넣지 않고 쿠키(SESSION_COOKIE)에 둠: 주소를 복사/공유해도 대화가 따라가지 않음
+  (SameSite=Strict, https면 Secure)
+- 쿠키는 쓸 때마다(탭을 열 때, 열어둔 탭은 하루에 한 번) Max-Age를 새로 씀: 쿠키는 마지막 방문부터,
+  저장소(ChatStore)는 마지막 대화부터 보관 기간을 세므로 쿠키가 서버의 기록보다 먼저 사라지지 않음
+- 한 브라우저 탭 안에서는 st.session_state에 두고, 새로고침하면 st.context.cookies(Streamlit 1.37+)에서 다시 읽음
+- 예전 ?sid= 링크는 주소창에서 지우기만 함 (URL로 돌아다니던 id는 받아들이지 않음)
+- 로그/프로파일에는 id 대신 session_label() (해시 앞부분)만 남김
+- 의존성 없음: streamlit은 함수 안에서 import (rerun_profiler가 langchain 없이 가져다 씀)
+"""
+
+import hashlib
+import json
+import os
+import re
+import secrets
+import time
+from http.cookies import CookieError, SimpleCookie
+
+SESSION_COOKIE = "chat_sid"
+SESSION_STATE_KEY = "chat_session_id"
+LEGACY_SESSION_PARAM = "sid"
+# 마지막 대화 뒤 이 기간이 지나면 대화 기록과 쿠키가 함께 사라짐 (0이면 무기한)
+RETENTION_DAYS = float(os.environ.get("CHAT_RETENTION_DAYS", 30))
+
+_VALID_ID = re.compile(r"^[A-Za-z0-9_-]{32,128}$")
+
+
+def new_session_id() -> str:
+    return secrets.token_urlsafe(32)
+
+
+def is_valid_session_id(session_id) -> bool:
+    return isinstance(session_id, str) and _VALID_ID.match(session_id) is not None
+
+
+def session_label(session_id):
+    """
+    로그에 남길 수 있는 세션 표시 (id 자체는 남기지 않음)
+    """
+    if not session_id:
+        return None
+    return hashlib.sha256(session_id.encode("utf-8")).hexdigest()[:12]
+
+
+def parse_cookie_header(cookie_header) -> dict:
+    if not cookie_header:
+        return {}
+    cookie = SimpleCookie()
+    try:
+        cookie.load(cookie_header)
+    except CookieError:
+        return {}
+    return {name: morsel.value for name, morsel in cookie.items()}
+
+
+def cookie_session_id(cookies):
+    session_id = (cookies or {}).get(SESSION_COOKIE)
+    return session_id if is_valid_session_id(session_id) else None
+
+
+def _request_cookies() -> dict:
+    """
+    이번 요청의 쿠키 {이름: 값}. st.context.cookies가 기본이고, 그보다 옛 Streamlit은 웹소켓 헤더에서 읽습니다.
+    읽을 방법이 없으면 RuntimeError (조용히 넘어가면 새로고침할 때마다 새 세션이 되어 대화가 끊김).
+    """
+    import streamlit as st
+
+    context = getattr(st, "context", None)
+    if context is not None:
+        return dict(context.cookies)
+    try:
+        from streamlit.web.server.websocket_headers import _get_websocket_headers
+    except ImportError as e:
+        raise RuntimeError(f"Streamlit {st.__version__} has no way to read request cookies") from e
+    headers = _get_websocket_headers() or {}
+    return parse_cookie_header(headers.get("Cookie"))
+
+
+def _store_cookie(session_id: str) -> None:
+    import streamlit.components.v1 as components
+
+    max_age = f"; Max-Age={int(RETENTION_DAYS * 86400)}" if RETENTION_DAYS > 0 else ""
+    cookie = json.dumps(f"{SESSION_COOKIE}={session_id}{max_age}; Path=/; SameSite=Strict")
+    # 컴포넌트 iframe은 같은 출처라서 앱 페이지의 쿠키를 바로 씀
+    # 내용이 같으면 재실행해도 iframe이 그대로라 스크립트가 다시 돌지 않으므로, 날짜를 넣어 하루에 한 번은 새로 씀
+    components.html(
+        f"<!-- {time.strftime('%Y-%m-%d')} -->"
+        "<script>"
+        f"const cookie = {cookie} + (window.parent.location.protocol === 'https:' ? '; Secure' : '');"
+        "window.parent.document.cookie = cookie;"
+        "</script>",
+        height=0,
+    )
+
+
+def chat_session_id(query_params, session_state) -> str:
+    """
+    이 브라우저의 대화 세션 id. 쿠키에 없으면 새로 만들고, 어느 쪽이든 쿠키의 보관 기간을 새로 씁니다.
+    """
+    if LEGACY_SESSION_PARAM in query_params:
+        del query_params[LEGACY_SESSION_PARAM]
+    session_id = session_state.get(SESSION_STATE_KEY)
+    if not is_valid_session_id(session_id):
+        session_id = cookie_session_id(_request_cookies()) or new_session_id()
+        session_state[SESSION_STATE_KEY] = session_id
+    # 재실행마다 그려야 요소가 사라지지 않음 (같은 내용이면 다시 쓰지 않음)
+    _store_cookie(session_id)
+    return session_id
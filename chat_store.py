@@ -0,0 +1,257 @@
+# -*- coding: utf-8 -*-
+"""
+SQLite(WAL) 대화 기록 저장소
+- StreamlitChatMessageHistory 대신 사용: 새로고침/서버 재시작 후에도 대화가 남고, 쉬고 있는 세션은 메모리를 쓰지 않음
+- 메시지는 추가만 하고, 대화 지우기는 그 세션 메시지를 실제로 DELETE (seq 번호는 이어서 씀)
+- 마지막 대화 뒤 CHAT_RETENTION_DAYS(기본 30일)가 지난 세션은 메시지째 삭제 (열 때 + 추가할 때 한 시간에 한 번)
+- (namespace, session_id, seq) 인덱스로 세션별로 필요한 부분만 페이지 단위로 읽음
+- 프롬프트용 누적 요약과 요약에 접어 넣은 위치도 세션 행에 같이 저장 (새로고침/재시작 뒤에도 이어짐)
+- session_id는 chat_session.chat_session_id()가 쿠키로 유지 (RunnableWithMessageHistory의 session_id로 그대로 사용)
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from langchain_core.chat_history import BaseChatMessageHistory
+from langchain_core.messages import message_to_dict, messages_from_dict
+
+from chat_session import RETENTION_DAYS
+
+DEFAULT_CHAT_DB_PATH = os.environ.get("CHAT_DB_PATH", "./chat_history.sqlite")
+DEFAULT_PAGE_SIZE = 50
+PURGE_INTERVAL = 3600
+
+
+class ChatStore:
+    """
+    모든 앱/세션이 함께 쓰는 대화 기록 DB (프로세스당 연결 하나)
+    """
+
+    def __init__(self, path: str = DEFAULT_CHAT_DB_PATH, retention_days: float = RETENTION_DAYS):
+        self.retention = retention_days * 86400 if retention_days > 0 else None
+        self._last_purge = 0.0
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS messages ("
+            " id INTEGER PRIMARY KEY AUTOINCREMENT, namespace TEXT NOT NULL, session_id TEXT NOT NULL,"
+            " seq INTEGER NOT NULL, message TEXT NOT NULL, created REAL NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE UNIQUE INDEX IF NOT EXISTS idx_messages_session ON messages(namespace, session_id, seq)"
+        )
+        # 세션별 다음 seq와 '여기까지 지움' 위치, 누적 요약과 요약에 접어 넣은 위치(seq)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS sessions ("
+            " namespace TEXT NOT NULL, session_id TEXT NOT NULL, next_seq INTEGER NOT NULL,"
+            " cleared_seq INTEGER NOT NULL, updated REAL NOT NULL,"
+            " summary TEXT NOT NULL DEFAULT '', summarized_seq INTEGER NOT NULL DEFAULT 0,"
+            " PRIMARY KEY (namespace, session_id))"
+        )
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(sessions)")}
+        for column, ddl in (("summary", "TEXT NOT NULL DEFAULT ''"), ("summarized_seq", "INTEGER NOT NULL DEFAULT 0")):
+            if column not in columns:
+                self._conn.execute(f"ALTER TABLE sessions ADD COLUMN {column} {ddl}")
+        self.purge_expired()
+
+    def _session(self, namespace: str, session_id: str):
+        row = self._conn.execute(
+            "SELECT next_seq, cleared_seq FROM sessions WHERE namespace = ? AND session_id = ?",
+            (namespace, session_id),
+        ).fetchone()
+        return row or (0, 0)
+
+    def append(self, namespace: str, session_id: str, messages) -> None:
+        messages = list(messages)
+        if not messages:
+            return
+        now = time.time()
+        if self.retention is not None and now - self._last_purge > PURGE_INTERVAL:
+            self.purge_expired(now)
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                next_seq, cleared_seq = self._session(namespace, session_id)
+                self._conn.executemany(
+                    "INSERT INTO messages (namespace, session_id, seq, message, created) VALUES (?, ?, ?, ?, ?)",
+                    [(namespace, session_id, next_seq + i, json.dumps(message_to_dict(message), ensure_ascii=False), now)
+                     for i, message in enumerate(messages)],
+                )
+                self._conn.execute(
+                    "INSERT INTO sessions (namespace, session_id, next_seq, cleared_seq, updated) VALUES (?, ?, ?, ?, ?)"
+                    " ON CONFLICT (namespace, session_id) DO UPDATE SET next_seq = excluded.next_seq,"
+                    " updated = excluded.updated",
+                    (namespace, session_id, next_seq + len(messages), cleared_seq, now),
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def clear(self, namespace: str, session_id: str) -> None:
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                next_seq, _ = self._session(namespace, session_id)
+                self._conn.execute(
+                    "DELETE FROM messages WHERE namespace = ? AND session_id = ?", (namespace, session_id)
+                )
+                # seq는 이어서 써야 지우기 전에 시작한 요약이 늦게 저장되는 것을 막을 수 있음
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO sessions (namespace, session_id, next_seq, cleared_seq, updated,"
+                    " summary, summarized_seq) VALUES (?, ?, ?, ?, ?, '', ?)",
+                    (namespace, session_id, next_seq, next_seq, time.time(), next_seq),
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def purge_expired(self, now: float = None) -> int:
+        """
+        마지막 대화 뒤 보관 기간이 지난 세션을 메시지째 지우고, 지운 세션 수를 돌려줍니다.
+        """
+        if self.retention is None:
+            return 0
+        now = time.time() if now is None else now
+        cutoff = now - self.retention
+        with self._lock:
+            self._last_purge = now
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.execute(
+                    "DELETE FROM messages WHERE (namespace, session_id) IN"
+                    " (SELECT namespace, session_id FROM sessions WHERE updated < ?)",
+                    (cutoff,),
+                )
+                purged = self._conn.execute("DELETE FROM sessions WHERE updated < ?", (cutoff,)).rowcount
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return purged
+
+    def load_summary(self, namespace: str, session_id: str):
+        """
+        (누적 요약, 요약에 접어 넣은 메시지 수) - 메시지 수는 지운 뒤부터 센 번호
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT cleared_seq, summary, summarized_seq FROM sessions WHERE namespace = ? AND session_id = ?",
+                (namespace, session_id),
+            ).fetchone()
+        if row is None or row[2] < row[0]:
+            return "", 0
+        return row[1], row[2] - row[0]
+
+    def save_summary(self, namespace: str, session_id: str, summary: str, summarized: int, expected: int) -> bool:
+        """
+        요약 위치가 아직 expected일 때만 저장합니다 (그 사이 대화가 지워졌거나 다른 요약이 먼저 반영됐으면 False).
+        """
+        with self._lock:
+            cursor = self._conn.execute(
+                "UPDATE sessions SET summary = ?, summarized_seq = cleared_seq + ?"
+                " WHERE namespace = ? AND session_id = ? AND MAX(summarized_seq, cleared_seq) = cleared_seq + ?"
+                " AND cleared_seq + ? <= next_seq",
+                (summary, summarized, namespace, session_id, expected, summarized),
+            )
+        return cursor.rowcount == 1
+
+    def count(self, namespace: str, session_id: str) -> int:
+        with self._lock:
+            next_seq, cleared_seq = self._session(namespace, session_id)
+        return next_seq - cleared_seq
+
+    def read(self, namespace: str, session_id: str, start: int = 0, stop: int = None):
+        """
+        지운 뒤부터 센 메시지 번호 [start, stop) 구간을 읽습니다.
+        """
+        with self._lock:
+            next_seq, cleared_seq = self._session(namespace, session_id)
+            low = cleared_seq + max(start, 0)
+            high = next_seq if stop is None else min(next_seq, cleared_seq + stop)
+            if low >= high:
+                return []
+            rows = self._conn.execute(
+                "SELECT message FROM messages WHERE namespace = ? AND session_id = ? AND seq >= ? AND seq < ?"
+                " ORDER BY seq",
+                (namespace, session_id, low, high),
+            ).fetchall()
+        return messages_from_dict([json.loads(row[0]) for row in rows])
+
+
+class SQLiteChatMessageHistory(BaseChatMessageHistory):
+    """
+    ChatStore 위의 세션 하나. messages는 처음 읽을 때 페이지 단위로 불러오고 이 객체 안에서만 보관합니다.
+    """
+
+    def __init__(self, store: ChatStore, namespace: str, session_id: str, page_size: int = DEFAULT_PAGE_SIZE):
+        self.store = store
+        self.namespace = namespace
+        self.session_id = session_id
+        self.page_size = page_size
+        self._loaded = None
+
+    def count(self) -> int:
+        return self.store.count(self.namespace, self.session_id)
+
+    def page(self, start: int, stop: int = None):
+        return self.store.read(self.namespace, self.session_id, start, stop)
+
+    def messages_from(self, start: int):
+        # 프롬프트 창처럼 뒤쪽 일부만 필요할 때: 앞부분은 읽지 않음
+        if self._loaded is not None:
+            return self._loaded[start:]
+        return self.page(start)
+
+    @property
+    def messages(self):
+        if self._loaded is None:
+            loaded = []
+            while True:
+                page = self.page(len(loaded), len(loaded) + self.page_size)
+                loaded.extend(page)
+                if len(page) < self.page_size:
+                    break
+            self._loaded = loaded
+        return list(self._loaded)
+
+    def add_message(self, message) -> None:
+        self.add_messages([message])
+
+    def add_messages(self, messages) -> None:
+        messages = list(messages)
+        self.store.append(self.namespace, self.session_id, messages)
+        if self._loaded is not None:
+            self._loaded.extend(messages)
+
+    def clear(self) -> None:
+        self.store.clear(self.namespace, self.session_id)
+        self._loaded = []
+
+    def load_summary(self):
+        return self.store.load_summary(self.namespace, self.session_id)
+
+    def save_summary(self, summary: str, summarized: int, expected: int) -> bool:
+        return self.store.save_summary(self.namespace, self.session_id, summary, summarized, expected)
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_chat_store() -> ChatStore:
+    """
+    프로세스에 하나뿐인 대화 기록 DB
+    """
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = ChatStore()
+        return _store
@@ -0,0 +1,36 @@
+# -*- coding: utf-8 -*-
+"""
+서비스하는 PDF 코퍼스 목록
+- 인덱스 빌드 CLI와 RAG 서비스가 같은 목록을 씀 (무거운 라이브러리 import 없음)
+"""
+
+from dataclasses import dataclass
+
+
+@dataclass(frozen=True)
+class Corpus:
+    name: str
+    title: str
+    pdf_path: str
+    collection: str
+    greeting: str
+
+
+CORPORA = {
+    "library": Corpus(
+        name="library",
+        title="국립부경대 도서관 규정",
+        pdf_path="[챗봇프로그램및실습] 부경대학교 규정집.pdf",
+        collection="library_regulations",
+        greeting="국립부경대 도서관 규정에 대해 무엇이든 물어보세요!!!!!",
+    ),
+    "highschool": Corpus(
+        name="highschool",
+        title="우리 고등학교 학생 안내서",
+        pdf_path="my_highschool_handbook.pdf",
+        collection="highschool_handbook",
+        greeting="학교 생활 안내서에 대해 무엇이든 물어보세요!",
+    ),
+}
+
+DEFAULT_CORPUS = "library"
@@ -0,0 +1,142 @@
+# -*- coding: utf-8 -*-
+"""
+복원력 계층(llm_resilience.py) 시험용 로컬 가짜 Gemini REST 서버
+- generateContent / streamGenerateContent 만 흉내냄 (응답은 질문을 되돌려주는 짧은 문장)
+- 지연, 느린 꼬리 응답, 429(쿼터 초과) 비율, 항상 실패하는 모델을 옵션으로 조절
+- 처음 N개 요청이나 특정 모델을 항상 느리게 해서 시도별 타임아웃/헤징/폴백을 재현 (tests/test_llm_resilience.py)
+
+사용 예)
+    python fake_gemini_server.py --port 8765 --error-rate 0.3 --slow-rate 0.1 --fail-model gemini-2.5-pro
+    GEMINI_API_ENDPOINT=http://127.0.0.1:8765 GOOGLE_API_KEY=fake streamlit run main.py
+"""
+
+import argparse
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+_PATH = re.compile(r"/models/(?P<model>[^:/]+):(?P<method>generateContent|streamGenerateContent)")
+
+
+class FakeGeminiState:
+    def __init__(self, latency: float, slow_rate: float, slow_latency: float, error_rate: float, fail_models,
+                 slow_first: int = 0, slow_models=()):
+        self.latency = latency
+        self.slow_rate = slow_rate
+        self.slow_latency = slow_latency
+        self.error_rate = error_rate
+        self.fail_models = set(fail_models)
+        self.slow_first = slow_first
+        self.slow_models = set(slow_models)
+        self.requests = 0
+        self.errors = 0
+        self.lock = threading.Lock()
+
+
+def _last_user_text(body: dict) -> str:
+    for content in reversed(body.get("contents", [])):
+        for part in content.get("parts", []):
+            if part.get("text"):
+                return part["text"]
+    return ""
+
+
+def _candidate(text: str, finish: bool) -> dict:
+    candidate = {"content": {"parts": [{"text": text}], "role": "model"}, "index": 0}
+    if finish:
+        candidate["finishReason"] = "STOP"
+    return {"candidates": [candidate], "usageMetadata": {"promptTokenCount": 1, "candidatesTokenCount": 1}}
+
+
+def make_handler(state: FakeGeminiState):
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, format, *args):
+            pass
+
+        def _send_json(self, status: int, payload) -> None:
+            data = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json; charset=UTF-8")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_POST(self):
+            match = _PATH.search(self.path)
+            if match is None:
+                self._send_json(404, {"error": {"code": 404, "message": "not found", "status": "NOT_FOUND"}})
+                return
+            length = int(self.headers.get("Content-Length", 0))
+            body = json.loads(self.rfile.read(length) or b"{}")
+            model = match.group("model")
+
+            with state.lock:
+                state.requests += 1
+                fail = model in state.fail_models or random.random() < state.error_rate
+                if fail:
+                    state.errors += 1
+                slow = state.requests <= state.slow_first or model in state.slow_models \
+                    or random.random() < state.slow_rate
+            time.sleep(state.slow_latency if slow else random.uniform(0.5, 1.5) * state.latency)
+            if fail:
+                self._send_json(429, {"error": {"code": 429, "message": "Resource has been exhausted (e.g. check quota).",
+                                                "status": "RESOURCE_EXHAUSTED"}})
+                return
+
+            answer = f"[{model}] {_last_user_text(body)[:200]}"
+            if match.group("method") == "generateContent":
+                self._send_json(200, _candidate(answer, finish=True))
+                return
+
+            # streamGenerateContent: alt=sse 이면 SSE, 아니면 JSON 배열을 조각내서 전송
+            pieces = [answer[i:i + 16] for i in range(0, len(answer), 16)] or [""]
+            sse = "alt=sse" in self.path
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream" if sse else "application/json; charset=UTF-8")
+            self.end_headers()
+            if not sse:
+                self.wfile.write(b"[")
+            for i, piece in enumerate(pieces):
+                data = json.dumps(_candidate(piece, finish=i == len(pieces) - 1), ensure_ascii=False)
+                if sse:
+                    self.wfile.write(f"data: {data}\r\n\r\n".encode("utf-8"))
+                else:
+                    self.wfile.write(((",\r\n" if i else "") + data).encode("utf-8"))
+                self.wfile.flush()
+                time.sleep(0.02)
+            if not sse:
+                self.wfile.write(b"]")
+
+    return Handler
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description="로컬 가짜 Gemini REST 서버")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.3, help="평균 응답 지연(초)")
+    parser.add_argument("--slow-rate", type=float, default=0.0, help="느린 꼬리 응답 비율")
+    parser.add_argument("--slow-latency", type=float, default=10.0, help="느린 응답의 지연(초)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="429를 돌려줄 비율")
+    parser.add_argument("--fail-model", action="append", default=[], help="항상 429를 돌려줄 모델")
+    parser.add_argument("--slow-first", type=int, default=0, help="처음 N개 요청은 느린 응답")
+    parser.add_argument("--slow-model", action="append", default=[], help="항상 느리게 응답할 모델")
+    args = parser.parse_args(argv)
+
+    state = FakeGeminiState(args.latency, args.slow_rate, args.slow_latency, args.error_rate, args.fail_model,
+                            args.slow_first, args.slow_model)
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(state))
+    print(f"fake gemini on http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        print(f"requests={state.requests} errors={state.errors}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+# -*- coding: utf-8 -*-
+"""
+무거운 라이브러리는 처음 쓸 때 import
+- lazy_import("langchain_chroma")는 빈 모듈 객체를 바로 돌려주고, 속성에 처음 접근할 때 실제로 import
+  → 앱은 제목/선택 상자 같은 화면 뼈대를 먼저 그리고, 무거운 import는 실제로 필요한 곳에서 한 번만
+- setup: 실제 import 직전에 한 번 실행할 함수 (예: chromadb보다 먼저 sqlite3를 pysqlite3로 바꾸기)
+- 실제로 import하는 데 걸린 시간은 import_times()로 확인 (재실행 프로파일 패널에도 표시)
+
+시작 시간 벤치마크 (모듈마다 새 인터프리터에서 python -X importtime 으로 측정)
+    python lazy_imports.py
+    python lazy_imports.py streamlit langchain_chroma --repeat 3
+"""
+
+import argparse
+import importlib
+import os
+import subprocess
+import sys
+import threading
+import time
+import types
+
+import rerun_profiler
+
+# 앱 시작 때 import 되던 무거운 라이브러리 + 이 저장소의 앱 공용 모듈
+DEFAULT_BENCHMARK_MODULES = (
+    "streamlit",
+    "langchain_core.messages",
+    "langchain_google_genai",
+    "google.generativeai",
+    "langchain.chains",
+    "langchain_chroma",
+    "sentence_transformers",
+    "pypdf",
+    "numpy",
+    "chat_store",
+    "llm_gateway",
+    "rag_service",
+)
+
+_times = {}
+_lock = threading.RLock()
+
+
+class LazyModule(types.ModuleType):
+    def __init__(self, name: str, setup=None):
+        super().__init__(name)
+        self.__dict__["_lazy_setup"] = setup
+        self.__dict__["_lazy_module"] = None
+
+    def _load(self):
+        if self.__dict__["_lazy_module"] is None:
+            with _lock:
+                if self.__dict__["_lazy_module"] is None:
+                    started = time.perf_counter()
+                    setup = self.__dict__["_lazy_setup"]
+                    if setup is not None:
+                        setup()
+                    module = importlib.import_module(self.__name__)
+                    _times[self.__name__] = time.perf_counter() - started
+                    self.__dict__["_lazy_module"] = module
+        return self.__dict__["_lazy_module"]
+
+    def __getattr__(self, name):
+        return getattr(self._load(), name)
+
+    def __dir__(self):
+        return dir(self._load())
+
+
+def lazy_import(name: str, setup=None) -> LazyModule:
+    """
+    name 모듈을 속성에 처음 접근할 때 import하는 모듈 객체를 돌려줍니다.
+    """
+    return LazyModule(name, setup)
+
+
+def import_times() -> dict:
+    """
+    지금까지 실제로 import한 지연 모듈 -> 걸린 시간(ms)
+    """
+    with _lock:
+        return {name: round(seconds * 1000, 1) for name, seconds in _times.items()}
+
+
+rerun_profiler.add_stats("지연 import (ms)", import_times)
+
+
+def measure_import(module: str, python: str = sys.executable):
+    """
+    새 인터프리터에서 module을 import하는 데 걸린 누적 시간(ms). import에 실패하면 None.
+    """
+    result = subprocess.run([python, "-X", "importtime", "-c", f"import {module}"],
+                            capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__)))
+    if result.returncode != 0:
+        return None
+    # 형식: "import time:  self [us] | cumulative | imported package"
+    for line in reversed(result.stderr.splitlines()):
+        fields = line.split("|")
+        if len(fields) == 3 and fields[2].strip() == module:
+            return int(fields[1]) / 1000
+    return None
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description="모듈별 import 시간(시작 시간) 측정")
+    parser.add_argument("modules", nargs="*", default=list(DEFAULT_BENCHMARK_MODULES))
+    parser.add_argument("--repeat", type=int, default=1, help="모듈마다 반복 횟수 (가장 빠른 값 사용)")
+    args = parser.parse_args(argv)
+
+    results = []
+    for module in args.modules:
+        samples = [measure_import(module) for _ in range(args.repeat)]
+        samples = [sample for sample in samples if sample is not None]
+        results.append((module, min(samples) if samples else None))
+
+    width = max(len(module) for module, _ in results)
+    for module, ms in sorted(results, key=lambda item: -(item[1] or 0)):
+        print(f"{module:<{width}}  {'import 실패' if ms is None else f'{ms:9.1f} ms'}")
+
+
+if __name__ == "__main__":
+    main()
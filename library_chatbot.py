@@ -1,27 +1,29 @@
+import logging
 import os
+import time
 import streamlit as st
-import nest_asyncio
 
-# Streamlit에서 비동기 작업을 위한 이벤트 루프 설정
-nest_asyncio.apply()
-
-from langchain_community.document_loaders import PyPDFLoader
-from langchain_text_splitters import RecursiveCharacterTextSplitter
-from langchain_google_genai import ChatGoogleGenerativeAI
-from langchain_huggingface import HuggingFaceEmbeddings
-from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
 from langchain_core.runnables.history import RunnableWithMessageHistory
-from langchain_core.output_parsers import StrOutputParser
-from langchain.chains import create_retrieval_chain
-from langchain.chains.combine_documents import create_stuff_documents_chain
-from langchain.chains.history_aware_retriever import create_history_aware_retriever
-from langchain_community.chat_message_histories.streamlit import StreamlitChatMessageHistory
 
+from corpora import CORPORA, DEFAULT_CORPUS
+from rag_embeddings import EmbeddingCache, EmbeddingEngine, registry
+from chat_store import SQLiteChatMessageHistory, get_chat_store
+from chat_session import chat_session_id
+from chat_memory import WindowedChatHistory, make_summarizer, summary_state
+from llm_gateway import get_gateway
+from llm_resilience import ResilientLLM
+from rag_index import INDEX_ROOT, current_version
+from rag_service import RagService
+from streaming import StreamTimer, text_stream
+from transcript import Transcript
+import rerun_profiler
+
+# 재실행 비용 측정 (RERUN_PROFILE=1 또는 ?profile=1 일 때만)
+profile = rerun_profiler.start("library", st.query_params, st.session_state)
 
-__import__('pysqlite3')
-import sys
-sys.modules['sqlite3'] = sys.modules.pop('pysqlite3')
-from langchain_chroma import Chroma
+# 요청별 컨텍스트 압축(절약 토큰) 같은 INFO 로그가 서버 콘솔에 보이도록 (이미 설정돼 있으면 그대로)
+logging.basicConfig(level=os.environ.get("LOG_LEVEL", "INFO"),
+                    format="%(asctime)s %(levelname)s %(name)s: %(message)s")
 
 
 #Gemini API 키 설정
@@ -31,159 +33,168 @@ except Exception as e:
     st.error("⚠️ GOOGLE_API_KEY를 Streamlit Secrets에 설정해주세요!")
     st.stop()
 
-#cache_resource로 한번 실행한 결과 캐싱해두기
-@st.cache_resource
-def load_and_split_pdf(file_path):
-    loader = PyPDFLoader(file_path)
-    return loader.load_and_split()
+EMBEDDING_MODEL = "jhgan/ko-sroberta-multitask"
+EMBED_BATCH_SIZE = int(os.environ.get("EMBED_BATCH_SIZE", 32))
+EMBED_WORKERS = int(os.environ.get("EMBED_WORKERS", 1))
+EMBED_CACHE_PATH = os.environ.get("EMBED_CACHE_PATH", "./embedding_cache.sqlite")
+CONTEXT_TOKEN_BUDGET = int(os.environ.get("CONTEXT_TOKEN_BUDGET", 1500))
+# 선택 모델이 쿼터 초과/장애일 때는 첫 번째(가장 빠른) 모델로 폴백
+MODEL_OPTIONS = ("gemini-2.5-flash", "gemini-2.5-pro", "gemini-2.0-flash-exp")
 
-#텍스트 청크들을 Chroma 안에 임베딩 벡터로 저장
-@st.cache_resource
-def create_vector_store(_docs):
-    text_splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=200)
-    split_docs = text_splitter.split_documents(_docs)
-    st.info(f"📄 {len(split_docs)}개의 텍스트 청크로 분할했습니다.")
-
-    persist_directory = "./chroma_db"
-    st.info("🤖 임베딩 모델 로드 중... (첫 실행 시 모델 다운로드)")
-    embeddings = HuggingFaceEmbeddings(
-        model_name="jhgan/ko-sroberta-multitask",
-        model_kwargs={'device': 'cpu'},
-        encode_kwargs={'normalize_embeddings': True}
-    )
-
-    st.info("🔢 벡터 임베딩 생성 및 저장 중...")
-    vectorstore = Chroma.from_documents(
-        split_docs,
-        embeddings,
-        persist_directory=persist_directory
-    )
-    st.success("💾 벡터 데이터베이스 생성 완료!")
-    return vectorstore
+# 임베딩 모델은 UI가 그려지는 동안 백그라운드에서 미리 로드 (프로세스당 한 번)
+registry.warmup(EMBEDDING_MODEL)
 
-#만약 기존에 저장해둔 ChromaDB가 있는 경우, 이를 로드
+# 모든 코퍼스가 임베딩 모델 하나와 모델별 LLM 클라이언트를 공유하는 RAG 서비스 (프로세스당 하나)
 @st.cache_resource
-def get_vectorstore(_docs):
-    persist_directory = "./chroma_db"
-    embeddings = HuggingFaceEmbeddings(
-        model_name="jhgan/ko-sroberta-multitask",
-        model_kwargs={'device': 'cpu'},
-        encode_kwargs={'normalize_embeddings': True}
-    )
-    if os.path.exists(persist_directory):
-        return Chroma(
-            persist_directory=persist_directory,
-            embedding_function=embeddings
-        )
-    else:
-        return create_vector_store(_docs)
-    
-# PDF 문서 로드-벡터 DB 저장-검색기-히스토리 모두 합친 Chain 구축
-@st.cache_resource
-def initialize_components(selected_model):
-    file_path = "[챗봇프로그램및실습] 부경대학교 규정집.pdf"
-    pages = load_and_split_pdf(file_path)
-    vectorstore = get_vectorstore(pages)
-    retriever = vectorstore.as_retriever()
-
-    # 채팅 히스토리 요약 시스템 프롬프트
-    contextualize_q_system_prompt = """Given a chat history and the latest user question \
-    which might reference context in the chat history, formulate a standalone question \
-    which can be understood without the chat history. Do NOT answer the question, \
-    just reformulate it if needed and otherwise return it as is."""
-    contextualize_q_prompt = ChatPromptTemplate.from_messages(
-        [
-            ("system", contextualize_q_system_prompt),
-            MessagesPlaceholder("history"),
-            ("human", "{input}"),
-        ]
+def get_rag_service():
+    engine = EmbeddingEngine(
+        EMBEDDING_MODEL,
+        batch_size=EMBED_BATCH_SIZE,
+        workers=EMBED_WORKERS,
+        cache=EmbeddingCache(EMBED_CACHE_PATH),
     )
+    return RagService(engine, get_gateway(), CORPORA, model_options=MODEL_OPTIONS,
+                      context_token_budget=CONTEXT_TOKEN_BUDGET)
 
-    # 질문-답변 시스템 프롬프트
-    qa_system_prompt = """You are an assistant for question-answering tasks. \
-    Use the following pieces of retrieved context to answer the question. \
-    If you don't know the answer, just say that you don't know. \
-    Keep the answer perfect. please use imogi with the answer.
-    대답은 한국어로 하고, 존댓말을 써줘.\
-
-    {context}"""
-    qa_prompt = ChatPromptTemplate.from_messages(
-        [
-            ("system", qa_system_prompt),
-            MessagesPlaceholder("history"),
-            ("human", "{input}"),
-        ]
+# 창 밖으로 밀려난 예전 대화를 요약하는 LLM (가장 빠른 모델, 모든 세션 공유)
+@st.cache_resource
+def get_summarizer():
+    return make_summarizer(ResilientLLM(MODEL_OPTIONS[:1], temperature=0.2))
+
+# 코퍼스 벡터 DB 열기 - 프로세스에서 처음 열릴 때만 아티팩트와 맞추고 결과를 안내
+def open_corpus(service, corpus):
+    status = st.empty()
+
+    def on_sync(version, result):
+        if result.changed:
+            st.info(f"📄 {corpus.title} 인덱스 {version}: 청크 {result.added}개 추가, {result.deleted}개 삭제 (재사용 {result.unchanged}개)")
+            st.success("💾 벡터 데이터베이스 갱신 완료!")
+
+    service.vectorstore(
+        corpus.name,
+        progress=lambda stats: status.info(f"🔢 페이지 {stats.pages}개 처리, 청크 {stats.chunks}개 임베딩 중..."),
+        on_sync=on_sync,
     )
-
-    try:
-        llm = ChatGoogleGenerativeAI(
-            model=selected_model,
-            temperature=0.7,
-            convert_system_message_to_human=True
-        )
-    except Exception as e:
-        st.error(f"❌ Gemini 모델 '{selected_model}' 로드 실패: {str(e)}")
-        st.info("💡 'gemini-pro' 모델을 사용해보세요.")
-        raise
-    history_aware_retriever = create_history_aware_retriever(llm, retriever, contextualize_q_prompt)
-    question_answer_chain = create_stuff_documents_chain(llm, qa_prompt)
-    rag_chain = create_retrieval_chain(history_aware_retriever, question_answer_chain)
-    return rag_chain
+    status.empty()
 
 # Streamlit UI
-st.header("국립부경대 도서관 규정 Q&A 챗봇 💬 📚")
+st.header("부경대 도서관 규정 · 고등학교 안내서 Q&A 챗봇 💬 📚")
 
-# 첫 실행 안내 메시지
-if not os.path.exists("./chroma_db"):
-    st.info("🔄 첫 실행입니다. 임베딩 모델 다운로드 및 PDF 처리 중... (약 5-7분 소요)")
-    st.info("💡 이후 실행에서는 10-15초만 걸립니다!")
+# 질문할 문서 선택 - 같은 프로세스의 같은 임베딩 모델로 코퍼스마다 다른 컬렉션을 검색
+corpus_name = st.selectbox("Select Document",
+    list(CORPORA),
+    index=list(CORPORA).index(DEFAULT_CORPUS),
+    format_func=lambda name: CORPORA[name].title,
+)
+corpus = CORPORA[corpus_name]
+
+# 미리 빌드된 인덱스가 없을 때만 안내 메시지
+if current_version(corpus.name, INDEX_ROOT) is None:
+    st.info("🔄 미리 만든 인덱스가 없어 PDF 처리 및 임베딩을 지금 진행합니다... (약 5-7분 소요)")
+    st.info("💡 배포 전에 `python build_index.py --all` 을 실행해두면 몇 초 안에 시작합니다!")
 
 # Gemini 모델 선택 - 최신 2.x 모델 사용
 option = st.selectbox("Select Gemini Model",
-    ("gemini-2.5-flash", "gemini-2.5-pro", "gemini-2.0-flash-exp"),
+    MODEL_OPTIONS,
     index=0,
     help="Gemini 2.5 Flash가 가장 빠르고 효율적입니다"
 )
 
+profile.lap("setup")
+
 try:
     with st.spinner("🔧 챗봇 초기화 중... 잠시만 기다려주세요"):
-        rag_chain = initialize_components(option)
+        service = get_rag_service()
+        open_corpus(service, corpus)
+        rag_chain = service.chain(corpus.name, option)
+        answer_cache = service.answer_cache(corpus.name, option)
     st.success("✅ 챗봇이 준비되었습니다!")
+    model_stats = registry.stats()
+    if EMBEDDING_MODEL in model_stats["load_seconds"]:
+        st.caption(f"🤖 임베딩 모델 로딩 {model_stats['load_seconds'][EMBEDDING_MODEL]}초 · 메모리 {model_stats['rss_mb']} MB")
 except Exception as e:
     st.error(f"⚠️ 초기화 중 오류 발생: {str(e)}")
     st.info("PDF 파일 경로와 API 키를 확인해주세요.")
     st.stop()
+profile.lap("rag_init")
 
-chat_history = StreamlitChatMessageHistory(key="chat_messages")
+# 코퍼스마다 대화 기록을 따로, SQLite 대화 저장소에 보관 (chat_sid 쿠키로 세션 구분)
+session_id = chat_session_id(st.query_params, st.session_state)
+chat_history = SQLiteChatMessageHistory(get_chat_store(), f"library:{corpus.name}", session_id)
+# 질문 재작성/답변 프롬프트에는 토큰 예산 안의 최근 대화 + 예전 대화 요약만
+memory = WindowedChatHistory(chat_history, summary_state(st.session_state, f"chat_summary_{corpus.name}_{session_id}"), get_summarizer())
 
 conversational_rag_chain = RunnableWithMessageHistory(
     rag_chain,
-    lambda session_id: chat_history,
+    lambda session_id: memory,
     input_messages_key="input",
     history_messages_key="history",
     output_messages_key="answer",
 )
+profile.lap("history")
 
 
 if "messages" not in st.session_state:
     st.session_state["messages"] = [{"role": "assistant", 
-                                     "content": "국립부경대 도서관 규정에 대해 무엇이든 물어보세요!!!!!"}]
+                                     "content": corpus.greeting}]
 
-for msg in chat_history.messages:
-    st.chat_message(msg.type).write(msg.content)
+# 최근 메시지만 그리고, 그 앞은 "이전 대화 더 보기" 뒤에
+Transcript(chat_history, st.session_state, f"transcript_{corpus.name}_{session_id}").render()
+profile.lap("render_history")
 
 
 if prompt_message := st.chat_input("Your question"):
     st.chat_message("human").write(prompt_message)
     with st.chat_message("ai"):
         with st.spinner("Thinking..."):
-            config = {"configurable": {"session_id": "any"}}
-            response = conversational_rag_chain.invoke(
-                {"input": prompt_message},
-                config)
-            
-            answer = response['answer']
-            st.write(answer)
-            with st.expander("참고 문서 확인"):
-                for doc in response['context']:
-                    st.markdown(doc.metadata['source'], help=doc.page_content)
+            # 이전 대화가 없는 독립 질문만 캐시 대상 (후속 질문은 앞 대화에 따라 뜻이 달라짐)
+            is_first_question = chat_history.count() == 0
+            cached = answer_cache.lookup(prompt_message, service.context_is_current(corpus.name)) if is_first_question else None
+            if is_first_question:
+                profile.count("answer_cache.hit" if cached else "answer_cache.miss")
+            answer_slot = st.container()
+            sources_slot = st.empty()
+
+            def show_sources(context):
+                with sources_slot.container():
+                    with st.expander("참고 문서 확인"):
+                        for doc in context:
+                            st.markdown(doc.metadata['source'], help=doc.page_content)
+
+            if cached:
+                chat_history.add_user_message(prompt_message)
+                chat_history.add_ai_message(cached.answer)
+                answer_slot.write(cached.answer)
+                show_sources(cached.context)
+            else:
+                config = {"configurable": {"session_id": session_id}}
+                timer = StreamTimer("rag")
+                streamed = {}
+
+                # 검색이 끝나 context가 도착하면 답변 토큰보다 먼저 참고 문서를 채움
+                def on_extra(name, value):
+                    if name == "context":
+                        streamed["context"] = value
+                        # 검색(질문 재작성 포함)이 끝나 context가 도착하기까지 걸린 시간
+                        profile.record("retriever", time.perf_counter() - timer.started)
+                        show_sources(value)
+
+                with answer_slot, profile.section("llm"):
+                    answer = st.write_stream(text_stream(
+                        get_gateway().stream(conversational_rag_chain, {"input": prompt_message}, config),
+                        timer, key="answer", on_extra=on_extra,
+                    ))
+                profile.record("llm_ttft", timer.ttft)
+                st.caption(timer.caption())
+                if is_first_question and "context" in streamed:
+                    answer_cache.store(prompt_message, answer, streamed["context"])
+    # 답변을 다 보여준 뒤, 창이 차오르면 예전 대화 요약은 워커 스레드에서 (다음 요청은 기다리지 않음)
+    memory.compact_in_background()
+    rewrite_stats = service.rewrite_stats
+    pack_stats = service.pack_stats
+    st.caption(f"⚡ 답변 캐시 적중률 {answer_cache.hit_rate:.0%} ({answer_cache.hits}/{answer_cache.hits + answer_cache.misses})"
+               f" · 질문 재작성 생략 {rewrite_stats.skip_rate:.0%} ({rewrite_stats.skipped}/{rewrite_stats.skipped + rewrite_stats.rewritten})"
+               f" · 컨텍스트 절약 평균 {pack_stats.avg_saved:.0f}토큰")
+
+profile.finish()
+profile.panel()
@@ -0,0 +1,206 @@
+# -*- coding: utf-8 -*-
+"""
+프로세스 공용 비동기 Gemini 게이트웨이
+- 백그라운드 스레드 하나에서 asyncio 이벤트 루프를 계속 돌림 (nest_asyncio 불필요)
+- 모델마다 ChatGoogleGenerativeAI 하나를 만들어 모든 세션이 공유 (temperature는 호출마다 지정)
+  → 클라이언트가 가진 gRPC/HTTP 연결을 요청마다 새로 맺지 않고 재사용
+- 동시에 나가는 LLM 호출 수는 세마포어로 제한
+- Streamlit 스크립트 스레드에서는 submit()(Future 반환)/invoke()/stream()으로 호출
+- langchain_google_genai(google.generativeai, gRPC)는 첫 클라이언트를 만들 때 import (앱 화면을 먼저 그림)
+  → import는 client()를 부른 스크립트 스레드에서, 루프 스레드에서는 이미 만든 클라이언트만 꺼내 씀
+"""
+
+import asyncio
+import concurrent.futures
+import logging
+import os
+import queue
+import threading
+
+import rerun_profiler
+from lazy_imports import lazy_import
+
+langchain_google_genai = lazy_import("langchain_google_genai")
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_CONCURRENCY = int(os.environ.get("LLM_MAX_CONCURRENCY", 16))
+# 로컬 가짜 서버 등 다른 엔드포인트로 보낼 때 (예: http://127.0.0.1:8765, fake_gemini_server.py)
+API_ENDPOINT = os.environ.get("GEMINI_API_ENDPOINT")
+
+_DONE = object()
+_rest_chat_model = None
+
+
+def _chat_model_class():
+    """
+    GEMINI_API_ENDPOINT(REST 전송)일 때는 비동기 클라이언트가 동작하지 않으므로(응답을 await 할 수 없음)
+    ainvoke/astream을 LangChain 기본 구현(동기 호출을 스레드에서 실행)으로 바꾼 클래스를 씁니다.
+    """
+    global _rest_chat_model
+    if not API_ENDPOINT:
+        return langchain_google_genai.ChatGoogleGenerativeAI
+    if _rest_chat_model is None:
+        from langchain_core.language_models.chat_models import BaseChatModel
+
+        class RestChatGoogleGenerativeAI(langchain_google_genai.ChatGoogleGenerativeAI):
+            _agenerate = BaseChatModel._agenerate
+            _astream = BaseChatModel._astream
+
+        _rest_chat_model = RestChatGoogleGenerativeAI
+    return _rest_chat_model
+
+
+class LLMGateway:
+    def __init__(self, max_concurrency: int = DEFAULT_MAX_CONCURRENCY):
+        self.max_concurrency = max_concurrency
+        self.in_flight = 0
+        self.completed = 0
+        self.failed = 0
+        self._clients = {}
+        self._lock = threading.Lock()
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._run, name="llm-gateway", daemon=True)
+        self._thread.start()
+        self._semaphore = self._call_soon(lambda: asyncio.Semaphore(max_concurrency))
+
+    def _run(self) -> None:
+        asyncio.set_event_loop(self._loop)
+        self._loop.run_forever()
+
+    def _call_soon(self, func):
+        # 이벤트 루프 스레드에서 func()를 실행하고 결과를 기다림
+        async def call():
+            return func()
+        return asyncio.run_coroutine_threadsafe(call(), self._loop).result()
+
+    def client(self, model: str, temperature: float = 0.7, **kwargs):
+        """
+        (모델, temperature, kwargs) 조합의 공용 클라이언트를 돌려줍니다.
+        무거운 import는 호출한 스레드에서 하고, 생성만 비동기 클라이언트가 게이트웨이 루프에 묶이도록 루프에서 합니다.
+        루프 스레드 안에서는 만들 수 없으므로 (import/생성 동안 모든 호출이 멈춤) 미리 만들어 둬야 합니다.
+        """
+        if API_ENDPOINT:
+            kwargs.setdefault("client_options", {"api_endpoint": API_ENDPOINT})
+            kwargs.setdefault("transport", "rest")
+        key = (model, temperature, repr(sorted(kwargs.items())))
+        with self._lock:
+            client = self._clients.get(key)
+        if client is not None:
+            return client
+        if threading.current_thread() is self._thread:
+            raise RuntimeError(f"LLM client for {model} must be created outside the gateway loop")
+
+        chat_model = _chat_model_class()
+
+        def build():
+            return chat_model(
+                model=model,
+                temperature=temperature,
+                convert_system_message_to_human=True,
+                **kwargs,
+            )
+
+        # 잠금을 쥔 채 루프를 기다리지 않음 (루프 쪽 호출이 잠금에서 막히지 않게)
+        client = self._call_soon(build)
+        with self._lock:
+            return self._clients.setdefault(key, client)
+
+    async def _ainvoke(self, runnable, inputs, config):
+        async with self._semaphore:
+            self.in_flight += 1
+            try:
+                result = await runnable.ainvoke(inputs, config)
+                self.completed += 1
+                return result
+            except Exception:
+                self.failed += 1
+                raise
+            finally:
+                self.in_flight -= 1
+
+    def submit(self, runnable, inputs, config=None):
+        """
+        runnable.ainvoke(inputs)를 게이트웨이 루프에 올리고 바로 concurrent.futures.Future를 돌려줍니다.
+        """
+        return asyncio.run_coroutine_threadsafe(self._ainvoke(runnable, inputs, config), self._loop)
+
+    def invoke(self, runnable, inputs, config=None, timeout: float = None):
+        return self.submit(runnable, inputs, config).result(timeout)
+
+    def map_as_completed(self, runnable, inputs_list, config=None, max_parallel: int = 4):
+        """
+        inputs_list 각각을 runnable로 처리합니다. 이 호출에서 동시에 나가는 요청은 max_parallel개까지이고,
+        끝나는 순서대로 (번호, 결과, 예외)를 내보냅니다. 한 항목이 실패해도 나머지는 계속 처리합니다.
+        """
+        inputs_list = list(inputs_list)
+        futures = {}
+        next_index = 0
+        while next_index < len(inputs_list) or futures:
+            while next_index < len(inputs_list) and len(futures) < max_parallel:
+                futures[self.submit(runnable, inputs_list[next_index], config)] = next_index
+                next_index += 1
+            done, _ = concurrent.futures.wait(futures, return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                index = futures.pop(future)
+                error = future.exception()
+                yield index, (None if error else future.result()), error
+
+    async def _astream_into(self, runnable, inputs, config, out: queue.Queue):
+        async with self._semaphore:
+            self.in_flight += 1
+            try:
+                async for chunk in runnable.astream(inputs, config):
+                    out.put(chunk)
+                self.completed += 1
+            except Exception as e:
+                self.failed += 1
+                out.put(e)
+            finally:
+                self.in_flight -= 1
+                out.put(_DONE)
+
+    def stream(self, runnable, inputs, config=None):
+        """
+        runnable.astream(inputs)의 조각을 호출한 스레드에서 순서대로 꺼내는 동기 제너레이터.
+        소비를 중간에 멈추면 루프 쪽 스트림도 취소합니다.
+        """
+        out = queue.Queue()
+        future = asyncio.run_coroutine_threadsafe(self._astream_into(runnable, inputs, config, out), self._loop)
+        try:
+            while True:
+                chunk = out.get()
+                if chunk is _DONE:
+                    break
+                if isinstance(chunk, Exception):
+                    raise chunk
+                yield chunk
+        finally:
+            if not future.done():
+                future.cancel()
+
+    def stats(self) -> dict:
+        return {
+            "in_flight": self.in_flight,
+            "completed": self.completed,
+            "failed": self.failed,
+            "max_concurrency": self.max_concurrency,
+            "clients": len(self._clients),
+        }
+
+
+_gateway = None
+_gateway_lock = threading.Lock()
+
+
+def get_gateway() -> LLMGateway:
+    """
+    프로세스에 하나뿐인 게이트웨이 (모든 앱/세션이 공유)
+    """
+    global _gateway
+    with _gateway_lock:
+        if _gateway is None:
+            _gateway = LLMGateway()
+            rerun_profiler.add_stats("LLM 게이트웨이", _gateway.stats)
+            logger.info("LLM gateway started (max_concurrency=%d)", _gateway.max_concurrency)
+        return _gateway
@@ -0,0 +1,316 @@
+# -*- coding: utf-8 -*-
+"""
+ChatGoogleGenerativeAI 앞단의 복원력 계층
+- 모델별 토큰 버킷으로 클라이언트 쪽 호출 속도 제한 (쿼터를 다 쓰기 전에 스스로 늦춤)
+- 429/503/타임아웃은 지수 백오프(+지터)로 재시도
+- 응답(스트리밍이면 첫 조각)이 그 모델·호출 종류(invoke/stream)의 p95 지연을 넘기면 같은 요청을 한 번 더 보내고
+  먼저 온 쪽 사용 (진 쪽은 취소하고 스트림도 닫음)
+- 시도마다 attempt_timeout(LLM_ATTEMPT_TIMEOUT, 기본 60초, 스트리밍은 첫 조각까지)을 넘기면 타임아웃으로 재시도
+- 재시도를 다 써도 안 되면 selectbox에 있는 다음 모델(기본: 첫 번째 = 가장 빠른 모델)로 폴백
+- temperature는 호출마다 generation_config로 넘기므로 클라이언트는 모델마다 하나만 씀
+  (config={"configurable": {"temperature": ...}}로 호출별로 바꿀 수 있음)
+- 로컬 가짜 서버(fake_gemini_server.py)에 붙여서 시험 가능 (GEMINI_API_ENDPOINT)
+"""
+
+import asyncio
+import logging
+import os
+import random
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass
+
+from langchain_core.runnables import Runnable
+
+import rerun_profiler
+from llm_gateway import get_gateway
+
+logger = logging.getLogger(__name__)
+
+RATE_PER_MINUTE = float(os.environ.get("LLM_RATE_PER_MINUTE", 60))
+RATE_BURST = int(os.environ.get("LLM_RATE_BURST", 10))
+ATTEMPT_TIMEOUT = float(os.environ.get("LLM_ATTEMPT_TIMEOUT", 60))
+LATENCY_WINDOW = 200
+MIN_LATENCY_SAMPLES = 20
+
+# 쿼터 초과/일시 장애로 보고 재시도할 오류
+_RETRYABLE_NAMES = {
+    "ResourceExhausted", "TooManyRequests", "ServiceUnavailable",
+    "DeadlineExceeded", "GatewayTimeout", "InternalServerError", "TimeoutError",
+}
+_RETRYABLE_MARKERS = ("429", "RESOURCE_EXHAUSTED", "quota", "503", "UNAVAILABLE", "DEADLINE_EXCEEDED")
+
+
+def is_retryable(error: BaseException) -> bool:
+    if isinstance(error, asyncio.TimeoutError):
+        return True
+    if any(cls.__name__ in _RETRYABLE_NAMES for cls in type(error).__mro__):
+        return True
+    message = str(error)
+    return any(marker in message for marker in _RETRYABLE_MARKERS)
+
+
+def fallback_models(selected: str, options) -> list:
+    """
+    선택한 모델 → selectbox의 첫 번째 모델 순서로 시도할 모델 목록을 만듭니다.
+    """
+    models = [selected]
+    if options and options[0] != selected:
+        models.append(options[0])
+    return models
+
+
+@dataclass
+class RetryPolicy:
+    max_attempts: int = 3
+    base_delay: float = 0.5
+    max_delay: float = 8.0
+    hedge: bool = True
+    min_hedge_delay: float = 1.0
+    attempt_timeout: float = ATTEMPT_TIMEOUT
+
+    def backoff(self, attempt: int) -> float:
+        delay = min(self.max_delay, self.base_delay * (2 ** attempt))
+        return delay * random.uniform(0.5, 1.0)
+
+
+class TokenBucket:
+    """
+    초당 rate개씩 채워지고 최대 capacity개까지 쌓이는 토큰 버킷 (게이트웨이 루프 안에서만 사용)
+    """
+
+    def __init__(self, rate: float, capacity: int):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+        self.waited = 0
+
+    async def acquire(self) -> None:
+        while True:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+            self.waited += 1
+            await asyncio.sleep((1 - self.tokens) / self.rate)
+
+    def available(self) -> float:
+        # 지금 쓸 수 있는 토큰 수 (읽기만 하므로 루프 밖에서 불러도 됨)
+        return min(self.capacity, self.tokens + (time.monotonic() - self.updated) * self.rate)
+
+
+class LatencyTracker:
+    def __init__(self, window: int = LATENCY_WINDOW):
+        self.samples = deque(maxlen=window)
+
+    def record(self, seconds: float) -> None:
+        self.samples.append(seconds)
+
+    def p95(self):
+        if len(self.samples) < MIN_LATENCY_SAMPLES:
+            return None
+        ordered = sorted(self.samples)
+        return ordered[int(0.95 * (len(ordered) - 1))]
+
+
+class ResilienceStats:
+    def __init__(self):
+        self.calls = 0
+        self.retries = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+        self.fallbacks = 0
+        self.failures = 0
+
+    def as_dict(self) -> dict:
+        return dict(vars(self))
+
+
+# 모델별 버킷, (모델, 호출 종류)별 지연 기록과 통계는 모든 세션이 공유
+_buckets = {}
+_latency = {}
+_lock = threading.Lock()
+stats = ResilienceStats()
+
+
+def snapshot() -> dict:
+    """
+    프로파일 패널용: 재시도/헤징/폴백 횟수, (모델, 호출 종류)별 p95 지연, 모델별 남은 토큰
+    """
+    with _lock:
+        latency = {f"{model}/{kind}": tracker.p95() for (model, kind), tracker in _latency.items()}
+        buckets = dict(_buckets)
+    return {
+        **stats.as_dict(),
+        "p95_ms": {name: round(p95 * 1000) for name, p95 in latency.items() if p95 is not None},
+        "tokens": {model: round(bucket.available(), 1) for model, bucket in buckets.items()},
+    }
+
+
+rerun_profiler.add_stats("LLM 복원력", snapshot)
+
+
+def _bucket(model: str) -> TokenBucket:
+    with _lock:
+        if model not in _buckets:
+            _buckets[model] = TokenBucket(RATE_PER_MINUTE / 60.0, RATE_BURST)
+        return _buckets[model]
+
+
+def available_tokens(model: str) -> float:
+    """
+    모델 버킷에 남은 토큰 수 (미리 채우기 같은 급하지 않은 호출이 사용자 몫을 남겨두는 데 씀)
+    """
+    return _bucket(model).available()
+
+
+def _tracker(model: str, kind: str) -> LatencyTracker:
+    # 전체 응답(invoke)과 첫 조각(stream) 지연은 분포가 달라서 따로 기록
+    with _lock:
+        if (model, kind) not in _latency:
+            _latency[model, kind] = LatencyTracker()
+        return _latency[model, kind]
+
+
+async def _first_chunk(stream):
+    # 스트림을 첫 조각까지만 진행 (빈 스트림이면 None). 실패/취소되면 스트림을 닫음
+    try:
+        return await stream.__anext__(), stream
+    except StopAsyncIteration:
+        return None, stream
+    except BaseException:
+        await stream.aclose()
+        raise
+
+
+async def _close_stream(result) -> None:
+    _, stream = result
+    await stream.aclose()
+
+
+async def _release(tasks, discard) -> None:
+    # 헤징에서 진 호출을 취소하고, 이미 끝난 결과는 discard로 정리 (예: 열린 스트림 닫기)
+    for task in tasks:
+        task.cancel()
+    for result in await asyncio.gather(*tasks, return_exceptions=True):
+        if discard is not None and not isinstance(result, BaseException):
+            await discard(result)
+
+
+class ResilientLLM(Runnable):
+    """
+    models: 시도할 모델 순서 (fallback_models(선택, selectbox 옵션))
+    temperature: config의 configurable에 temperature가 없을 때 쓰는 기본값
+    ChatGoogleGenerativeAI 대신 체인에 그대로 끼워 쓰며, 실제 호출은 게이트웨이 루프에서 이뤄집니다.
+    클라이언트는 만들 때(스크립트 스레드) 모델마다 미리 받아둡니다: 첫 클라이언트의 langchain_google_genai
+    import가 루프에서 일어나면 그동안 모든 세션의 스트림이 멈추기 때문.
+    """
+
+    def __init__(self, models, temperature: float = 0.7, policy: RetryPolicy = None, gateway=None):
+        self.models = list(models)
+        self.temperature = temperature
+        self.policy = policy or RetryPolicy()
+        self.gateway = gateway or get_gateway()
+        self._clients = {model: self._client(model) for model in self.models}
+
+    def _client(self, model: str):
+        # 재시도는 이 계층에서 하므로 클라이언트 자체 재시도(기본 6회)는 끔
+        # (주의: langchain-google-genai 1.0.x의 채팅 호출은 max_retries를 무시하고 내부에서 최대 10번
+        #  재시도하므로, 이 버전에서는 429가 이 계층의 재시도/폴백까지 늦게 올라올 수 있음)
+        # temperature는 호출마다 넘기므로 모든 temperature가 모델별 클라이언트 하나를 같이 씀
+        return self.gateway.client(model, max_retries=1)
+
+    def _generation_config(self, config) -> dict:
+        configurable = (config or {}).get("configurable", {})
+        return {"temperature": configurable.get("temperature", self.temperature)}
+
+    async def _attempt(self, make_call):
+        # 시도 하나는 attempt_timeout 안에 끝나야 함 (넘기면 asyncio.TimeoutError → 재시도 대상)
+        return await asyncio.wait_for(make_call(), self.policy.attempt_timeout)
+
+    async def _hedged(self, model: str, kind: str, make_call, discard=None):
+        """
+        make_call()을 실행하다가 p95 지연을 넘기면 한 번 더 실행하고 먼저 성공한 결과를 씁니다.
+        진 쪽은 취소하고, 이미 받은 결과는 discard(결과)로 정리합니다.
+        """
+        tracker = _tracker(model, kind)
+        p95 = tracker.p95()
+        started = time.monotonic()
+        calls = [asyncio.ensure_future(self._attempt(make_call))]
+        try:
+            if self.policy.hedge and p95 is not None:
+                done, _ = await asyncio.wait(calls, timeout=max(p95, self.policy.min_hedge_delay))
+                if not done:
+                    stats.hedges += 1
+                    await _bucket(model).acquire()
+                    calls.append(asyncio.ensure_future(self._attempt(make_call)))
+            pending = set(calls)
+            error = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is not calls[0]:
+                            stats.hedge_wins += 1
+                        tracker.record(time.monotonic() - started)
+                        calls.remove(task)
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            await _release(calls, discard)
+
+    async def _attempts(self, kind: str, make_call, discard=None):
+        """
+        모델 순서대로, 모델마다 최대 max_attempts번 make_call(client)을 시도합니다.
+        """
+        stats.calls += 1
+        last_error = None
+        for index, model in enumerate(self.models):
+            if index:
+                stats.fallbacks += 1
+                logger.warning("LLM fallback %s -> %s (%s)", self.models[index - 1], model, last_error)
+            client = self._clients[model]
+            for attempt in range(self.policy.max_attempts):
+                await _bucket(model).acquire()
+                try:
+                    return await self._hedged(model, kind, lambda: make_call(client), discard)
+                except Exception as e:
+                    last_error = e
+                    if not is_retryable(e):
+                        break
+                    if attempt + 1 < self.policy.max_attempts:
+                        stats.retries += 1
+                        await asyncio.sleep(self.policy.backoff(attempt))
+        stats.failures += 1
+        raise last_error
+
+    async def ainvoke(self, input, config=None, **kwargs):
+        kwargs.setdefault("generation_config", self._generation_config(config))
+        return await self._attempts("invoke", lambda client: client.ainvoke(input, config, **kwargs))
+
+    async def astream(self, input, config=None, **kwargs):
+        # 첫 조각이 오기 전까지만 재시도/헤징/폴백 (이미 보여준 답변은 되돌릴 수 없음)
+        kwargs.setdefault("generation_config", self._generation_config(config))
+        first, stream = await self._attempts(
+            "stream",
+            lambda client: _first_chunk(client.astream(input, config, **kwargs).__aiter__()),
+            discard=_close_stream,
+        )
+        try:
+            if first is not None:
+                yield first
+            async for chunk in stream:
+                yield chunk
+        finally:
+            await stream.aclose()
+
+    def invoke(self, input, config=None, **kwargs):
+        return self.gateway.invoke(self, input, config)
+
+    def stream(self, input, config=None, **kwargs):
+        yield from self.gateway.stream(self, input, config)
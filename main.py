@@ -1,16 +1,21 @@
 # 💬 간단한 일상 대화 챗봇
 import os
 import streamlit as st
-import nest_asyncio
 
-# Streamlit에서 비동기 작업을 위한 이벤트 루프 설정
-nest_asyncio.apply()
-
-from langchain_google_genai import ChatGoogleGenerativeAI
 from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
 from langchain_core.runnables.history import RunnableWithMessageHistory
-from langchain_community.chat_message_histories.streamlit import StreamlitChatMessageHistory
 from langchain_core.output_parsers import StrOutputParser
+from chat_store import SQLiteChatMessageHistory, get_chat_store
+from chat_session import chat_session_id
+from chat_memory import WindowedChatHistory, make_summarizer, summary_state
+from llm_gateway import get_gateway
+from llm_resilience import ResilientLLM, fallback_models
+from streaming import StreamTimer, text_stream
+from transcript import Transcript
+import rerun_profiler
+
+# 재실행 비용 측정 (RERUN_PROFILE=1 또는 ?profile=1 일 때만)
+profile = rerun_profiler.start("main", st.query_params, st.session_state)
 
 # --- 1. Gemini API 키 설정 ---
 try:
@@ -19,6 +24,9 @@ except Exception as e:
     st.error("⚠️ GOOGLE_API_KEY를 Streamlit Secrets에 설정해주세요!")
     st.stop()
 
+# 선택 모델이 쿼터 초과/장애일 때는 첫 번째(가장 빠른) 모델로 폴백
+MODEL_OPTIONS = ("gemini-2.5-flash", "gemini-2.5-pro", "gemini-2.0-flash-exp")
+
 # --- 2. LLM 및 프롬프트 설정 (캐시) ---
 @st.cache_resource(show_spinner="🤖 챗봇 모델 로딩 중...")
 def get_chat_chain(selected_model):
@@ -26,13 +34,9 @@ def get_chat_chain(selected_model):
     LLM, 프롬프트, 출력 파서를 결합한 기본 체인을 생성합니다.
     """
     
-    # LLM 로드
+    # LLM 로드 (게이트웨이 공용 클라이언트 + 속도 제한/재시도/헤징/폴백)
     try:
-        llm = ChatGoogleGenerativeAI(
-            model=selected_model,
-            temperature=0.7,
-            convert_system_message_to_human=True
-        )
+        llm = ResilientLLM(fallback_models(selected_model, MODEL_OPTIONS), temperature=0.7)
     except Exception as e:
         st.error(f"❌ Gemini 모델 '{selected_model}' 로드 실패: {str(e)}")
         st.info("💡 API 키가 유효한지, 모델 이름이 올바른지 확인해보세요.")
@@ -53,42 +57,54 @@ def get_chat_chain(selected_model):
     
     return chain
 
+# 창 밖으로 밀려난 예전 대화를 요약하는 LLM (가장 빠른 모델, 모든 세션 공유)
+@st.cache_resource
+def get_summarizer():
+    return make_summarizer(ResilientLLM(MODEL_OPTIONS[:1], temperature=0.2))
+
 # --- 3. Streamlit UI 설정 ---
 
 st.header("나의 일상 대화 챗봇 💬")
 st.info("Gemini 모델과 자유롭게 일상 대화를 나눠보세요.")
 
-# 채팅 기록을 Streamlit의 세션 상태(session_state)에 저장
-# key="chat_messages"는 이 채팅 기록을 식별하는 고유 키입니다.
-chat_history = StreamlitChatMessageHistory(key="chat_messages")
+# 채팅 기록은 SQLite 대화 저장소에 보관 (chat_sid 쿠키로 세션을 구분해서 새로고침해도 이어짐)
+session_id = chat_session_id(st.query_params, st.session_state)
+chat_history = SQLiteChatMessageHistory(get_chat_store(), "main", session_id)
 
 # 모델 선택
 option = st.selectbox("Select Gemini Model",
-    ("gemini-2.5-flash", "gemini-2.5-pro", "gemini-2.0-flash-exp"),
+    MODEL_OPTIONS,
     index=0,
     help="가장 빠르고 효율적인 2.5 Flash 모델을 추천합니다."
 )
 
+profile.lap("setup")
+
 # 선택된 모델로 LLM 체인 가져오기
 simple_chain = get_chat_chain(option)
+profile.lap("chain")
+
+# 프롬프트에는 토큰 예산 안의 최근 대화 + 예전 대화 요약만 들어가도록
+memory = WindowedChatHistory(chat_history, summary_state(st.session_state, f"chat_summary_{session_id}"), get_summarizer())
 
 # 대화 기록을 관리하는 Runnable 생성
 conversational_chain = RunnableWithMessageHistory(
     simple_chain,
-    lambda session_id: chat_history, # session_id에 관계없이 항상 chat_history 사용
+    lambda session_id: memory,       # memory는 이 session_id로 연 대화 기록 창
     input_messages_key="input",      # 프롬프트의 "{input}"에 사용자 입력을 매핑
     history_messages_key="history",  # 프롬프트의 "history"에 대화 기록을 매핑
 )
+profile.lap("history")
 
 # --- 4. 채팅 UI 로직 ---
 
 # 첫 방문 시 환영 메시지 추가
-if not chat_history.messages:
+if not chat_history.count():
     chat_history.add_ai_message("안녕하세요! 만나서 반가워요. 😊 무엇이든 물어보세요!")
 
-# 이전 대화 기록 모두 출력
-for msg in chat_history.messages:
-    st.chat_message(msg.type).write(msg.content)
+# 이전 대화 기록 출력 (최근 메시지만, 그 앞은 "이전 대화 더 보기" 뒤에)
+Transcript(chat_history, st.session_state, f"transcript_{session_id}").render()
+profile.lap("render_history")
 
 # 사용자 입력 받기
 if prompt_message := st.chat_input("메시지를 입력하세요..."):
@@ -98,12 +114,19 @@ if prompt_message := st.chat_input("메시지를 입력하세요..."):
     # AI 응답 생성 및 출력
     with st.chat_message("ai"):
         with st.spinner("Thinking..."):
-            # config: session_id는 아무 값이나 넣어도 chat_history를 사용하도록 설정됨
-            config = {"configurable": {"session_id": "any_id"}}
+            config = {"configurable": {"session_id": session_id}}
             
-            # 체인 실행 (RAG와 달리, 'context'가 없는 간단한 문자열을 반환)
-            response = conversational_chain.invoke(
-                {"input": prompt_message},
-                config
-            )
-            st.write(response)
+            # 체인 실행 (RAG와 달리, 'context'가 없는 간단한 문자열을 토큰 단위로 스트리밍)
+            timer = StreamTimer("chat")
+            with profile.section("llm"):
+                st.write_stream(text_stream(
+                    get_gateway().stream(conversational_chain, {"input": prompt_message}, config),
+                    timer
+                ))
+            profile.record("llm_ttft", timer.ttft)
+    st.caption(timer.caption())
+    # 답변을 다 보여준 뒤, 창이 차오르면 예전 대화 요약은 워커 스레드에서 (다음 요청은 기다리지 않음)
+    memory.compact_in_background()
+
+profile.finish()
+profile.panel()
@@ -7,24 +7,33 @@ Refactored main.py
 """
 
 import os
+import re
 import streamlit as st
 from datetime import datetime, timedelta
-from langchain_google_genai import ChatGoogleGenerativeAI
 from langchain_core.prompts import ChatPromptTemplate
-from langchain.memory import StreamlitChatMessageHistory
 from langchain_core.output_parsers import StrOutputParser
-import google.generativeai as genai
-import nest_asyncio
+from chat_store import SQLiteChatMessageHistory, get_chat_store
+from chat_session import chat_session_id
+from chat_memory import WindowedChatHistory, make_summarizer, summary_state
+from llm_gateway import get_gateway
+from llm_resilience import RATE_BURST, ResilientLLM, available_tokens, fallback_models
+from chain_pool import ChainPool
+from response_cache import ResponseCache, history_hash
+from streaming import StreamTimer, text_stream
+from transcript import Transcript
+import rerun_profiler
 
 # ──────────────────────────────────────────────
 # 0) 상수/라벨(한 줄 문자열로만 정의) ─ 줄바꿈 금지
 # ──────────────────────────────────────────────
+MODEL_OPTIONS             = ("gemini-1.5-flash", "gemini-1.5-pro", "gemini-2.0-flash", "gemini-2.0-pro-exp-02-05")
+
 APP_TITLE                 = "수험생 챗봇 (Student Edition)"
 APP_ICON                  = "🎓"
 SIDEBAR_HEADER            = "⚙️ 설정"
 MODEL_SELECT_LABEL        = "Gemini 모델"
 TEMPERATURE_LABEL         = "창의성(Temperature)"
-TURNS_LABEL               = "최근 대화 유지 턴 수"
+MEMORY_BUDGET_LABEL       = "대화 기억 분량(토큰)"
 TONE_HEADER               = "🗣️ 톤 프리셋"
 TONE_SELECT_LABEL         = "말투 선택"
 NEW_CHAT_BUTTON           = "🧹 새 대화 시작"
@@ -63,6 +72,10 @@ QUIZ_CHECKBOX_LABEL       = "유사문항 1개 생성"
 RUN_WRONG_BTN             = "🚀 오답풀이 실행"
 WARN_EMPTY_PASTE          = "붙여넣기 내용이 없습니다."
 SUCCESS_ANALYZED          = "오답 분석이 완료되었습니다."
+PROGRESS_ANALYZING        = "오답 분석 중… {done}/{total} 문항 완료"
+ITEM_TITLE                = "문항 {number}"
+ITEM_ERR_PREFIX           = "❌ 이 문항은 분석하지 못했습니다: "
+WRONG_MAX_PARALLEL        = 5
 RESULT_TITLE              = "🔎 오답 분석 결과"
 RESULT_COPY_EXPANDER      = "📋 결과 텍스트 복사"
 
@@ -88,6 +101,12 @@ ENG_KEYPOINTS_PROMPT      = "영어 지문을 붙여넣으면 핵심어·요지
 DAILY_AFFIRM_PROMPT       = "오늘 하루를 시작하는 긍정 확언 1문장을 만들어줘."
 STRETCH_PROMPT            = "목·눈·손목 중심으로 30초 스트레칭 2개 추천해줘."
 
+# 앱 시작 때 모든 톤으로 미리 답을 만들어 두는 인기 버튼
+PREWARM_PROMPTS           = (DAILY_AFFIRM_PROMPT, STRETCH_PROMPT, MAJOR_QUESTIONS_PROMPT, MATH_HINTS_PROMPT)
+DEFAULT_TEMPERATURE       = 0.7
+QUICK_VARIANTS            = 3
+CHAIN_POOL_SIZE           = 2
+
 SAMPLE_BUTTON_LABEL       = "샘플 템플릿 붙여넣기"
 SAMPLE_PASTE_VALUE        = "[과목] 수학\n[문제] 함수 f(x)=x^2-4x+5의 최솟값을 구하라.\n[선지] ①1 ②2 ③3 ④4 ⑤5\n[내가 고른 답] ⑤\n[정답] ③\n[해설(있다면)] 완전제곱식으로 전개하면...\n---\n[과목] 영어\n[지문] The committee reached a consensus, which...\n[문제] 밑줄 친 which가 가리키는 것은?\n[선지] ①decision ②committee ③consensus ④argument ⑤result\n[내가 고른 답] ②\n[정답] ③\n"
 
@@ -96,6 +115,7 @@ GUIDE_RULES                = "요구사항:\n1) 각 문항을 '---' 로 분리
 GUIDE_SUBJECT_HINT         = "3) 과목이 '{subject}'이면 해당 과목 스타일을 우선 적용하고, '자동감지'면 문항 내용으로 과목을 추론하세요."
 GUIDE_FORMAT_HINT          = "4) '{format_choice}'이면 '요약형'은 간결하게, '상세형'은 근거/풀이 단계를 더 구체적으로 제시하세요."
 GUIDE_NO_SEP               = "반드시 문항 순서를 유지하고, 문항 사이에 구분선(—)을 넣지 마세요."
+GUIDE_SINGLE_ITEM          = "이번 요청에는 문항이 하나만 들어 있습니다. 그 문항만 위 형식으로 분석하세요."
 USER_PASTE_PREFIX          = "[오답 텍스트 붙여넣기]\n"
 
 # 시스템 톤 프롬프트(한 줄 또는 삼중 따옴표 사용, 내부 줄바꿈은 이 블록에서만 관리)
@@ -114,16 +134,16 @@ STARR 구조(상황-과제-행동-결과-성찰)를 기준으로 답변을 구
 # ──────────────────────────────────────────────
 # 1) 초기 설정
 # ──────────────────────────────────────────────
-nest_asyncio.apply()
 st.set_page_config(page_title=APP_TITLE, page_icon=APP_ICON, layout="wide")
+# 재실행 비용 측정 (RERUN_PROFILE=1 또는 ?profile=1 일 때만)
+profile = rerun_profiler.start("main2", st.query_params, st.session_state)
 
 # ──────────────────────────────────────────────
 # 2) API Key
 # ──────────────────────────────────────────────
 try:
-    GOOGLE_API_KEY = st.secrets["GOOGLE_API_KEY"]
-    os.environ["GOOGLE_API_KEY"] = GOOGLE_API_KEY
-    genai.configure(api_key=Google_API_KEY if (Google_API_KEY:=GOOGLE_API_KEY) else GOOGLE_API_KEY)
+    # ChatGoogleGenerativeAI가 환경변수에서 읽으므로 google.generativeai를 따로 import/configure 하지 않음
+    os.environ["GOOGLE_API_KEY"] = st.secrets["GOOGLE_API_KEY"]
 except KeyError:
     st.error(API_ERR)
     st.stop()
@@ -156,6 +176,8 @@ st.markdown(
     unsafe_allow_html=True
 )
 
+profile.lap("css")
+
 # ──────────────────────────────────────────────
 # 4) 사이드바: 모델/톤/대화설정
 # ──────────────────────────────────────────────
@@ -163,11 +185,11 @@ with st.sidebar:
     st.header(SIDEBAR_HEADER)
     option = st.selectbox(
         MODEL_SELECT_LABEL,
-        ("gemini-1.5-flash", "gemini-1.5-pro", "gemini-2.0-flash", "gemini-2.0-pro-exp-02-05"),
+        MODEL_OPTIONS,
         index=0
     )
-    temperature = st.slider(TEMPERATURE_LABEL, 0.0, 1.0, 0.7, 0.1)
-    max_turns = st.slider(TURNS_LABEL, 4, 30, 12, 1)
+    temperature = st.slider(TEMPERATURE_LABEL, 0.0, 1.0, DEFAULT_TEMPERATURE, 0.1)
+    memory_budget = st.slider(MEMORY_BUDGET_LABEL, 500, 4000, 1500, 250)
 
     st.markdown("---")
     st.subheader(TONE_HEADER)
@@ -175,44 +197,125 @@ with st.sidebar:
 
     st.markdown("---")
     if st.button(NEW_CHAT_BUTTON):
+        # 지금 대화를 저장소에서 지우고 처음부터 (요약도 함께 지워짐)
+        get_chat_store().clear("student", chat_session_id(st.query_params, st.session_state))
         st.session_state.clear()
         st.rerun()
 
+profile.lap("sidebar")
+
 # ──────────────────────────────────────────────
 # 5) 대화 히스토리
 # ──────────────────────────────────────────────
-chat_history = StreamlitChatMessageHistory(key="chat_messages")
-if len(chat_history.messages) == 0:
+session_id = chat_session_id(st.query_params, st.session_state)
+chat_history = SQLiteChatMessageHistory(get_chat_store(), "student", session_id)
+if chat_history.count() == 0:
     chat_history.add_ai_message(WELCOME_MSG)
 
+# 창 밖으로 밀려난 예전 대화를 요약하는 LLM (가장 빠른 모델, 모든 세션 공유)
+@st.cache_resource
+def get_summarizer():
+    return make_summarizer(ResilientLLM(MODEL_OPTIONS[:1], temperature=0.2))
+
+# 프롬프트에는 토큰 예산 안의 최근 대화 + 예전 대화 요약만 (화면에는 전체 대화)
+memory = WindowedChatHistory(
+    chat_history,
+    summary_state(st.session_state, f"chat_summary_{session_id}"),
+    get_summarizer(),
+    token_budget=memory_budget,
+)
+
+profile.lap("history")
+
 # ──────────────────────────────────────────────
 # 6) 체인 생성/캐싱
 # ──────────────────────────────────────────────
-def get_chat_chain(selected_model: str, temp: float):
+def build_chat_chain(selected_model: str):
+    """
+    모델마다 체인 하나: 톤은 입력의 {tone}, temperature는 config의 configurable로 호출마다 넘깁니다.
+    """
     try:
-        llm = ChatGoogleGenerativeAI(
-            model=selected_model,
-            temperature=temp,
-            convert_system_message_to_human=True,
-        )
+        # 쿼터 초과/장애 시 재시도·헤징 후 첫 번째(가장 빠른) 모델로 폴백
+        llm = ResilientLLM(fallback_models(selected_model, MODEL_OPTIONS), temperature=DEFAULT_TEMPERATURE)
     except Exception as e:
         st.error(f"{MODEL_LOAD_ERR_PREFIX}{e}")
         st.stop()
 
     prompt = ChatPromptTemplate.from_messages(
         [
-            ("system", TONE_MAP.get(tone, TONE_MAP[TONE_WARM])),
+            ("system", "{tone}"),
             ("placeholder", "{history}"),
             ("human", "{input}")
         ]
     )
     return prompt | llm | StrOutputParser()
 
+# 모델별 체인 풀 - (모델, 온도, 톤) 조합마다 체인/클라이언트를 쌓지 않고, 최근에 쓴 모델 CHAIN_POOL_SIZE개만 보관
+# (버려진 체인은 다시 만들어도 게이트웨이의 모델별 클라이언트를 그대로 씀)
 @st.cache_resource(show_spinner="🤖 모델 준비 중...")
-def cached_chain(selected_model: str, temp: float, tone_key: str):
-    return get_chat_chain(selected_model, temp)
+def get_chain_pool():
+    return ChainPool(build_chat_chain, max_size=CHAIN_POOL_SIZE)
+
+chain_pool = get_chain_pool()
+
+def chain_inputs(text: str, tone_key: str, history=()):
+    return {"input": text, "tone": TONE_MAP.get(tone_key, TONE_MAP[TONE_WARM]), "history": list(history)}
+
+def chain_config(temp: float):
+    return {"configurable": {"session_id": session_id, "temperature": temp}}
+
+simple_chain = chain_pool.get(option)
+
+# 빠른 프롬프트 답변 캐시 - 시작할 때 인기 버튼 x 모든 톤을 기본 모델/온도로 미리 채워둠
+# (백그라운드에서 조금씩: 모델 버킷의 절반은 사용자 질문 몫으로 남겨둠)
+@st.cache_resource
+def get_response_cache():
+    cache = ResponseCache(variants=QUICK_VARIANTS)
+    jobs = [
+        (cache.key(MODEL_OPTIONS[0], DEFAULT_TEMPERATURE, tone_key, prompt_text, history_hash([])),
+         chain_inputs(prompt_text, tone_key))
+        for tone_key in TONE_MAP
+        for prompt_text in PREWARM_PROMPTS
+    ]
+    cache.prewarm(
+        jobs,
+        chain_pool.get(MODEL_OPTIONS[0]),
+        {"configurable": {"temperature": DEFAULT_TEMPERATURE}},
+        ready=lambda: available_tokens(MODEL_OPTIONS[0]) > RATE_BURST / 2,
+    )
+    return cache
+
+response_cache = get_response_cache()
+cache_stats = response_cache.stats()
+st.sidebar.caption(f"빠른 프롬프트 캐시 적중률 {cache_stats['hit_rate']:.0%} (변형 {cache_stats['variants']}개)")
+pool_stats = chain_pool.stats()
+st.sidebar.caption(f"체인 {pool_stats['chains']}/{pool_stats['max_size']}개 · 클라이언트 {pool_stats['clients']}개 · 제거 {pool_stats['evictions']}회"
+                   f" · 체인당 메모리 약 {pool_stats['rss_per_chain_mb']}MB")
+
+def ask_quick_prompt(prompt_text: str):
+    """
+    빠른 프롬프트 버튼: 고정 문장이므로 대화 기록 없이 보내고, 같은 (모델, 온도, 톤) 답변은 캐시에서 바로 꺼냅니다.
+    캐시에서 답했더라도 변형이 모자라면 다음을 위해 백그라운드에서 하나 더 만들어 둡니다.
+    """
+    inputs = chain_inputs(prompt_text, tone)
+    key = response_cache.key(option, temperature, tone, prompt_text, history_hash([]))
+    answer = response_cache.get(key)
+    profile.count("response_cache.miss" if answer is None else "response_cache.hit")
+    try:
+        if answer is None:
+            with st.spinner("생각 중...🤔"), profile.section("llm"):
+                answer = get_gateway().invoke(simple_chain, inputs, chain_config(temperature))
+            response_cache.put(key, answer)
+        elif response_cache.needs_variant(key):
+            response_cache.refresh(key, simple_chain, inputs, chain_config(temperature))
+    except Exception as e:
+        st.error(f"{RESP_ERR_PREFIX}{e}")
+        return
+    chat_history.add_user_message(prompt_text)
+    chat_history.add_ai_message(answer)
+    st.rerun()
 
-simple_chain = cached_chain(option, temperature, tone)
+profile.lap("chain")
 
 # ──────────────────────────────────────────────
 # 7) 탭 UI
@@ -223,36 +326,30 @@ with tab1:
     st.subheader("빠른 프롬프트")
     c1, c2, c3 = st.columns(3)
     if c1.button(BTN_MAJOR_QUESTIONS):
-        chat_history.add_user_message(MAJOR_QUESTIONS_PROMPT)
-        st.rerun()
+        ask_quick_prompt(MAJOR_QUESTIONS_PROMPT)
     if c2.button(BTN_INTERVIEW_QUESTIONS):
-        chat_history.add_user_message(INTERVIEW_QUESTIONS_PROMPT)
-        st.rerun()
+        ask_quick_prompt(INTERVIEW_QUESTIONS_PROMPT)
     if c3.button(BTN_EDIT_SELF_INTRO):
-        chat_history.add_user_message(EDIT_SELF_INTRO_PROMPT)
-        st.rerun()
+        ask_quick_prompt(EDIT_SELF_INTRO_PROMPT)
 
 with tab2:
     st.subheader("학습 템플릿")
     c21, c22, c23 = st.columns(3)
     if c21.button(BTN_WRONG_NOTE_TEMPLATE):
-        chat_history.add_user_message(WRONG_NOTE_PROMPT)
-        st.rerun()
+        ask_quick_prompt(WRONG_NOTE_PROMPT)
     if c22.button(BTN_MATH_HINTS):
-        chat_history.add_user_message(MATH_HINTS_PROMPT)
-        st.rerun()
+        ask_quick_prompt(MATH_HINTS_PROMPT)
     if c23.button(BTN_ENG_KEYPOINTS):
-        chat_history.add_user_message(ENG_KEYPOINTS_PROMPT)
-        st.rerun()
+        ask_quick_prompt(ENG_KEYPOINTS_PROMPT)
 
 with tab3:
     st.subheader("멘탈·루틴 도구")
     if st.button(BTN_DAILY_AFFIRM):
-        chat_history.add_user_message(DAILY_AFFIRM_PROMPT)
-        st.rerun()
+        ask_quick_prompt(DAILY_AFFIRM_PROMPT)
     if st.button(BTN_STRETCH):
-        chat_history.add_user_message(STRETCH_PROMPT)
-        st.rerun()
+        ask_quick_prompt(STRETCH_PROMPT)
+
+profile.lap("quick_prompts")
 
 with tab4:
     st.subheader(PASTE_TAB_TITLE)
@@ -275,27 +372,46 @@ with tab4:
     make_quiz = col3.checkbox(QUIZ_CHECKBOX_LABEL, value=True)
 
     if st.button(RUN_WRONG_BTN):
-        if not pasted.strip():
+        # 문항마다 따로 요청해서 동시에 처리 (전체 시간 ≈ 가장 느린 문항, 긴 붙여넣기도 잘리지 않음)
+        # 구분선(---)만 있거나 빈 문항은 버림 → 남는 문항이 없으면 빈 붙여넣기와 같음
+        items = [item.strip() for item in re.split(r"^\s*-{3,}\s*$", pasted, flags=re.MULTILINE) if item.strip()]
+        if not items:
             st.warning(WARN_EMPTY_PASTE)
         else:
             extra_quiz = "(유사문항 1개 포함)" if make_quiz else ""
             guide_subject = GUIDE_SUBJECT_HINT.format(subject=subject)
             guide_format  = GUIDE_FORMAT_HINT.format(format_choice=format_choice)
-            guidelines = f"{GUIDE_HEADER}\n{GUIDE_RULES}\n{extra_quiz}\n{guide_subject}\n{guide_format}\n{GUIDE_NO_SEP}"
-            user_input = f"{USER_PASTE_PREFIX}{pasted.strip()}"
+            guidelines = f"{GUIDE_HEADER}\n{GUIDE_RULES}\n{extra_quiz}\n{guide_subject}\n{guide_format}\n{GUIDE_NO_SEP}\n{GUIDE_SINGLE_ITEM}"
 
             try:
-                with st.spinner("오답을 분석 중입니다…"):
-                    analysis = simple_chain.invoke(
-                        {"input": f"{guidelines}\n\n{user_input}"},
-                        config={"configurable": {"session_id": "wrong-ans-session"}}
-                    )
+                st.markdown(f"### {RESULT_TITLE}")
+                progress = st.progress(0.0, text=PROGRESS_ANALYZING.format(done=0, total=len(items)))
+                # 문항 순서대로 자리를 먼저 잡아두고, 끝나는 대로 그 자리에 채움
+                slots = [st.empty() for _ in items]
+                results = [None] * len(items)
+                # 문항 분석(LLM 동시 호출)만 따로 재고, 입력 화면/저장은 아래 paste_tab으로
+                with profile.section("wrong_analysis"):
+                    for done, (index, answer, error) in enumerate(get_gateway().map_as_completed(
+                        simple_chain,
+                        [chain_inputs(f"{guidelines}\n\n{USER_PASTE_PREFIX}{item}", tone) for item in items],
+                        config=chain_config(temperature),
+                        max_parallel=WRONG_MAX_PARALLEL,
+                    ), start=1):
+                        title = f"#### {ITEM_TITLE.format(number=index + 1)}"
+                        if error is None:
+                            results[index] = f"{title}\n{answer}"
+                            slots[index].markdown(results[index])
+                        else:
+                            results[index] = f"{title}\n{ITEM_ERR_PREFIX}{error}"
+                            slots[index].error(results[index])
+                        progress.progress(done / len(items), text=PROGRESS_ANALYZING.format(done=done, total=len(items)))
+                    progress.empty()
+                analysis = "\n\n".join(results)
+
                 chat_history.add_user_message("(오답풀이 요청)\n" + pasted[:500] + ("..." if len(pasted) > 500 else ""))
                 chat_history.add_ai_message(analysis)
 
                 st.success(SUCCESS_ANALYZED)
-                st.markdown(f"### {RESULT_TITLE}")
-                st.markdown(analysis)
 
                 with st.expander(RESULT_COPY_EXPANDER):
                     st.code(analysis)
@@ -303,12 +419,14 @@ with tab4:
             except Exception as e:
                 st.error(f"{WRONG_ANALYZE_ERR_PREFIX}{e}")
 
+profile.lap("paste_tab")
+
 # ──────────────────────────────────────────────
 # 8) 기존 메시지 출력
 # ──────────────────────────────────────────────
-for message in chat_history.messages:
-    with st.chat_message(message.type):
-        st.markdown(message.content)
+# 최근 메시지만 그리고, 그 앞은 "이전 대화 더 보기" 뒤에 (이미 읽은 메시지는 세션에 보관)
+Transcript(chat_history, st.session_state, f"transcript_{session_id}").render()
+profile.lap("render_history")
 
 # ──────────────────────────────────────────────
 # 9) 입력 처리
@@ -319,20 +437,29 @@ if prompt_message:
     with st.chat_message("human"):
         st.markdown(prompt_message)
 
-    chat_history.add_user_message(prompt_message)
-
-    # 대화 길이 제한(최근 max_turns 쌍 유지)
-    if len(chat_history.messages) > 2 * max_turns:
-        chat_history.messages = chat_history.messages[-2 * max_turns:]
-
     try:
         with st.chat_message("ai"):
             with st.spinner("생각 중...🤔"):
-                response = simple_chain.invoke(
-                    {"input": prompt_message},
-                    config={"configurable": {"session_id": "student-session"}}
-                )
-                st.markdown(response)
+                # 이번 질문 전까지의 창(요약 + 최근 대화)만 프롬프트로
+                history = memory.messages
+                chat_history.add_user_message(prompt_message)
+                timer = StreamTimer("student")
+                with profile.section("llm"):
+                    response = st.write_stream(text_stream(
+                        get_gateway().stream(
+                            simple_chain,
+                            chain_inputs(prompt_message, tone, history),
+                            config=chain_config(temperature)
+                        ),
+                        timer
+                    ))
+                profile.record("llm_ttft", timer.ttft)
+                st.caption(timer.caption())
                 chat_history.add_ai_message(response)
+        # 답변을 다 보여준 뒤, 창이 차오르면 예전 대화 요약은 워커 스레드에서 (다음 요청은 기다리지 않음)
+        memory.compact_in_background()
     except Exception as e:
         st.error(f"{RESP_ERR_PREFIX}{e}")
+
+profile.finish()
+profile.panel()
@@ -2,13 +2,12 @@ import os
 import streamlit as st
 from datetime import datetime
 import json
-import nest_asyncio
-
-# Streamlit에서 비동기 작업을 위한 이벤트 루프 설정
-nest_asyncio.apply()
+import rerun_profiler
 
 # Set wide layout and title for a better look
 st.set_page_config(layout="wide", page_title="5분 미니 힐링 요정 봇")
+# 재실행 비용 측정 (RERUN_PROFILE=1 또는 ?profile=1 일 때만)
+profile = rerun_profiler.start("healing", st.query_params, st.session_state)
 
 # Custom CSS for theme - 파스텔톤과 둥근 디자인을 적용하여 힐링 컨셉 강조
 st.markdown("""
@@ -55,12 +54,18 @@ h1 {
 }
 </style>
 """, unsafe_allow_html=True)
+profile.lap("css")
 
 
 # LangChain 관련 컴포넌트는 제거하고, 순수 Gemini Chat만 사용
-from langchain_google_genai import ChatGoogleGenerativeAI
 from langchain_core.messages import HumanMessage, SystemMessage
-from langchain_community.chat_message_histories.streamlit import StreamlitChatMessageHistory
+from chat_store import SQLiteChatMessageHistory, get_chat_store
+from chat_session import chat_session_id
+from chat_memory import WindowedChatHistory, make_summarizer, summary_state
+from llm_gateway import get_gateway
+from llm_resilience import ResilientLLM, fallback_models
+from streaming import StreamTimer, text_stream
+from transcript import Transcript, TranscriptEntry
 
 # Gemini API 키 설정
 try:
@@ -85,9 +90,12 @@ st.markdown("_{tip: 오늘 기분이나 고민을 짧게 말해줘. 요정이가
 if "emotion_logs" not in st.session_state:
     st.session_state["emotion_logs"] = []
 
+# 선택 모델이 쿼터 초과/장애일 때는 첫 번째(가장 빠른) 모델로 폴백
+MODEL_OPTIONS = ("gemini-2.5-flash", "gemini-2.5-pro", "gemini-2.0-flash-exp")
+
 # 모델 선택 (단일 채팅 모델)
 option = st.selectbox("Select Gemini Model",
-    ("gemini-2.5-flash", "gemini-2.5-pro", "gemini-2.0-flash-exp"),
+    MODEL_OPTIONS,
     index=0,
     help="Gemini 2.5 Flash가 가장 빠르고 효율적입니다"
 )
@@ -96,34 +104,46 @@ option = st.selectbox("Select Gemini Model",
 @st.cache_resource
 def initialize_llm(selected_model):
     try:
-        llm = ChatGoogleGenerativeAI(
-            model=selected_model,
-            temperature=0.8, # 감성적인 답변을 위해 온도를 높임
-            convert_system_message_to_human=True
-        )
+        # 감성적인 답변을 위해 온도를 높임 (게이트웨이 공용 클라이언트 + 재시도/헤징/폴백)
+        llm = ResilientLLM(fallback_models(selected_model, MODEL_OPTIONS), temperature=0.8)
         return llm
     except Exception as e:
         st.error(f"❌ Gemini 모델 '{selected_model}' 로드 실패: {str(e)}")
         st.info("💡 'gemini-2.5-flash' 모델을 사용해보세요.")
         st.stop()
         
+profile.lap("setup")
 llm = initialize_llm(option)
-chat_history_handler = StreamlitChatMessageHistory(key="chat_messages")
+profile.lap("llm_init")
+# 대화 기록은 SQLite 대화 저장소에 보관 (chat_sid 쿠키로 세션을 구분해서 새로고침해도 이어짐)
+session_id = chat_session_id(st.query_params, st.session_state)
+chat_history_handler = SQLiteChatMessageHistory(get_chat_store(), "healing", session_id)
+
+# 창 밖으로 밀려난 예전 대화를 요약하는 LLM (가장 빠른 모델, 모든 세션 공유)
+@st.cache_resource
+def get_summarizer():
+    return make_summarizer(ResilientLLM(MODEL_OPTIONS[:1], temperature=0.2))
 
+memory = WindowedChatHistory(chat_history_handler, summary_state(st.session_state, f"chat_summary_{session_id}"), get_summarizer())
 
-if not chat_history_handler.messages:
+
+if not chat_history_handler.count():
     # 초기 인사말 설정
     chat_history_handler.add_message(HumanMessage(content=HEALING_SYSTEM_PROMPT, name="system"))
     initial_message = "안녕, 반가워! 나는 너의 비밀 친구 힐링 요정이야. ✨ 오늘 하루는 어땠어? 네 마음을 편하게 이야기해 줘도 괜찮아. 😌"
     chat_history_handler.add_message(HumanMessage(content=initial_message, name="ai"))
+profile.lap("history")
 
-# 기존 대화 기록 출력
-for msg in chat_history_handler.messages:
+# 기존 대화 기록 출력 (최근 메시지만, 그 앞은 "이전 대화 더 보기" 뒤에)
+def to_entry(msg):
     # 시스템 메시지는 사용자에게 표시하지 않음
-    if msg.type != "system":
-        # StreamlitChatMessageHistory는 role 대신 type으로 'human'/'ai'를 사용
-        role = "assistant" if msg.type == "ai" else "user"
-        st.chat_message(role).write(msg.content)
+    if msg.type == "system":
+        return None
+    # 대화 기록은 role 대신 type으로 'human'/'ai'를 사용
+    return TranscriptEntry("assistant" if msg.type == "ai" else "user", msg.content)
+
+Transcript(chat_history_handler, st.session_state, f"transcript_{session_id}", to_entry).render()
+profile.lap("render_history")
 
 # 감정 기록 및 통계 표시 영역
 with st.expander("💖 나의 감정 기록 보기", expanded=False):
@@ -152,8 +172,8 @@ if prompt_message := st.chat_input("오늘 기분이나 고민을 적어줘."):
             messages = [
                 SystemMessage(content=HEALING_SYSTEM_PROMPT)
             ]
-            # 기존 대화 기록 추가
-            for msg in chat_history_handler.messages:
+            # 기존 대화 기록 추가 (토큰 예산 안의 최근 대화 + 예전 대화 요약만)
+            for msg in memory.messages:
                 # 시스템 메시지(초기 프롬프트)는 다시 추가할 필요 없음
                 if msg.type != "system":
                      messages.append(msg)
@@ -161,9 +181,11 @@ if prompt_message := st.chat_input("오늘 기분이나 고민을 적어줘."):
             # 사용자 메시지 추가
             messages.append(HumanMessage(content=prompt_message, name="user"))
             
-            response = llm.invoke(messages)
-            ai_answer = response.content
-            st.write(ai_answer)
+            timer = StreamTimer("healing")
+            with profile.section("llm"):
+                ai_answer = st.write_stream(text_stream(get_gateway().stream(llm, messages), timer))
+            profile.record("llm_ttft", timer.ttft)
+            st.caption(timer.caption())
             
             # 2. 감정 기록 
             current_time = datetime.now()
@@ -177,3 +199,9 @@ if prompt_message := st.chat_input("오늘 기분이나 고민을 적어줘."):
             # 3. 히스토리 업데이트
             chat_history_handler.add_message(HumanMessage(content=prompt_message, name="user"))
             chat_history_handler.add_message(HumanMessage(content=ai_answer, name="ai"))
+
+            # 답변을 다 보여준 뒤, 창이 차오르면 예전 대화 요약은 워커 스레드에서 (다음 요청은 기다리지 않음)
+            memory.compact_in_background()
+
+profile.finish()
+profile.panel()
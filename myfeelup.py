@@ -2,31 +2,26 @@ import os
 import streamlit as st
 from datetime import datetime
 import json
-import nest_asyncio
-
-# Streamlit에서 비동기 작업을 위한 이벤트 루프 설정
-nest_asyncio.apply()
+import rerun_profiler
 
 # Set wide layout and title for a better look
 st.set_page_config(layout="wide", page_title="마음 힐링 상담 요정 봇")
+# 재실행 비용 측정 (RERUN_PROFILE=1 또는 ?profile=1 일 때만)
+profile = rerun_profiler.start("counsel", st.query_params, st.session_state)
 
 # -----------------------------------------------------
 # 🎶 배경 음악 (MP3) 및 제어 버튼 구현
 # -----------------------------------------------------
 import streamlit.components.v1 as components
-import base64
+from static_assets import publish, publish_image
 
 # 로컬 MP3 파일 경로 설정 (파일 이름을 확인하고 수정하세요!)
 AUDIO_FILE_PATH = "ambient_music.mp3" 
 
 # Tone.js 대신 HTML Audio를 사용합니다.
-# base64 인코딩을 사용하여 Streamlit 환경에서 로컬 파일에 접근합니다.
-try:
-    with open(AUDIO_FILE_PATH, "rb") as f:
-        audio_bytes = f.read()
-        audio_b64 = base64.b64encode(audio_bytes).decode()
-        audio_src = f"data:audio/mp3;base64,{audio_b64}"
-except FileNotFoundError:
+# 파일은 정적 파일(app/static)로 한 번만 올리고 URL로 참조합니다. (재실행마다 base64로 다시 보내지 않음)
+audio_src = publish(AUDIO_FILE_PATH)
+if audio_src is None:
     # 파일이 없으면 재생 기능을 비활성화
     st.warning(f"⚠️ 경고: '{AUDIO_FILE_PATH}' 파일을 찾을 수 없어 배경음악 기능이 작동하지 않습니다. 파일을 추가해 주세요.")
     audio_src = ""
@@ -111,6 +106,7 @@ audio_control_html = f"""
 </script>
 """
 # -----------------------------------------------------
+profile.lap("audio")
 
 
 # Custom CSS for theme - 상담소 분위기와 명확한 대화 정렬을 위해 CSS 수정
@@ -250,12 +246,15 @@ st.markdown("""
 </style>
 """, unsafe_allow_html=True)
 
+profile.lap("css")
+
 # -----------------------------------------------------
 # ✨ 음악 버튼은 이제 HTML 컴포넌트 삽입 코드가 됩니다.
 # -----------------------------------------------------
 # HTML 컴포넌트 (음악 버튼)을 삽입합니다.
 components.html(audio_control_html, height=100)
 # -----------------------------------------------------
+profile.lap("audio")
 
 # -----------------------------------------------------
 # 💖 제목과 GIF 레이아웃 (중앙 정렬) - 동일한 컬럼 비율 적용
@@ -271,52 +270,73 @@ with title_col2:
 
 # 2. GIF 이미지 추가 (중앙 정렬)
 GIF_FILE_PATH = "cute_fairy.gif" 
+GIF_WIDTH = 150
+GIF_CAPTION = "안녕! 나는 힐링 요정이야 ✨"
 gif_col1, gif_col2, gif_col3 = st.columns(CENTERING_RATIO)
 
 with gif_col2:
-    st.image(
-        GIF_FILE_PATH, 
-        caption="안녕! 나는 힐링 요정이야 ✨",
-        width=150,
-        use_column_width=False 
-    )
+    # 표시 폭으로 한 번만 줄인 애니메이션 WebP를 정적 파일 URL로 참조 (재실행마다 원본 GIF를 다시 보내지 않음)
+    gif_src = publish_image(GIF_FILE_PATH, GIF_WIDTH)
+    if gif_src:
+        st.markdown(
+            f'<figure style="margin: 0;"><img src="{gif_src}" width="{GIF_WIDTH}" alt="힐링 요정">'
+            f'<figcaption style="color: rgba(49, 51, 63, 0.6); font-size: 14px;">{GIF_CAPTION}</figcaption></figure>',
+            unsafe_allow_html=True
+        )
 # -----------------------------------------------------
 
 st.markdown("_{tip: 네 마음의 이야기를 편하게 털어놔 봐. 요정이가 귀 기울여 들을게!}_")
+profile.lap("header")
 
 # 세션 상태에 감정 기록 리스트 초기화
 if "emotion_logs" not in st.session_state:
     st.session_state["emotion_logs"] = []
 
+# 선택 모델이 쿼터 초과/장애일 때는 첫 번째(가장 빠른) 모델로 폴백
+MODEL_OPTIONS = ("gemini-2.5-flash", "gemini-2.5-pro", "gemini-2.0-flash-exp")
+
 # 모델 선택 (단일 채팅 모델)
 option = st.selectbox("Select Gemini Model",
-    ("gemini-2.5-flash", "gemini-2.5-pro", "gemini-2.0-flash-exp"),
+    MODEL_OPTIONS,
     index=0,
     help="Gemini 2.5 Flash가 가장 빠르고 효율적입니다"
 )
 
 # 컴포넌트 초기화
-from langchain_google_genai import ChatGoogleGenerativeAI
+from chat_store import SQLiteChatMessageHistory, get_chat_store
+from chat_session import chat_session_id
+from chat_memory import WindowedChatHistory, make_summarizer, summary_state
+from llm_gateway import get_gateway
+from llm_resilience import ResilientLLM, fallback_models
 @st.cache_resource
 def initialize_llm(selected_model):
     try:
-        llm = ChatGoogleGenerativeAI(
-            model=selected_model,
-            temperature=0.8, # 감성적인 답변을 위해 온도를 높임
-            convert_system_message_to_human=True
-        )
+        # 감성적인 답변을 위해 온도를 높임 (게이트웨이 공용 클라이언트 + 재시도/헤징/폴백)
+        llm = ResilientLLM(fallback_models(selected_model, MODEL_OPTIONS), temperature=0.8)
         return llm
     except Exception as e:
         st.error(f"❌ Gemini 모델 '{selected_model}' 로드 실패: {str(e)}")
         st.info("💡 'gemini-2.5-flash' 모델을 사용해보세요.")
         st.stop()
         
+profile.lap("setup")
 llm = initialize_llm(option)
+profile.lap("llm_init")
 # 🚨🚨🚨 에러 수정: chat_history_handler를 LLM 초기화 직후로 이동 🚨🚨🚨
-from langchain_community.chat_message_histories.streamlit import StreamlitChatMessageHistory 
-chat_history_handler = StreamlitChatMessageHistory(key="chat_messages")
+# 대화 기록은 SQLite 대화 저장소에 보관 (chat_sid 쿠키로 세션을 구분해서 새로고침해도 이어짐)
+session_id = chat_session_id(st.query_params, st.session_state)
+chat_history_handler = SQLiteChatMessageHistory(get_chat_store(), "counsel", session_id)
+
+# 창 밖으로 밀려난 예전 대화를 요약하는 LLM (가장 빠른 모델, 모든 세션 공유)
+@st.cache_resource
+def get_summarizer():
+    return make_summarizer(ResilientLLM(MODEL_OPTIONS[:1], temperature=0.2))
+
+memory = WindowedChatHistory(chat_history_handler, summary_state(st.session_state, f"chat_summary_{session_id}"), get_summarizer())
 
 from langchain_core.messages import HumanMessage, SystemMessage, AIMessage 
+from streaming import StreamTimer, text_stream
+from transcript import Transcript, TranscriptEntry
 
 # 🚨🚨🚨 에러 수정: chat_history_handler를 사용하는 로직을 객체 생성 후로 이동 🚨🚨🚨
 
@@ -329,25 +349,25 @@ HEALING_SYSTEM_PROMPT = """
 사용자의 기분을 개선하는 데 도움이 되는 구체적인 행동 팁(예: 심호흡 3회 하기, 5분 동안 좋아하는 음악 듣기, 잠시 창밖 바라보기)을 자주 추천해 줘.
 """
 
-if not chat_history_handler.messages:
+if not chat_history_handler.count():
     # 초기 인사말 설정 - **반말로 수정**
     chat_history_handler.add_message(HumanMessage(content=HEALING_SYSTEM_PROMPT, name="system"))
     initial_message = "안녕! ✨ 나는 너의 마음을 살펴주는 힐링 요정이야. 오늘 네 마음속은 어떤 이야기로 가득 차 있어? 편하게 시작해 봐. 😌"
     chat_history_handler.add_message(AIMessage(content=initial_message)) # 초기 메시지는 AIMessage로 변경
+profile.lap("history")
 
-# 기존 대화 기록 출력
-for msg in chat_history_handler.messages:
+# 기존 대화 기록 출력 (최근 메시지만, 그 앞은 "이전 대화 더 보기" 뒤에)
+def to_entry(msg):
     # 시스템 메시지는 사용자에게 표시하지 않음
-    if msg.type != "system":
-        # StreamlitChatMessageHistory는 role 대신 type으로 'human'/'ai'를 사용
-        role = "assistant" if msg.type == "ai" else "user"
-        
-        # 아바타를 이모지로 설정
-        if role == "assistant":
-            st.chat_message(role, avatar="✨").write(msg.content)
-        else:
-            st.chat_message(role, avatar="🙂").write(msg.content)
+    if msg.type == "system":
+        return None
+    # 대화 기록은 role 대신 type으로 'human'/'ai'를 사용하고, 아바타는 이모지로 설정
+    if msg.type == "ai":
+        return TranscriptEntry("assistant", msg.content, avatar="✨")
+    return TranscriptEntry("user", msg.content, avatar="🙂")
 
+Transcript(chat_history_handler, st.session_state, f"transcript_{session_id}", to_entry).render()
+profile.lap("render_history")
 
 # 감정 기록 및 통계 표시 영역
 with st.expander("💖 나의 마음 기록 보기", expanded=False):
@@ -375,8 +395,8 @@ if prompt_message := st.chat_input("오늘 기분이나 고민을 적어줘."):
             messages = [
                 SystemMessage(content=HEALING_SYSTEM_PROMPT)
             ]
-            # 기존 대화 기록 추가
-            for msg in chat_history_handler.messages:
+            # 기존 대화 기록 추가 (토큰 예산 안의 최근 대화 + 예전 대화 요약만)
+            for msg in memory.messages:
                 # 시스템 메시지(초기 프롬프트)는 다시 추가할 필요 없음
                 if msg.type != "system":
                      messages.append(msg)
@@ -384,10 +404,12 @@ if prompt_message := st.chat_input("오늘 기분이나 고민을 적어줘."):
             # 사용자 메시지 추가
             messages.append(HumanMessage(content=prompt_message, name="user"))
             
-            # 💡 수정된 부분: llm.invoke 대신 llm.predict_messages를 사용하여 동기식 호출 (이전 오류 해결)
-            response = llm.predict_messages(messages)
-            ai_answer = response.content
-            st.write(ai_answer)
+            # 💡 답변을 토큰 단위로 스트리밍해서 바로바로 말풍선에 표시
+            timer = StreamTimer("counsel")
+            with profile.section("llm"):
+                ai_answer = st.write_stream(text_stream(get_gateway().stream(llm, messages), timer))
+            profile.record("llm_ttft", timer.ttft)
+            st.caption(timer.caption())
             
             # 2. 감정 기록 
             current_time = datetime.now()
@@ -402,3 +424,9 @@ if prompt_message := st.chat_input("오늘 기분이나 고민을 적어줘."):
             chat_history_handler.add_message(HumanMessage(content=prompt_message, name="user"))
             # LLM 응답은 AIMessage 객체이므로 content만 추출하여 저장
             chat_history_handler.add_message(AIMessage(content=ai_answer))
+
+            # 답변을 다 보여준 뒤, 창이 차오르면 예전 대화 요약은 워커 스레드에서 (다음 요청은 기다리지 않음)
+            memory.compact_in_background()
+
+profile.finish()
+profile.panel()
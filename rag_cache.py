@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+"""
+RAG 체인 앞단의 의미 기반 답변 캐시
+- 질문 임베딩끼리 코사인 유사도가 threshold 이상이면 예전 답변을 그대로 돌려줌
+- 답변을 만들 때 참고한 청크가 아직 벡터 DB에 그대로 있을 때만 재사용
+- TTL이 지나거나 max_entries를 넘으면 오래된 것부터 제거
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+
+import numpy as np
+
+DEFAULT_THRESHOLD = 0.92
+DEFAULT_TTL_SECONDS = 6 * 60 * 60
+DEFAULT_MAX_ENTRIES = 512
+
+
+@dataclass
+class CachedAnswer:
+    question: str
+    answer: str
+    context: list
+    context_ids: tuple
+    vector: np.ndarray
+    created: float
+
+
+def _unit(vector) -> np.ndarray:
+    vector = np.asarray(vector, dtype=np.float32)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+class SemanticAnswerCache:
+    """
+    embeddings: 질문을 벡터로 바꿀 LangChain Embeddings (벡터 DB와 같은 모델)
+    """
+
+    def __init__(self, embeddings, threshold: float = DEFAULT_THRESHOLD,
+                 ttl_seconds: float = DEFAULT_TTL_SECONDS, max_entries: int = DEFAULT_MAX_ENTRIES):
+        self.embeddings = embeddings
+        self.threshold = threshold
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _purge_expired(self, now: float) -> None:
+        expired = [key for key, entry in self._entries.items() if now - entry.created > self.ttl_seconds]
+        for key in expired:
+            del self._entries[key]
+
+    def lookup(self, question: str, is_current=None):
+        """
+        비슷한 질문의 답변이 있으면 CachedAnswer, 없으면 None.
+        is_current(context_ids)가 False를 돌려주면 참고 문서가 바뀐 것으로 보고 버립니다.
+        """
+        vector = _unit(self.embeddings.embed_query(question))
+        with self._lock:
+            self._purge_expired(time.time())
+            if self._entries:
+                keys = list(self._entries)
+                matrix = np.stack([self._entries[key].vector for key in keys])
+                scores = matrix @ vector
+                best = int(np.argmax(scores))
+                if scores[best] >= self.threshold:
+                    entry = self._entries[keys[best]]
+                    if is_current is None or is_current(entry.context_ids):
+                        self._entries.move_to_end(keys[best])
+                        self.hits += 1
+                        return entry
+                    del self._entries[keys[best]]
+            self.misses += 1
+            return None
+
+    def store(self, question: str, answer: str, context) -> None:
+        entry = CachedAnswer(
+            question=question,
+            answer=answer,
+            context=list(context),
+            context_ids=tuple(
+                chunk_id for doc in context
+                for chunk_id in (doc.metadata.get("chunk_ids") or [doc.metadata.get("chunk_id")])
+            ),
+            vector=_unit(self.embeddings.embed_query(question)),
+            created=time.time(),
+        )
+        key = " ".join(question.split())
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def stats(self) -> dict:
+        return {"hits": self.hits, "misses": self.misses, "hit_rate": self.hit_rate, "size": len(self._entries)}
@@ -0,0 +1,354 @@
+# -*- coding: utf-8 -*-
+"""
+ko-sroberta 임베딩 엔진
+- 텍스트를 길이순으로 정렬한 뒤 배치로 묶어 인코딩 (패딩 낭비 최소화)
+- workers > 1 이면 프로세스마다 모델을 따로 올려서 배치를 병렬 인코딩
+- EmbeddingCache: (모델 + 정규화 텍스트 해시) → 벡터를 SQLite에 저장해 재계산을 건너뜀
+- registry: 프로세스 전체에서 모델을 이름당 한 번만 올리고, 백그라운드 스레드로 예열
+- 벤치마크: python rag_embeddings.py --benchmark <PDF> --batch-sizes 16 32 64 --workers 1 2 4
+"""
+
+import argparse
+import hashlib
+import multiprocessing
+import os
+import sqlite3
+import threading
+import time
+import unicodedata
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+
+from langchain_core.embeddings import Embeddings
+
+DEFAULT_MODEL = "jhgan/ko-sroberta-multitask"
+DEFAULT_BATCH_SIZE = 32
+DEFAULT_CACHE_PATH = "./embedding_cache.sqlite"
+DEFAULT_CACHE_ENTRIES = 200_000
+SQL_BATCH = 500
+# 행 수는 직접 세어 두고, 같은 파일을 쓰는 다른 프로세스 몫은 이만큼 넣을 때마다 COUNT(*)로 다시 맞춤
+RECOUNT_EVERY = 10_000
+
+# 워커 프로세스마다 하나씩 들고 있는 모델
+_worker_model = None
+
+
+def _load_model(model_name: str):
+    from sentence_transformers import SentenceTransformer
+    return SentenceTransformer(model_name, device="cpu")
+
+
+def resident_memory_mb() -> float:
+    # 현재 RSS (리눅스가 아니면 최대 RSS로 대신함)
+    try:
+        with open("/proc/self/status", encoding="ascii") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    import resource
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+class ModelRegistry:
+    """
+    임베딩 모델을 프로세스당 이름별로 한 번만 로드해서 모든 Streamlit 세션이 같이 씁니다.
+    warmup()은 로딩과 더미 인코딩을 백그라운드 스레드에서 돌려서 UI 렌더링을 막지 않습니다.
+    """
+
+    def __init__(self):
+        self._models = {}
+        self._load_seconds = {}
+        self._model_locks = {}
+        self._warmups = {}
+        self._lock = threading.Lock()
+
+    def _model_lock(self, model_name: str) -> threading.Lock:
+        with self._lock:
+            return self._model_locks.setdefault(model_name, threading.Lock())
+
+    def get(self, model_name: str):
+        model = self._models.get(model_name)
+        if model is not None:
+            return model
+        # 예열 스레드가 로딩 중이면 여기서 끝날 때까지 기다림
+        with self._model_lock(model_name):
+            if model_name not in self._models:
+                started = time.perf_counter()
+                model = _load_model(model_name)
+                model.encode(["warmup"])
+                self._load_seconds[model_name] = time.perf_counter() - started
+                self._models[model_name] = model
+        return self._models[model_name]
+
+    def warmup(self, model_name: str) -> threading.Thread:
+        with self._lock:
+            thread = self._warmups.get(model_name)
+            if thread is None:
+                thread = threading.Thread(target=self.get, args=(model_name,), name=f"warmup-{model_name}", daemon=True)
+                self._warmups[model_name] = thread
+                thread.start()
+        return thread
+
+    def is_ready(self, model_name: str) -> bool:
+        return model_name in self._models
+
+    def stats(self) -> dict:
+        return {
+            "load_seconds": {name: round(sec, 2) for name, sec in self._load_seconds.items()},
+            "rss_mb": round(resident_memory_mb(), 1),
+        }
+
+
+registry = ModelRegistry()
+
+
+def _init_worker(model_name: str, threads: int) -> None:
+    global _worker_model
+    import torch
+    # 워커끼리 CPU 코어를 나눠 쓰도록 스레드 수를 제한
+    torch.set_num_threads(threads)
+    _worker_model = _load_model(model_name)
+
+
+def _encode_in_worker(texts, batch_size: int, normalize: bool):
+    return _worker_model.encode(
+        texts, batch_size=batch_size, normalize_embeddings=normalize, convert_to_numpy=True
+    ).tolist()
+
+
+class EmbeddingCache:
+    """
+    텍스트 → 벡터 결과를 SQLite 파일에 저장하는 캐시입니다.
+    키는 (모델 이름 + 공백/유니코드 정규화한 텍스트)의 해시이고,
+    max_entries를 넘으면 가장 오래 쓰지 않은 항목부터 지웁니다(LRU).
+    """
+
+    def __init__(self, path: str = DEFAULT_CACHE_PATH, max_entries: int = DEFAULT_CACHE_ENTRIES):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            " key TEXT PRIMARY KEY, vector BLOB NOT NULL, last_used REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_embeddings_last_used ON embeddings(last_used)")
+        self._count = self._recount()
+        self._since_recount = 0
+
+    def _recount(self) -> int:
+        return self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+    @staticmethod
+    def make_key(model_name: str, text: str) -> str:
+        normalized = " ".join(unicodedata.normalize("NFC", text).split())
+        return hashlib.sha256(f"{model_name}\0{normalized}".encode("utf-8")).hexdigest()
+
+    def get_many(self, model_name: str, texts):
+        """
+        texts와 같은 순서로 벡터 리스트를 돌려줍니다. 캐시에 없으면 None.
+        """
+        keys = [self.make_key(model_name, text) for text in texts]
+        found = {}
+        with self._lock:
+            for start in range(0, len(keys), SQL_BATCH):
+                part = keys[start:start + SQL_BATCH]
+                rows = self._conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({','.join('?' * len(part))})", part
+                ).fetchall()
+                found.update(rows)
+            if found:
+                now = time.time()
+                self._conn.executemany(
+                    "UPDATE embeddings SET last_used = ? WHERE key = ?", [(now, key) for key in found]
+                )
+        self.hits += len(found)
+        self.misses += len(keys) - len(found)
+        return [_unpack(found[key]) if key in found else None for key in keys]
+
+    def put_many(self, model_name: str, texts, vectors) -> None:
+        now = time.time()
+        rows = [(self.make_key(model_name, text), _pack(vector), now) for text, vector in zip(texts, vectors)]
+        with self._lock:
+            changes = self._conn.total_changes
+            self._conn.execute("BEGIN")
+            try:
+                self._conn.executemany("INSERT OR IGNORE INTO embeddings VALUES (?, ?, ?)", rows)
+                inserted = self._conn.total_changes - changes
+                if inserted < len(rows):
+                    # 이미 있던 키는 벡터가 같으므로 사용 시각만 갱신
+                    self._conn.executemany(
+                        "UPDATE embeddings SET last_used = ? WHERE key = ?", [(now, key) for key, _, _ in rows]
+                    )
+                self._conn.execute("COMMIT")
+            except Exception:
+                # 트랜잭션이 열린 채 남으면 이 연결의 이후 쓰기가 모두 그 안에 묶이고 쓰기 잠금도 계속 쥠
+                self._conn.execute("ROLLBACK")
+                raise
+            self._count += inserted
+            self._since_recount += inserted
+            if self._since_recount >= RECOUNT_EVERY:
+                self._count, self._since_recount = self._recount(), 0
+            overflow = self._count - self.max_entries
+            if overflow > 0:
+                deleted = self._conn.execute(
+                    "DELETE FROM embeddings WHERE key IN "
+                    "(SELECT key FROM embeddings ORDER BY last_used LIMIT ?)", (overflow,)
+                ).rowcount
+                self._count -= deleted
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+
+def _pack(vector) -> bytes:
+    return array("f", vector).tobytes()
+
+
+def _unpack(blob: bytes):
+    vector = array("f")
+    vector.frombytes(blob)
+    return vector.tolist()
+
+
+class EmbeddingEngine(Embeddings):
+    """
+    HuggingFaceEmbeddings 대신 쓰는 LangChain 호환 임베딩 엔진입니다.
+    cache를 넘기면 문서/질문 임베딩 모두 캐시를 먼저 확인하고, 없는 것만 모델로 계산합니다.
+    """
+
+    def __init__(self, model_name: str = DEFAULT_MODEL, batch_size: int = DEFAULT_BATCH_SIZE,
+                 workers: int = 1, normalize: bool = True, cache: EmbeddingCache = None):
+        self.model_name = model_name
+        self.batch_size = batch_size
+        self.workers = max(1, workers)
+        self.normalize = normalize
+        self.cache = cache
+        self._pool = None
+        self._lock = threading.Lock()
+
+    @property
+    def model(self):
+        return registry.get(self.model_name)
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._pool is None:
+                threads = max(1, (os.cpu_count() or 1) // self.workers)
+                # fork 후 torch 스레드가 꼬이지 않도록 spawn으로 워커를 띄움
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                    initializer=_init_worker,
+                    initargs=(self.model_name, threads),
+                )
+            return self._pool
+
+    def _encode(self, texts):
+        texts = list(texts)
+        if not texts:
+            return []
+        # 길이가 비슷한 텍스트끼리 한 배치에 들어가도록 정렬
+        order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+        batches = [order[start:start + self.batch_size] for start in range(0, len(order), self.batch_size)]
+        vectors = [None] * len(texts)
+
+        if self.workers > 1 and len(batches) > 1:
+            pool = self._get_pool()
+            futures = [
+                (batch, pool.submit(_encode_in_worker, [texts[i] for i in batch], self.batch_size, self.normalize))
+                for batch in batches
+            ]
+            for batch, future in futures:
+                for i, vector in zip(batch, future.result()):
+                    vectors[i] = vector
+        else:
+            for batch in batches:
+                encoded = self.model.encode(
+                    [texts[i] for i in batch], batch_size=self.batch_size,
+                    normalize_embeddings=self.normalize, convert_to_numpy=True,
+                )
+                for i, vector in zip(batch, encoded.tolist()):
+                    vectors[i] = vector
+        return vectors
+
+    def _encode_cached(self, texts):
+        texts = list(texts)
+        if self.cache is None:
+            return self._encode(texts)
+        vectors = self.cache.get_many(self.model_name, texts)
+        missing = [i for i, vector in enumerate(vectors) if vector is None]
+        if missing:
+            computed = self._encode([texts[i] for i in missing])
+            self.cache.put_many(self.model_name, [texts[i] for i in missing], computed)
+            for i, vector in zip(missing, computed):
+                vectors[i] = vector
+        return vectors
+
+    def embed_documents(self, texts):
+        return self._encode_cached(texts)
+
+    def embed_query(self, text):
+        return self._encode_cached([text])[0]
+
+    def close(self) -> None:
+        with self._lock:
+            if self._pool is not None:
+                self._pool.shutdown()
+                self._pool = None
+
+
+def benchmark(texts, model_name: str = DEFAULT_MODEL, batch_sizes=(16, 32, 64), worker_counts=(1, 2)):
+    """
+    (배치 크기, 워커 수) 조합마다 embeddings/sec를 측정합니다.
+    모델 로딩 시간은 빼고 인코딩 시간만 잽니다.
+    """
+    results = []
+    for workers in worker_counts:
+        for batch_size in batch_sizes:
+            engine = EmbeddingEngine(model_name, batch_size=batch_size, workers=workers)
+            try:
+                # 워커 기동/모델 로딩을 측정에서 빼기 위한 예열
+                engine.embed_documents(texts[:batch_size * workers])
+                started = time.perf_counter()
+                engine.embed_documents(texts)
+                seconds = time.perf_counter() - started
+            finally:
+                engine.close()
+            results.append({
+                "batch_size": batch_size,
+                "workers": workers,
+                "seconds": round(seconds, 3),
+                "embeddings_per_sec": round(len(texts) / seconds, 1) if seconds else 0.0,
+            })
+    return results
+
+
+def _benchmark_texts(pdf_path: str):
+    from rag_ingest import iter_pages, make_splitter, split_page
+
+    splitter = make_splitter()
+    return [chunk.page_content for page in iter_pages(pdf_path) for chunk in split_page(page, splitter)]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="임베딩 엔진 벤치마크")
+    parser.add_argument("--benchmark", metavar="PDF", required=True, help="청크를 뽑아 올 PDF 경로")
+    parser.add_argument("--model", default=DEFAULT_MODEL)
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[16, 32, 64])
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2])
+    args = parser.parse_args()
+
+    chunks = _benchmark_texts(args.benchmark)
+    print(f"{len(chunks)} chunks from {args.benchmark}")
+    for row in benchmark(chunks, args.model, args.batch_sizes, args.workers):
+        print(f"batch={row['batch_size']:>4} workers={row['workers']:>2} "
+              f"{row['seconds']:>8.2f}s {row['embeddings_per_sec']:>8.1f} emb/s")
@@ -0,0 +1,233 @@
+# -*- coding: utf-8 -*-
+"""
+버전이 붙은 인덱스 아티팩트 (PDF → 청크 + 벡터 + 메타데이터)
+- 빌드는 python build_index.py 로 배포 전에 오프라인에서 실행
+- indexes/<이름>/<버전>/ 아래에 manifest.json, chunks.jsonl, vectors.npy(float32)를 쓰고
+  indexes/<이름>/CURRENT 에 현재 버전을 기록
+- 앱은 vectors.npy를 memory-map으로 열기만 하므로 요청 중에 임베딩을 계산하지 않음
+- 다시 빌드할 때는 이전 버전과 페이지 해시를 비교해서 바뀐 페이지의 청크만 임베딩
+- 새 버전을 쓰고 나면 최근 keep개(INDEX_KEEP_VERSIONS, 기본 3)만 남기고 예전 버전 폴더는 지움
+"""
+
+import json
+import os
+import shutil
+import time
+import uuid
+from dataclasses import dataclass
+from datetime import datetime
+
+import numpy as np
+
+from rag_ingest import (
+    IngestStats,
+    file_sha256,
+    ingest_settings,
+    iter_pages,
+    make_splitter,
+    sha256_text,
+    split_page,
+)
+
+INDEX_ROOT = "./indexes"
+ARTIFACT_FORMAT = 1
+KEEP_VERSIONS = int(os.environ.get("INDEX_KEEP_VERSIONS", 3))
+
+
+@dataclass
+class IndexArtifact:
+    name: str
+    version: str
+    path: str
+    manifest: dict
+    vectors: np.ndarray
+    _ids: list = None
+    _texts: list = None
+    _metadatas: list = None
+    _rows: dict = None
+
+    def _load_chunks(self) -> None:
+        # 청크 텍스트는 Chroma를 갱신하거나 다시 빌드할 때만 필요하므로 처음 쓸 때 읽음
+        if self._ids is None:
+            with open(os.path.join(self.path, "chunks.jsonl"), "r", encoding="utf-8") as f:
+                chunks = [json.loads(line) for line in f]
+            self._ids = [chunk["id"] for chunk in chunks]
+            self._texts = [chunk["text"] for chunk in chunks]
+            self._metadatas = [chunk["metadata"] for chunk in chunks]
+            self._rows = {chunk_id: i for i, chunk_id in enumerate(self._ids)}
+
+    @property
+    def ids(self):
+        self._load_chunks()
+        return self._ids
+
+    @property
+    def texts(self):
+        self._load_chunks()
+        return self._texts
+
+    @property
+    def metadatas(self):
+        self._load_chunks()
+        return self._metadatas
+
+    def row(self, chunk_id: str) -> int:
+        self._load_chunks()
+        return self._rows[chunk_id]
+
+
+def current_version(name: str, index_root: str = INDEX_ROOT):
+    pointer = os.path.join(index_root, name, "CURRENT")
+    if not os.path.exists(pointer):
+        return None
+    with open(pointer, "r", encoding="utf-8") as f:
+        return f.read().strip() or None
+
+
+def load_index(name: str, index_root: str = INDEX_ROOT):
+    """
+    CURRENT가 가리키는 버전을 엽니다. 벡터는 memory-map이라 실제로 읽기 전까지 메모리를 쓰지 않습니다.
+    """
+    version = current_version(name, index_root)
+    if version is None:
+        return None
+    path = os.path.join(index_root, name, version)
+    with open(os.path.join(path, "manifest.json"), "r", encoding="utf-8") as f:
+        manifest = json.load(f)
+    if manifest.get("format") != ARTIFACT_FORMAT:
+        return None
+    vectors = np.load(os.path.join(path, "vectors.npy"), mmap_mode="r")
+    return IndexArtifact(name=name, version=version, path=path, manifest=manifest, vectors=vectors)
+
+
+def list_versions(name: str, index_root: str = INDEX_ROOT):
+    """
+    다 쓰인 버전 폴더 이름을 오래된 것부터 (버전 이름이 빌드 시각으로 시작함)
+    """
+    root = os.path.join(index_root, name)
+    if not os.path.isdir(root):
+        return []
+    return sorted(entry for entry in os.listdir(root)
+                  if not entry.endswith(".tmp") and os.path.isdir(os.path.join(root, entry)))
+
+
+def prune_versions(name: str, index_root: str = INDEX_ROOT, keep: int = KEEP_VERSIONS):
+    """
+    최근 keep개와 CURRENT 버전만 남기고 지운 버전 이름을 돌려줍니다.
+    (이미 예전 버전을 memory-map으로 연 프로세스는 파일이 지워져도 계속 읽을 수 있음)
+    """
+    current = current_version(name, index_root)
+    versions = list_versions(name, index_root)
+    removed = [version for version in versions[:max(0, len(versions) - keep)] if version != current]
+    for version in removed:
+        shutil.rmtree(os.path.join(index_root, name, version), ignore_errors=True)
+    return removed
+
+
+def _write_artifact(name, index_root, manifest, rows, vectors, keep: int = KEEP_VERSIONS) -> str:
+    # 같은 초에 두 번 빌드해도 겹치지 않고 이름순 = 빌드순이 되도록 마이크로초까지
+    version = datetime.now().strftime("%Y%m%d-%H%M%S-%f") + "-" + manifest["file_hash"][:8]
+    final_path = os.path.join(index_root, name, version)
+    if os.path.exists(final_path):
+        version += "-" + uuid.uuid4().hex[:6]
+        final_path = os.path.join(index_root, name, version)
+    tmp_path = final_path + ".tmp"
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    os.makedirs(tmp_path)
+    with open(os.path.join(tmp_path, "chunks.jsonl"), "w", encoding="utf-8") as f:
+        for chunk_id, text, metadata in rows:
+            f.write(json.dumps({"id": chunk_id, "text": text, "metadata": metadata}, ensure_ascii=False) + "\n")
+    np.save(os.path.join(tmp_path, "vectors.npy"), vectors)
+    with open(os.path.join(tmp_path, "manifest.json"), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=1)
+    os.replace(tmp_path, final_path)
+
+    # 다 쓴 다음에 CURRENT를 바꿔서, 앱이 반쯤 쓰인 버전을 여는 일이 없도록
+    pointer = os.path.join(index_root, name, "CURRENT")
+    with open(pointer + ".tmp", "w", encoding="utf-8") as f:
+        f.write(version)
+    os.replace(pointer + ".tmp", pointer)
+    prune_versions(name, index_root, keep)
+    return version
+
+
+def build_index(pdf_path: str, name: str, engine, index_root: str = INDEX_ROOT,
+                workers: int = None, force: bool = False, progress=None, keep: int = KEEP_VERSIONS) -> IndexArtifact:
+    """
+    PDF로 인덱스 아티팩트를 만들고 CURRENT로 지정합니다.
+    - PDF와 설정이 현재 버전과 같으면 (force가 아니면) 그대로 돌려줌
+    - 이전 버전과 해시가 같은 페이지는 청크/벡터를 그대로 가져오고, 나머지만 engine으로 임베딩
+    - 페이지가 도착하는 대로 청크를 모아 engine 배치 크기 × 워커 수 단위로 임베딩에 넘김
+    - 새 버전을 쓴 뒤 최근 keep개 버전만 남김
+    """
+    settings = ingest_settings(engine.model_name)
+    file_hash = file_sha256(pdf_path)
+    previous = load_index(name, index_root)
+    if previous is not None and not force and previous.manifest["file_hash"] == file_hash \
+            and previous.manifest["settings"] == settings:
+        return previous
+    reusable = previous if previous is not None and previous.manifest["settings"] == settings else None
+
+    splitter = make_splitter()
+    stats = IngestStats()
+    feed_size = engine.batch_size * engine.workers * 2
+    pages = {}
+    rows = {}
+    vectors = {}
+    pending = []
+
+    def flush():
+        computed = engine.embed_documents([rows[chunk_id][1] for chunk_id in pending])
+        for chunk_id, vector in zip(pending, computed):
+            vectors[chunk_id] = vector
+        pending.clear()
+        if progress:
+            progress(stats)
+
+    for page in iter_pages(pdf_path, workers):
+        stats.pages += 1
+        key = str(page.metadata["page"])
+        page_hash = sha256_text(page.page_content)
+        old = reusable.manifest["pages"].get(key) if reusable is not None else None
+        if old is not None and old["hash"] == page_hash:
+            pages[key] = old
+            for chunk_id in old["chunks"]:
+                i = reusable.row(chunk_id)
+                rows[chunk_id] = (chunk_id, reusable.texts[i], reusable.metadatas[i])
+                vectors[chunk_id] = reusable.vectors[i]
+            continue
+        chunks = split_page(page, splitter)
+        stats.chunks += len(chunks)
+        pages[key] = {"hash": page_hash, "chunks": [c.metadata["chunk_id"] for c in chunks]}
+        for chunk in chunks:
+            chunk_id = chunk.metadata["chunk_id"]
+            rows[chunk_id] = (chunk_id, chunk.page_content, chunk.metadata)
+            pending.append(chunk_id)
+        if len(pending) >= feed_size:
+            flush()
+    if pending:
+        flush()
+    stats.stop()
+
+    # 페이지 → 청크 순서로 정렬해서 저장 (빌드마다 같은 순서)
+    ordered = [chunk_id for key in sorted(pages, key=int) for chunk_id in pages[key]["chunks"]]
+    manifest = {
+        "format": ARTIFACT_FORMAT,
+        "name": name,
+        "source": pdf_path,
+        "file_hash": file_hash,
+        "settings": settings,
+        "count": len(ordered),
+        "pages": pages,
+        "built_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "build": {
+            "seconds": round(stats.elapsed, 2),
+            "embedded": stats.chunks,
+            "reused": len(ordered) - stats.chunks,
+            "pages_per_sec": round(stats.pages_per_sec, 1),
+            "chunks_per_sec": round(stats.chunks_per_sec, 1),
+        },
+    }
+    matrix = np.asarray([vectors[chunk_id] for chunk_id in ordered], dtype=np.float32)
+    _write_artifact(name, index_root, manifest, [rows[chunk_id] for chunk_id in ordered], matrix, keep)
+    return load_index(name, index_root)
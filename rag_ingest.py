@@ -0,0 +1,232 @@
+# -*- coding: utf-8 -*-
+"""
+PDF → 청크 → Chroma 적재에 쓰는 공통 단계
+- 페이지 텍스트 추출은 프로세스 풀에서 병렬로, 도착하는 순서대로 바로 청크 분할
+- 페이지/청크마다 해시와 고정 ID를 붙여서 바뀐 부분만 다시 임베딩할 수 있게 함 (rag_index)
+- Chroma 컬렉션은 빌드된 인덱스 아티팩트와 청크 ID를 비교해서 달라진 것만 반영
+"""
+
+import hashlib
+import json
+import multiprocessing
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from dataclasses import dataclass, field
+
+from langchain_core.documents import Document
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+from lazy_imports import lazy_import
+
+# PDF는 인덱스를 만들 때만 읽으므로 pypdf는 그때 import
+pypdf = lazy_import("pypdf")
+
+MANIFEST_VERSION = 2
+CHUNK_SIZE = 1000
+CHUNK_OVERLAP = 200
+ADD_BATCH_SIZE = 64
+PAGES_PER_TASK = 8
+
+
+def sha256_text(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def manifest_path_for(persist_directory: str, collection_name: str) -> str:
+    return os.path.join(persist_directory, f"{collection_name}.manifest.json")
+
+
+def load_manifest(path: str):
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        # 깨진 매니페스트는 없는 것으로 보고 전체 재적재
+        return None
+
+
+def save_manifest(path: str, manifest: dict) -> None:
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=1)
+    os.replace(tmp_path, path)
+
+
+def current_chunk_ids(manifest_path: str) -> set:
+    # 매니페스트 기준으로 지금 벡터 DB에 들어 있는 청크 ID 전체
+    manifest = load_manifest(manifest_path) or {}
+    return set(manifest.get("chunk_ids", []))
+
+
+def make_splitter() -> RecursiveCharacterTextSplitter:
+    return RecursiveCharacterTextSplitter(chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP)
+
+
+def ingest_settings(embedding_model: str) -> dict:
+    # 이 값들이 바뀌면 기존 벡터를 재사용할 수 없으므로 전체 재적재
+    return {
+        "version": MANIFEST_VERSION,
+        "embedding_model": embedding_model,
+        "chunk_size": CHUNK_SIZE,
+        "chunk_overlap": CHUNK_OVERLAP,
+    }
+
+
+def _extract_pages(file_path: str, page_numbers):
+    # 프로세스 풀 워커: 각자 PDF를 열어서 맡은 페이지만 텍스트 추출
+    reader = pypdf.PdfReader(file_path)
+    return [(n, reader.pages[n].extract_text() or "") for n in page_numbers]
+
+
+def iter_pages(file_path: str, workers: int = None):
+    """
+    PDF 페이지를 프로세스 풀에서 추출하고, 끝나는 대로 Document로 돌려줍니다.
+    (페이지 순서는 보장하지 않음, 메타데이터는 PyPDFLoader와 동일하게 source/page)
+    """
+    page_count = len(pypdf.PdfReader(file_path).pages)
+    tasks = [range(start, min(start + PAGES_PER_TASK, page_count))
+             for start in range(0, page_count, PAGES_PER_TASK)]
+    workers = workers or int(os.environ.get("INGEST_WORKERS", 0)) or os.cpu_count() or 1
+    workers = min(workers, len(tasks))
+
+    def to_documents(extracted):
+        for page_no, text in extracted:
+            yield Document(page_content=text, metadata={"source": file_path, "page": page_no})
+
+    if workers <= 1:
+        for page_numbers in tasks:
+            yield from to_documents(_extract_pages(file_path, page_numbers))
+        return
+
+    # Streamlit 서버 안(게이트웨이/워밍업 스레드가 도는 중)에서도 불리므로 fork 대신 spawn으로 워커를 띄움
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+        # 추출 결과가 메모리에 쌓이지 않도록 동시에 돌리는 작업 수를 워커의 2배로 제한
+        pending = set()
+        queued = iter(tasks)
+        while True:
+            while len(pending) < workers * 2:
+                page_numbers = next(queued, None)
+                if page_numbers is None:
+                    break
+                pending.add(pool.submit(_extract_pages, file_path, list(page_numbers)))
+            if not pending:
+                break
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield from to_documents(future.result())
+
+
+def split_page(page, splitter):
+    """
+    한 페이지를 청크로 나누고, 청크마다 해시와 고정 ID를 메타데이터에 붙입니다.
+    """
+    chunks = splitter.split_documents([page])
+    source = page.metadata.get("source", "")
+    page_no = page.metadata.get("page", 0)
+    for index, chunk in enumerate(chunks):
+        chunk_hash = sha256_text(chunk.page_content)
+        chunk.metadata["chunk_index"] = index
+        chunk.metadata["chunk_hash"] = chunk_hash
+        chunk.metadata["chunk_id"] = sha256_text(f"{source}|{page_no}|{index}|{chunk_hash}")[:32]
+    return chunks
+
+
+@dataclass
+class IngestStats:
+    pages: int = 0
+    chunks: int = 0
+    started: float = field(default_factory=time.perf_counter)
+    elapsed: float = 0.0
+
+    def stop(self) -> None:
+        self.elapsed = time.perf_counter() - self.started
+
+    @property
+    def pages_per_sec(self) -> float:
+        return self.pages / self.elapsed if self.elapsed else 0.0
+
+    @property
+    def chunks_per_sec(self) -> float:
+        return self.chunks / self.elapsed if self.elapsed else 0.0
+
+
+@dataclass
+class SyncResult:
+    added: int = 0
+    deleted: int = 0
+    unchanged: int = 0
+    reset: bool = False
+
+    @property
+    def changed(self) -> bool:
+        return self.reset or self.added > 0 or self.deleted > 0
+
+
+def _delete_ids(vectorstore, ids) -> None:
+    ids = list(ids)
+    for start in range(0, len(ids), ADD_BATCH_SIZE * 8):
+        vectorstore.delete(ids=ids[start:start + ADD_BATCH_SIZE * 8])
+
+
+def sync_from_artifact(vectorstore, artifact, manifest_path: str, progress=None,
+                       batch_size: int = ADD_BATCH_SIZE) -> SyncResult:
+    """
+    빌드된 인덱스 아티팩트(rag_index.IndexArtifact)로 Chroma 컬렉션을 맞춥니다.
+    - 매니페스트의 아티팩트 버전이 같으면 아무것도 읽지 않고 바로 반환
+    - 새로 생긴 청크는 아티팩트에 미리 계산된 벡터를 그대로 upsert (모델 계산 없음)
+    - 아티팩트에서 사라진 청크는 삭제
+    - progress(완료 수, 전체 수)는 배치가 하나 저장될 때마다 호출
+    """
+    settings = artifact.manifest["settings"]
+    manifest = load_manifest(manifest_path)
+    result = SyncResult()
+
+    if manifest is None or manifest.get("settings") != settings:
+        # 매니페스트가 없던 예전 DB(무작위 ID)나 설정이 바뀐 경우: 컬렉션을 비우고 다시 적재
+        existing = vectorstore.get(include=[])["ids"]
+        if existing:
+            _delete_ids(vectorstore, existing)
+            result.deleted = len(existing)
+        manifest = {"settings": settings, "artifact_version": None, "chunk_ids": []}
+        result.reset = True
+
+    if manifest["artifact_version"] == artifact.version:
+        result.unchanged = len(manifest["chunk_ids"])
+        return result
+
+    old_ids = set(manifest["chunk_ids"])
+    new_rows = [i for i, chunk_id in enumerate(artifact.ids) if chunk_id not in old_ids]
+    for start in range(0, len(new_rows), batch_size):
+        rows = new_rows[start:start + batch_size]
+        vectorstore._collection.upsert(
+            ids=[artifact.ids[i] for i in rows],
+            embeddings=artifact.vectors[rows].tolist(),
+            documents=[artifact.texts[i] for i in rows],
+            metadatas=[artifact.metadatas[i] for i in rows],
+        )
+        if progress:
+            progress(start + len(rows), len(new_rows))
+
+    stale_ids = old_ids - set(artifact.ids)
+    if stale_ids:
+        _delete_ids(vectorstore, stale_ids)
+
+    result.added = len(new_rows)
+    result.deleted += len(stale_ids)
+    result.unchanged = len(artifact.ids) - len(new_rows)
+    manifest["artifact_version"] = artifact.version
+    manifest["chunk_ids"] = list(artifact.ids)
+    save_manifest(manifest_path, manifest)
+    return result
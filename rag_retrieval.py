@@ -0,0 +1,329 @@
+# -*- coding: utf-8 -*-
+"""
+검색 단계 구성 요소
+- 질문 재작성(standalone question) LLM 호출을 필요할 때만 하는 history-aware retriever
+- 한국어 역색인(BM25) + Chroma 벡터 검색을 RRF로 합치는 하이브리드 검색기
+- 검색된 청크의 겹침을 제거하고 토큰 예산에 맞춰 자르는 컨텍스트 패커
+"""
+
+import hashlib
+import json
+import logging
+import math
+import os
+import re
+import threading
+from collections import Counter, defaultdict
+
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.output_parsers import StrOutputParser
+from langchain_core.retrievers import BaseRetriever
+from langchain_core.runnables import RunnableLambda
+from langchain_core.vectorstores import VectorStore
+
+from token_budget import estimate_tokens, truncate_to_tokens
+
+logger = logging.getLogger(__name__)
+
+BM25_INDEX_VERSION = 1
+DEFAULT_CONTEXT_TOKEN_BUDGET = 1500
+MAX_CHUNK_OVERLAP = 200
+MIN_OVERLAP_MATCH = 20
+MIN_TRIMMED_TOKENS = 50
+
+# 앞 대화를 가리키는 표현: 이런 말이 있으면 질문만으로는 뜻이 완결되지 않음
+_FOLLOW_UP = re.compile(
+    r"(?:^|\s)(?:그|이|저)(?:거|것|건|게|걸|곳|때|럼|러면|렇다면|래서|런데)?(?=\s|$|[?.!,])"
+    r"|(?:^|\s)(?:거기|아까|방금|위에서|앞에서|또|해당)"
+    r"|\b(?:it|that|this|those|they|them)\b",
+    re.IGNORECASE,
+)
+MIN_STANDALONE_CHARS = 8
+
+
+def needs_rewrite(question: str) -> bool:
+    """
+    지시어/접속어로 앞 대화를 가리키거나 너무 짧은 질문이면 재작성이 필요하다고 봅니다.
+    """
+    text = question.strip()
+    if len(text) < MIN_STANDALONE_CHARS:
+        return True
+    return bool(_FOLLOW_UP.search(text))
+
+
+class RewriteStats:
+    def __init__(self):
+        self.skipped = 0
+        self.rewritten = 0
+        self._lock = threading.Lock()
+
+    def record(self, rewritten: bool) -> None:
+        with self._lock:
+            if rewritten:
+                self.rewritten += 1
+            else:
+                self.skipped += 1
+
+    @property
+    def skip_rate(self) -> float:
+        total = self.skipped + self.rewritten
+        return self.skipped / total if total else 0.0
+
+
+class PackStats:
+    """
+    컨텍스트 패커가 줄인 토큰 수 누적 (요청마다 로그에도 남김)
+    """
+
+    def __init__(self):
+        self.requests = 0
+        self.tokens_before = 0
+        self.tokens_after = 0
+        self._lock = threading.Lock()
+
+    def record(self, before: int, after: int) -> None:
+        with self._lock:
+            self.requests += 1
+            self.tokens_before += before
+            self.tokens_after += after
+
+    @property
+    def avg_saved(self) -> float:
+        return (self.tokens_before - self.tokens_after) / self.requests if self.requests else 0.0
+
+
+def build_history_aware_retriever(llm, retriever, rewrite_prompt, stats: RewriteStats = None,
+                                  history_key: str = "history"):
+    """
+    create_history_aware_retriever 대체.
+    - 대화 기록이 없으면 질문을 그대로 검색
+    - 기록이 있어도 needs_rewrite()가 False면 재작성 없이 검색
+    - 나머지만 rewrite_prompt | llm 으로 독립 질문을 만든 뒤 검색
+    """
+    stats = stats if stats is not None else RewriteStats()
+    rewrite_then_retrieve = rewrite_prompt | llm | StrOutputParser() | retriever
+    retrieve_directly = RunnableLambda(lambda inputs: inputs["input"]) | retriever
+
+    def route(inputs):
+        rewrite = bool(inputs.get(history_key)) and needs_rewrite(inputs["input"])
+        stats.record(rewrite)
+        return rewrite_then_retrieve if rewrite else retrieve_directly
+
+    return RunnableLambda(route).with_config(run_name="history_aware_retriever")
+
+
+_WORD = re.compile(r"[0-9a-z가-힣]+")
+_RUN = re.compile(r"[가-힣]+|[0-9]+|[a-z]+")
+_THOUSANDS = re.compile(r"(?<=\d),(?=\d{3})")
+
+
+def tokenize_ko(text: str):
+    """
+    형태소 분석기 없이 쓰는 한국어 토크나이저.
+    어절 전체 + 숫자 덩어리 + 한글 글자 bigram을 토큰으로 씁니다.
+    ("연체료는" → 연체료는, 연체, 체료, 료는 / "제12조" → 제12조, 12)
+    조사가 붙어 있어도 bigram이 겹치기 때문에 "연체료" 같은 정확한 용어가 잡힙니다.
+    """
+    tokens = []
+    for word in _WORD.findall(_THOUSANDS.sub("", text.lower())):
+        tokens.append(word)
+        runs = _RUN.findall(word)
+        for run in runs:
+            if run[0] in "0123456789":
+                if len(runs) > 1:
+                    tokens.append(run)
+            elif "가" <= run[0] <= "힣" and len(run) >= 2:
+                tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+    return tokens
+
+
+def chunk_fingerprint(chunk_ids) -> str:
+    # 벡터 DB 청크 구성이 바뀌었는지 확인하는 용도 (정렬한 청크 ID의 해시)
+    return hashlib.sha256("\n".join(sorted(chunk_ids)).encode("utf-8")).hexdigest()
+
+
+class BM25Index:
+    """
+    청크 텍스트에 대한 BM25 역색인입니다. JSON으로 저장/로드해서 시작 시 다시 만들 필요가 없습니다.
+    """
+
+    def __init__(self, ids, texts, metadatas, lengths, postings, fingerprint: str = "", k1: float = 1.5, b: float = 0.75):
+        self.ids = ids
+        self.texts = texts
+        self.metadatas = metadatas
+        self.lengths = lengths
+        self.postings = postings
+        self.fingerprint = fingerprint
+        self.k1 = k1
+        self.b = b
+        self.avg_length = sum(lengths) / len(lengths) if lengths else 0.0
+        self._position = {chunk_id: i for i, chunk_id in enumerate(ids)}
+
+    @classmethod
+    def build(cls, ids, texts, metadatas, fingerprint: str = ""):
+        postings = defaultdict(list)
+        lengths = []
+        for i, text in enumerate(texts):
+            counts = Counter(tokenize_ko(text))
+            lengths.append(sum(counts.values()))
+            for term, tf in counts.items():
+                postings[term].append([i, tf])
+        return cls(list(ids), list(texts), list(metadatas), lengths, dict(postings), fingerprint)
+
+    def search(self, query: str, k: int = 20):
+        """
+        (chunk_id, 점수) 리스트를 점수 높은 순으로 돌려줍니다.
+        """
+        n = len(self.ids)
+        scores = defaultdict(float)
+        for term in set(tokenize_ko(query)):
+            posting = self.postings.get(term)
+            if not posting:
+                continue
+            idf = math.log(1 + (n - len(posting) + 0.5) / (len(posting) + 0.5))
+            for i, tf in posting:
+                norm = self.k1 * (1 - self.b + self.b * self.lengths[i] / (self.avg_length or 1))
+                scores[i] += idf * tf * (self.k1 + 1) / (tf + norm)
+        ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:k]
+        return [(self.ids[i], score) for i, score in ranked]
+
+    def document(self, chunk_id: str) -> Document:
+        i = self._position[chunk_id]
+        return Document(page_content=self.texts[i], metadata=self.metadatas[i])
+
+    def save(self, path: str) -> None:
+        data = {
+            "version": BM25_INDEX_VERSION,
+            "fingerprint": self.fingerprint,
+            "ids": self.ids,
+            "texts": self.texts,
+            "metadatas": self.metadatas,
+            "lengths": self.lengths,
+            "postings": self.postings,
+        }
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str):
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if data.get("version") != BM25_INDEX_VERSION:
+            return None
+        return cls(data["ids"], data["texts"], data["metadatas"], data["lengths"], data["postings"], data["fingerprint"])
+
+
+def bm25_index_path_for(persist_directory: str, collection_name: str) -> str:
+    return os.path.join(persist_directory, f"{collection_name}.bm25.json")
+
+
+def load_or_build_bm25(vectorstore, path: str, chunk_ids) -> BM25Index:
+    """
+    저장된 역색인이 지금 벡터 DB 청크와 같으면 그대로 로드, 다르면 Chroma에서 청크를 읽어 다시 만듭니다.
+    """
+    fingerprint = chunk_fingerprint(chunk_ids)
+    index = BM25Index.load(path)
+    if index is not None and index.fingerprint == fingerprint:
+        return index
+    stored = vectorstore.get(include=["documents", "metadatas"])
+    index = BM25Index.build(stored["ids"], stored["documents"], stored["metadatas"], fingerprint)
+    index.save(path)
+    return index
+
+
+class HybridRetriever(BaseRetriever):
+    """
+    Chroma 유사도 검색 결과와 BM25 결과를 Reciprocal Rank Fusion으로 합칩니다.
+    조문 번호, 금액, "연체료" 같은 정확한 용어는 BM25가, 바꿔 말한 질문은 벡터 검색이 잡습니다.
+    """
+
+    vectorstore: VectorStore
+    index: BM25Index
+    k: int = 4
+    fetch_k: int = 20
+    rrf_k: int = 60
+
+    class Config:
+        arbitrary_types_allowed = True
+
+    def _get_relevant_documents(self, query: str, *, run_manager: CallbackManagerForRetrieverRun):
+        scores = defaultdict(float)
+        docs = {}
+        for rank, doc in enumerate(self.vectorstore.similarity_search(query, k=self.fetch_k)):
+            chunk_id = doc.metadata.get("chunk_id") or doc.page_content
+            scores[chunk_id] += 1.0 / (self.rrf_k + rank + 1)
+            docs[chunk_id] = doc
+        for rank, (chunk_id, _) in enumerate(self.index.search(query, self.fetch_k)):
+            scores[chunk_id] += 1.0 / (self.rrf_k + rank + 1)
+            if chunk_id not in docs:
+                docs[chunk_id] = self.index.document(chunk_id)
+        ranked = sorted(scores, key=scores.get, reverse=True)[:self.k]
+        return [docs[chunk_id] for chunk_id in ranked]
+
+
+def _overlap_length(left: str, right: str, max_overlap: int = MAX_CHUNK_OVERLAP) -> int:
+    # left의 끝과 right의 시작이 겹치는 가장 긴 길이 (짧은 우연 일치는 무시)
+    for size in range(min(len(left), len(right), max_overlap), MIN_OVERLAP_MATCH - 1, -1):
+        if left.endswith(right[:size]):
+            return size
+    return 0
+
+
+def _chunk_ids(doc):
+    return doc.metadata.get("chunk_ids") or [doc.metadata.get("chunk_id")]
+
+
+def pack_documents(docs, token_budget: int = DEFAULT_CONTEXT_TOKEN_BUDGET, stats: PackStats = None):
+    """
+    검색된 청크를 프롬프트에 넣기 전에 정리합니다.
+    1) 같은 페이지의 청크는 chunk_index 순으로 하나로 합치고, 이웃 청크끼리 겹치는 부분(overlap)은 한 번만 남김
+    2) 검색 순위가 높은 페이지부터 token_budget 안에 들어가는 만큼만 남기고 마지막 것은 잘라냄
+    """
+    groups = {}
+    for doc in docs:
+        key = (doc.metadata.get("source"), doc.metadata.get("page"))
+        groups.setdefault(key, []).append(doc)
+
+    merged = []
+    for group in groups.values():
+        group.sort(key=lambda d: d.metadata.get("chunk_index", 0))
+        text = group[0].page_content
+        for doc in group[1:]:
+            overlap = _overlap_length(text, doc.page_content)
+            text += doc.page_content[overlap:] if overlap else "\n\n" + doc.page_content
+        metadata = dict(group[0].metadata)
+        metadata["chunk_ids"] = [cid for doc in group for cid in _chunk_ids(doc)]
+        merged.append(Document(page_content=text, metadata=metadata))
+
+    packed = []
+    remaining = token_budget
+    for doc in merged:
+        tokens = estimate_tokens(doc.page_content)
+        if tokens > remaining:
+            if remaining >= MIN_TRIMMED_TOKENS:
+                text = truncate_to_tokens(doc.page_content, remaining)
+                packed.append(Document(page_content=text, metadata=doc.metadata))
+            break
+        packed.append(doc)
+        remaining -= tokens
+
+    before = sum(estimate_tokens(doc.page_content) for doc in docs)
+    after = sum(estimate_tokens(doc.page_content) for doc in packed)
+    logger.info("context packed: %d chunks -> %d blocks, %d -> %d tokens (saved %d)",
+                len(docs), len(packed), before, after, before - after)
+    if stats is not None:
+        stats.record(before, after)
+    return packed
+
+
+def context_packer(token_budget: int = DEFAULT_CONTEXT_TOKEN_BUDGET, stats: PackStats = None):
+    # retriever 뒤에 붙여서 create_stuff_documents_chain에 들어갈 문서를 줄이는 Runnable
+    return RunnableLambda(lambda docs: pack_documents(docs, token_budget, stats)).with_config(run_name="context_packer")
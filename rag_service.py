@@ -0,0 +1,203 @@
+# -*- coding: utf-8 -*-
+"""
+여러 PDF 코퍼스를 한 프로세스에서 서비스하는 RAG 코어
+- 코퍼스마다 Chroma 컬렉션, BM25 색인, 답변 캐시를 따로 둠
+- 임베딩 모델(EmbeddingEngine 하나)과 모델별 LLM 클라이언트는 모든 코퍼스가 공유
+- 요청마다 코퍼스 이름으로 체인을 골라 씀 (코퍼스는 처음 요청될 때 열림)
+- langchain 체인/langchain_chroma(chromadb)는 코퍼스를 처음 열 때 import
+"""
+
+import sys
+import threading
+
+from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
+
+from corpora import CORPORA
+from lazy_imports import lazy_import
+from llm_resilience import ResilientLLM, fallback_models
+from rag_cache import SemanticAnswerCache
+from rag_index import INDEX_ROOT, build_index, load_index
+from rag_ingest import current_chunk_ids, manifest_path_for, sync_from_artifact
+from rag_retrieval import (
+    DEFAULT_CONTEXT_TOKEN_BUDGET,
+    HybridRetriever,
+    PackStats,
+    RewriteStats,
+    bm25_index_path_for,
+    build_history_aware_retriever,
+    context_packer,
+    load_or_build_bm25,
+)
+
+PERSIST_DIRECTORY = "./chroma_db"
+
+
+def _use_pysqlite3():
+    # chromadb는 최신 sqlite3가 필요하므로 langchain_chroma를 처음 import하기 직전에 pysqlite3로 바꿈
+    __import__('pysqlite3')
+    sys.modules['sqlite3'] = sys.modules.pop('pysqlite3')
+
+
+langchain_chroma = lazy_import("langchain_chroma", setup=_use_pysqlite3)
+retrieval_chains = lazy_import("langchain.chains.retrieval")
+combine_documents = lazy_import("langchain.chains.combine_documents")
+
+# 채팅 히스토리 요약 시스템 프롬프트
+CONTEXTUALIZE_Q_SYSTEM_PROMPT = """Given a chat history and the latest user question \
+which might reference context in the chat history, formulate a standalone question \
+which can be understood without the chat history. Do NOT answer the question, \
+just reformulate it if needed and otherwise return it as is."""
+
+# 질문-답변 시스템 프롬프트
+QA_SYSTEM_PROMPT = """You are an assistant for question-answering tasks. \
+Use the following pieces of retrieved context to answer the question. \
+If you don't know the answer, just say that you don't know. \
+Keep the answer perfect. please use imogi with the answer.
+대답은 한국어로 하고, 존댓말을 써줘.\
+
+{context}"""
+
+
+class _CorpusState:
+    def __init__(self, corpus):
+        self.corpus = corpus
+        self.lock = threading.Lock()
+        self.vectorstore = None
+        self.bm25 = None
+
+
+class RagService:
+    """
+    engine: 모든 코퍼스가 함께 쓰는 EmbeddingEngine (모델은 프로세스에 하나만 로드)
+    gateway: 모델별 공용 LLM 클라이언트를 가진 LLMGateway
+    model_options: 폴백 순서를 정할 모델 목록 (앱의 selectbox 옵션)
+    """
+
+    def __init__(self, engine, gateway, corpora=None, model_options=(), persist_directory: str = PERSIST_DIRECTORY,
+                 index_root: str = INDEX_ROOT, context_token_budget: int = DEFAULT_CONTEXT_TOKEN_BUDGET):
+        self.engine = engine
+        self.gateway = gateway
+        self.model_options = tuple(model_options)
+        self.corpora = dict(corpora or CORPORA)
+        self.persist_directory = persist_directory
+        self.index_root = index_root
+        self.context_token_budget = context_token_budget
+        self.rewrite_stats = RewriteStats()
+        self.pack_stats = PackStats()
+        self._states = {name: _CorpusState(corpus) for name, corpus in self.corpora.items()}
+        self._chains = {}
+        self._answer_caches = {}
+        self._lock = threading.Lock()
+
+    def _state(self, name: str) -> _CorpusState:
+        try:
+            return self._states[name]
+        except KeyError:
+            raise KeyError(f"알 수 없는 코퍼스: {name}") from None
+
+    def _manifest_path(self, corpus) -> str:
+        return manifest_path_for(self.persist_directory, corpus.collection)
+
+    def vectorstore(self, name: str, progress=None, on_sync=None):
+        """
+        코퍼스의 Chroma 컬렉션을 열고 인덱스 아티팩트와 맞춥니다.
+        아티팩트가 없으면 같은 빌드 함수로 여기서 한 번 만들고, progress(stats)로 진행 상황을 알립니다.
+        처음 열 때만 on_sync(버전, SyncResult)를 호출합니다.
+        """
+        state = self._state(name)
+        with state.lock:
+            if state.vectorstore is None:
+                corpus = state.corpus
+                artifact = load_index(corpus.name, self.index_root)
+                if artifact is None:
+                    artifact = build_index(corpus.pdf_path, corpus.name, self.engine,
+                                           self.index_root, progress=progress)
+                vectorstore = langchain_chroma.Chroma(
+                    collection_name=corpus.collection,
+                    persist_directory=self.persist_directory,
+                    embedding_function=self.engine,
+                )
+                result = sync_from_artifact(vectorstore, artifact, self._manifest_path(corpus))
+                state.vectorstore = vectorstore
+                if on_sync is not None:
+                    on_sync(artifact.version, result)
+            return state.vectorstore
+
+    def bm25(self, name: str):
+        state = self._state(name)
+        vectorstore = self.vectorstore(name)
+        with state.lock:
+            if state.bm25 is None:
+                corpus = state.corpus
+                state.bm25 = load_or_build_bm25(
+                    vectorstore,
+                    bm25_index_path_for(self.persist_directory, corpus.collection),
+                    current_chunk_ids(self._manifest_path(corpus)),
+                )
+            return state.bm25
+
+    def llm(self, model: str):
+        # 모델별 클라이언트는 모든 코퍼스/세션이 공유, 호출은 재시도/헤징/폴백 계층을 거침
+        return ResilientLLM(fallback_models(model, self.model_options), temperature=0.7, gateway=self.gateway)
+
+    def chain(self, name: str, model: str):
+        """
+        코퍼스 + 모델 조합의 RAG 체인 (입력: input, history / 출력: answer, context)
+        """
+        key = (name, model)
+        if key in self._chains:
+            return self._chains[key]
+        vectorstore = self.vectorstore(name)
+        # 벡터 검색 + BM25 결과를 RRF로 합쳐서 조문 번호/금액/정확한 용어도 놓치지 않도록
+        retriever = HybridRetriever(vectorstore=vectorstore, index=self.bm25(name))
+        llm = self.llm(model)
+
+        contextualize_q_prompt = ChatPromptTemplate.from_messages(
+            [
+                ("system", CONTEXTUALIZE_Q_SYSTEM_PROMPT),
+                MessagesPlaceholder("history"),
+                ("human", "{input}"),
+            ]
+        )
+        qa_prompt = ChatPromptTemplate.from_messages(
+            [
+                ("system", QA_SYSTEM_PROMPT),
+                MessagesPlaceholder("history"),
+                ("human", "{input}"),
+            ]
+        )
+        # 대화 기록이 없거나 이미 독립적인 질문이면 재작성 LLM 호출 없이 바로 검색
+        history_aware_retriever = build_history_aware_retriever(
+            llm, retriever, contextualize_q_prompt, self.rewrite_stats
+        )
+        question_answer_chain = combine_documents.create_stuff_documents_chain(llm, qa_prompt)
+        # 같은 페이지 청크는 합치고 겹치는 200자는 한 번만, 전체는 토큰 예산 안으로
+        rag_chain = retrieval_chains.create_retrieval_chain(
+            history_aware_retriever | context_packer(self.context_token_budget, self.pack_stats),
+            question_answer_chain
+        )
+        with self._lock:
+            return self._chains.setdefault(key, rag_chain)
+
+    def answer_cache(self, name: str, model: str) -> SemanticAnswerCache:
+        # 답변은 코퍼스와 모델에 따라 다르므로 조합마다 따로, 세션끼리는 공유
+        self._state(name)
+        with self._lock:
+            key = (name, model)
+            if key not in self._answer_caches:
+                self._answer_caches[key] = SemanticAnswerCache(self.engine)
+            return self._answer_caches[key]
+
+    def context_is_current(self, name: str):
+        """
+        캐시된 답변의 참고 청크가 코퍼스에 그대로 있는지 확인하는 함수를 돌려줍니다.
+        """
+        manifest_path = self._manifest_path(self._state(name).corpus)
+
+        def is_current(context_ids):
+            valid_ids = current_chunk_ids(manifest_path)
+            return all(chunk_id in valid_ids for chunk_id in context_ids)
+        return is_current
+
+    def close(self) -> None:
+        self.engine.close()
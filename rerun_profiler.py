@@ -0,0 +1,186 @@
+# -*- coding: utf-8 -*-
+"""
+Streamlit 재실행(rerun) 비용 프로파일러
+- 켜는 법: 환경변수 RERUN_PROFILE=1 또는 URL에 ?profile=1 (꺼져 있으면 section()은 아무것도 안 함)
+- 스크립트 구간(lap: 직전 lap부터 지금까지 / section: with 블록), 캐시 적중/실패(count),
+  LLM/검색 시간(record)을 재실행 단위로 모음
+- 재실행이 끝나면 한 줄짜리 JSON으로 RERUN_PROFILE_LOG(기본 ./rerun_profile.jsonl)에 남김
+- 사이드바 패널(panel)에 앱별 구간 p50/p95 표시 (최근 PROFILE_WINDOW번 기준, 프로세스 공유)
+  + add_stats()로 등록한 공용 통계(LLM 게이트웨이/복원력, 지연 import 시간 등)도 같이 표시
+- st.rerun()/st.stop()으로 끝까지 못 간 재실행은 다음 재실행이 시작될 때 interrupted로 기록
+"""
+
+import contextlib
+import json
+import logging
+import os
+import threading
+import time
+from collections import defaultdict, deque
+
+from chat_session import SESSION_STATE_KEY, session_label
+
+logger = logging.getLogger(__name__)
+
+PROFILE_PARAM = "profile"
+PROFILE_ENABLED = os.environ.get("RERUN_PROFILE", "") not in ("", "0")
+PROFILE_LOG_PATH = os.environ.get("RERUN_PROFILE_LOG", "./rerun_profile.jsonl")
+PROFILE_WINDOW = 200
+TOTAL = "rerun"
+
+_SESSION_KEY = "__rerun_profile__"
+
+# 앱 -> 구간 -> 최근 소요 시간(초)
+_history = defaultdict(lambda: defaultdict(lambda: deque(maxlen=PROFILE_WINDOW)))
+_history_lock = threading.Lock()
+_log_lock = threading.Lock()
+# 패널에 같이 보여줄 통계: 이름 -> dict를 돌려주는 함수 (이 모듈은 가볍게 두려고 등록 방식)
+_stats_sources = {}
+
+
+def add_stats(name: str, source) -> None:
+    """
+    source() -> dict 를 프로파일 패널에 name으로 표시합니다. 같은 이름으로 다시 등록하면 바꿔 씀.
+    """
+    _stats_sources[name] = source
+
+
+def collect_stats() -> dict:
+    result = {}
+    for name, source in list(_stats_sources.items()):
+        try:
+            result[name] = source()
+        except Exception as e:
+            logger.warning("profile stats %s failed: %s", name, e)
+    return result
+
+
+def percentile(samples, q: float):
+    ordered = sorted(samples)
+    if not ordered:
+        return None
+    return ordered[int(q * (len(ordered) - 1))]
+
+
+class RerunProfile:
+    """
+    재실행 한 번의 측정 결과. 구간 이름이 같으면 시간을 더합니다.
+    평평한 Streamlit 스크립트에서는 블록을 들여쓰지 않도록 구간 끝마다 lap(이름)을 부르면 됩니다.
+    """
+
+    def __init__(self, app: str, session_id: str = None, enabled: bool = True):
+        self.app = app
+        self.session_id = session_id
+        self.enabled = enabled
+        self.started = time.perf_counter()
+        self.last = self.started
+        self.sections = defaultdict(float)
+        self.counters = defaultdict(int)
+        self.finished = False
+
+    @contextlib.contextmanager
+    def section(self, name: str):
+        if not self.enabled:
+            yield
+            return
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.last = time.perf_counter()
+            self.sections[name] += self.last - started
+
+    def lap(self, name: str) -> None:
+        if self.enabled:
+            now = time.perf_counter()
+            self.sections[name] += now - self.last
+            self.last = now
+
+    def record(self, name: str, seconds) -> None:
+        if self.enabled and seconds is not None:
+            self.sections[name] += seconds
+
+    def count(self, name: str, n: int = 1) -> None:
+        if self.enabled:
+            self.counters[name] += n
+
+    def finish(self, interrupted: bool = False) -> None:
+        """
+        재실행 전체 시간을 더해 로그 한 줄을 쓰고 p50/p95 기록에 넣습니다. 두 번 불러도 한 번만 기록.
+        """
+        if not self.enabled or self.finished:
+            return
+        self.finished = True
+        # 중간에 끊긴 재실행은 다음 재실행 시작이 아니라 마지막으로 측정한 시점까지
+        self.sections[TOTAL] = (self.last if interrupted else time.perf_counter()) - self.started
+        with _history_lock:
+            history = _history[self.app]
+            for name, seconds in self.sections.items():
+                history[name].append(seconds)
+        entry = {
+            "ts": time.time(),
+            "app": self.app,
+            "session_id": self.session_id,
+            "interrupted": interrupted,
+            "sections": {name: round(seconds, 4) for name, seconds in self.sections.items()},
+            "counters": dict(self.counters),
+        }
+        try:
+            with _log_lock, open(PROFILE_LOG_PATH, "a", encoding="utf-8") as f:
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        except OSError as e:
+            logger.warning("rerun profile log failed: %s", e)
+
+    def panel(self) -> None:
+        """
+        사이드바에 이 앱의 구간별 p50/p95와 이번 재실행의 카운터를 보여줍니다.
+        """
+        if not self.enabled:
+            return
+        import streamlit as st
+
+        rows = []
+        for name, samples in summary(self.app).items():
+            rows.append({"구간": name, "횟수": samples["n"], "p50 ms": samples["p50_ms"],
+                         "p95 ms": samples["p95_ms"], "이번 ms": round(self.sections.get(name, 0.0) * 1000, 1)})
+        with st.sidebar.expander("⏱️ 재실행 프로파일", expanded=True):
+            st.dataframe(rows, hide_index=True, use_container_width=True)
+            if self.counters:
+                st.caption(" · ".join(f"{name} {value}" for name, value in sorted(self.counters.items())))
+            for name, values in collect_stats().items():
+                st.caption(name)
+                st.json(values, expanded=False)
+
+
+def summary(app: str) -> dict:
+    """
+    구간 이름 -> {n, p50_ms, p95_ms}. 오래 걸린 구간부터.
+    """
+    with _history_lock:
+        snapshot = {name: list(samples) for name, samples in _history[app].items()}
+    result = {}
+    for name, samples in sorted(snapshot.items(), key=lambda item: -percentile(item[1], 0.5)):
+        result[name] = {
+            "n": len(samples),
+            "p50_ms": round(percentile(samples, 0.5) * 1000, 1),
+            "p95_ms": round(percentile(samples, 0.95) * 1000, 1),
+        }
+    return result
+
+
+def start(app: str, query_params=None, session_state=None) -> RerunProfile:
+    """
+    스크립트 맨 앞에서 호출합니다. 이전 재실행이 끝까지 가지 못했으면 그 기록부터 남깁니다.
+    """
+    enabled = PROFILE_ENABLED or (query_params is not None and query_params.get(PROFILE_PARAM) not in (None, "", "0"))
+    if session_state is not None:
+        previous = session_state.get(_SESSION_KEY)
+        if previous is not None and not previous.finished:
+            previous.finish(interrupted=True)
+    # 세션 id는 대화 기록을 여는 열쇠라서 로그에는 해시 앞부분만 남김
+    session_id = session_label(session_state.get(SESSION_STATE_KEY)) if session_state is not None else None
+    profile = RerunProfile(app, session_id, enabled)
+    if session_state is not None:
+        session_state[_SESSION_KEY] = profile
+    return profile
+
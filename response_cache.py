@@ -0,0 +1,136 @@
+# -*- coding: utf-8 -*-
+"""
+빠른 프롬프트 버튼용 응답 캐시
+- 키: (모델, temperature, 톤, 프롬프트, 함께 보낸 대화 기록 해시)
+- 키마다 답변 변형을 최대 variants개까지 모아두고 그중 하나를 골라 돌려줌 (매번 같은 답처럼 보이지 않게)
+- 캐시에서 답한 뒤 변형이 모자라면 게이트웨이로 하나 더 만들어 둠 (버튼 응답은 기다리지 않음)
+- 자주 누르는 버튼/톤 조합은 앱 시작 때 미리 채워둘 수 있음 (prewarm: 백그라운드에서 조금씩, 사용자 요청이 쓸
+  호출 속도 제한 몫은 남겨둠)
+- TTL이 지난 변형은 버림
+"""
+
+import hashlib
+import json
+import random
+import threading
+import time
+from collections import OrderedDict
+
+from llm_gateway import get_gateway
+
+DEFAULT_TTL_SECONDS = 6 * 60 * 60
+DEFAULT_VARIANTS = 3
+DEFAULT_MAX_KEYS = 256
+PREWARM_PARALLEL = 2
+PREWARM_INTERVAL = 1.0
+
+
+def history_hash(messages) -> str:
+    return hashlib.sha256(
+        json.dumps([[message.type, message.content] for message in messages], ensure_ascii=False).encode("utf-8")
+    ).hexdigest()[:16]
+
+
+class ResponseCache:
+    def __init__(self, ttl_seconds: float = DEFAULT_TTL_SECONDS, variants: int = DEFAULT_VARIANTS,
+                 max_keys: int = DEFAULT_MAX_KEYS, gateway=None):
+        self.ttl_seconds = ttl_seconds
+        self.variants = variants
+        self.max_keys = max_keys
+        self.gateway = gateway or get_gateway()
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._in_flight = set()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(model: str, temperature: float, tone: str, prompt: str, history_key: str = "") -> str:
+        raw = json.dumps([model, round(temperature, 2), tone, prompt, history_key], ensure_ascii=False)
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def _fresh(self, key: str, now: float):
+        entries = [entry for entry in self._entries.get(key, []) if now - entry[1] <= self.ttl_seconds]
+        if entries:
+            self._entries[key] = entries
+        else:
+            self._entries.pop(key, None)
+        return entries
+
+    def get(self, key: str):
+        """
+        저장된 변형 중 하나를 무작위로 돌려줍니다. 없으면 None.
+        """
+        with self._lock:
+            entries = self._fresh(key, time.time())
+            if not entries:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return random.choice(entries)[0]
+
+    def put(self, key: str, text: str) -> None:
+        if not text:
+            return
+        with self._lock:
+            entries = self._fresh(key, time.time())
+            if text not in (entry[0] for entry in entries):
+                entries.append((text, time.time()))
+            self._entries[key] = entries[-self.variants:]
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_keys:
+                self._entries.popitem(last=False)
+
+    def needs_variant(self, key: str) -> bool:
+        with self._lock:
+            return len(self._fresh(key, time.time())) < self.variants and key not in self._in_flight
+
+    def refresh(self, key: str, runnable, inputs, config=None):
+        """
+        runnable(inputs)로 변형을 하나 더 만들어 백그라운드에서 저장합니다. 이미 만드는 중이면 무시.
+        """
+        with self._lock:
+            if key in self._in_flight:
+                return None
+            self._in_flight.add(key)
+
+        def done(future):
+            with self._lock:
+                self._in_flight.discard(key)
+            if future.exception() is None:
+                self.put(key, future.result())
+
+        future = self.gateway.submit(runnable, inputs, config)
+        future.add_done_callback(done)
+        return future
+
+    def prewarm(self, jobs, runnable, config=None, max_parallel: int = PREWARM_PARALLEL,
+                interval: float = PREWARM_INTERVAL, ready=None) -> threading.Thread:
+        """
+        jobs의 (key, inputs)를 백그라운드 스레드에서 interval초에 하나씩, 동시에 max_parallel개까지만 채웁니다.
+        ready()가 False인 동안(예: 호출 속도 제한 토큰이 모자람)은 사용자 요청이 먼저 쓰도록 기다립니다.
+        """
+        jobs = list(jobs)
+
+        def run():
+            for key, inputs in jobs:
+                while len(self._in_flight) >= max_parallel or (ready is not None and not ready()):
+                    time.sleep(interval)
+                self.refresh(key, runnable, inputs, config)
+                time.sleep(interval)
+
+        thread = threading.Thread(target=run, name="response-cache-prewarm", daemon=True)
+        thread.start()
+        return thread
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def stats(self) -> dict:
+        with self._lock:
+            variants = sum(len(entries) for entries in self._entries.values())
+        return {"hits": self.hits, "misses": self.misses, "hit_rate": self.hit_rate,
+                "keys": len(self._entries), "variants": variants, "in_flight": len(self._in_flight)}
@@ -0,0 +1,134 @@
+# -*- coding: utf-8 -*-
+"""
+Streamlit 정적 파일 서빙(app/static)으로 미디어 보내기
+- .streamlit/config.toml 의 server.enableStaticServing = true 가 필요
+- 원본 파일을 앱 옆 static/ 폴더에 한 번만 복사하고 "app/static/이름?v=내용해시" URL을 돌려줌
+  → 브라우저는 URL로 한 번 받아서 캐시 (tornado StaticFileHandler: ?v= 가 있으면 장기 캐시, Range 요청 지원)
+  → 스크립트 재실행마다 파일을 읽거나 base64로 HTML에 넣어 다시 보내지 않음
+- 재실행마다 드는 비용은 원본 파일 stat() 한 번 (내용 해시는 파일이 바뀌었을 때만 다시 계산)
+- 이미지는 표시 크기로 한 번만 줄여서 WebP(애니메이션 유지)로 바꿔 올림 (publish_image)
+  결과 파일 이름에 (원본 내용 해시, 폭)이 들어가므로 다른 프로세스/재시작 후에도 다시 만들지 않음
+- 주의: Streamlit은 이미지 확장자 외에는 Content-Type: text/plain 으로 보내지만 <audio>/<video>는 내용을 보고 재생함
+"""
+
+import hashlib
+import os
+import shutil
+import threading
+from pathlib import Path
+from urllib.parse import quote
+
+STATIC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "static")
+STATIC_URL_PREFIX = "app/static"
+
+IMAGE_QUALITY = 80
+
+# (원본 경로, 수정 시각, 크기, 변환 옵션) -> URL
+_published = {}
+_lock = threading.Lock()
+
+
+def file_digest(path: str) -> str:
+    sha = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            sha.update(block)
+    return sha.hexdigest()[:16]
+
+
+def static_url(name: str, digest: str) -> str:
+    return f"{STATIC_URL_PREFIX}/{quote(name)}?v={digest}"
+
+
+def _write_static(name: str, write) -> str:
+    # 다른 프로세스가 반쯤 쓴 파일을 내보내지 않도록 임시 파일에 쓰고 바꿔치기
+    os.makedirs(STATIC_DIR, exist_ok=True)
+    target = os.path.join(STATIC_DIR, name)
+    tmp_path = f"{target}.{os.getpid()}.tmp"
+    write(tmp_path)
+    os.replace(tmp_path, target)
+    return target
+
+
+def publish(path: str, name: str = None):
+    """
+    path 파일을 static/에 올리고 브라우저용 URL을 돌려줍니다. 파일이 없으면 None.
+    """
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    key = (os.path.abspath(path), stat.st_mtime_ns, stat.st_size, None)
+    with _lock:
+        if key in _published:
+            return _published[key]
+        name = name or os.path.basename(path)
+        digest = file_digest(path)
+        target = os.path.join(STATIC_DIR, name)
+        if not (os.path.exists(target) and file_digest(target) == digest):
+            _write_static(name, lambda tmp_path: shutil.copyfile(path, tmp_path))
+        _published[key] = static_url(name, digest)
+        return _published[key]
+
+
+def _resize_frames(image, width: int):
+    # 애니메이션 GIF면 모든 프레임을, 아니면 한 장만 같은 비율로 줄임
+    from PIL import ImageSequence
+
+    height = max(1, round(image.height * width / image.width))
+    frames, durations = [], []
+    for frame in ImageSequence.Iterator(image):
+        frames.append(frame.convert("RGBA").resize((width, height), _lanczos()))
+        durations.append(frame.info.get("duration", image.info.get("duration", 100)))
+    return frames, durations
+
+
+def _lanczos():
+    from PIL import Image
+
+    return getattr(Image, "Resampling", Image).LANCZOS
+
+
+def _save_image(path: str, width: int, target_format: str):
+    def write(tmp_path):
+        from PIL import Image
+
+        with Image.open(path) as image:
+            frames, durations = _resize_frames(image, min(width, image.width))
+            options = {"format": target_format}
+            if len(frames) > 1:
+                options.update(save_all=True, append_images=frames[1:], duration=durations,
+                               loop=image.info.get("loop", 0))
+            if target_format == "WEBP":
+                options.update(quality=IMAGE_QUALITY, method=4)
+            else:
+                options.update(optimize=True)
+            frames[0].save(tmp_path, **options)
+    return write
+
+
+def _image_format() -> str:
+    from PIL import features
+
+    return "WEBP" if features.check("webp") else "GIF"
+
+
+def publish_image(path: str, width: int):
+    """
+    path 이미지를 표시 폭(width px)에 맞게 줄여 static/에 올리고 URL을 돌려줍니다. 파일이 없으면 None.
+    """
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    key = (os.path.abspath(path), stat.st_mtime_ns, stat.st_size, width)
+    with _lock:
+        if key in _published:
+            return _published[key]
+        digest = file_digest(path)
+        target_format = _image_format()
+        name = f"{Path(path).stem}-{digest}-{width}w.{target_format.lower()}"
+        if not os.path.exists(os.path.join(STATIC_DIR, name)):
+            _write_static(name, _save_image(path, width, target_format))
+        _published[key] = static_url(name, digest)
+        return _published[key]
@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+"""
+토큰 스트리밍 출력 도우미
+- 체인/LLM의 .stream() 결과를 st.write_stream에 바로 넘길 수 있는 문자열 제너레이터로 변환
+- 첫 토큰까지 걸린 시간(TTFT)과 전체 응답 시간을 따로 기록
+"""
+
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class StreamTimer:
+    def __init__(self, name: str = "llm"):
+        self.name = name
+        self.started = time.perf_counter()
+        self.first_token_at = None
+        self.finished_at = None
+
+    def mark_token(self) -> None:
+        if self.first_token_at is None:
+            self.first_token_at = time.perf_counter()
+
+    def finish(self) -> None:
+        self.finished_at = time.perf_counter()
+        logger.info("%s stream: ttft=%.3fs total=%.3fs", self.name, self.ttft or 0.0, self.total)
+
+    @property
+    def ttft(self):
+        return self.first_token_at - self.started if self.first_token_at else None
+
+    @property
+    def total(self) -> float:
+        return (self.finished_at or time.perf_counter()) - self.started
+
+    def caption(self) -> str:
+        ttft = f"{self.ttft:.2f}초" if self.ttft is not None else "-"
+        return f"⏱️ 첫 토큰 {ttft} · 전체 {self.total:.2f}초"
+
+
+def text_stream(chunks, timer: StreamTimer, key: str = None, on_extra=None):
+    """
+    .stream() 결과를 문자열 조각만 내보내는 제너레이터로 바꿉니다.
+    - 문자열, 메시지 청크(.content), dict(key 항목) 모두 처리
+    - dict의 key 이외 항목(RAG의 context 등)은 도착하는 대로 on_extra(이름, 값) 호출
+    """
+    for chunk in chunks:
+        if isinstance(chunk, dict):
+            if on_extra is not None:
+                for name, value in chunk.items():
+                    if name != key:
+                        on_extra(name, value)
+            text = chunk.get(key, "")
+        else:
+            text = getattr(chunk, "content", chunk)
+        if text:
+            timer.mark_token()
+            yield text
+    timer.finish()
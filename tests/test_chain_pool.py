@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+import sys
+import threading
+
+import pytest
+
+from chain_pool import ChainPool
+from rag_embeddings import resident_memory_mb
+
+
+class FakeGateway:
+    def stats(self):
+        return {"clients": 1}
+
+
+def test_least_recently_used_chain_is_evicted():
+    built = []
+    pool = ChainPool(lambda key: built.append(key) or f"chain-{key}", max_size=2, gateway=FakeGateway())
+    assert pool.get("a") == "chain-a"
+    pool.get("b")
+    pool.get("a")
+    pool.get("c")
+    pool.get("a")
+    pool.get("b")
+    assert built == ["a", "b", "c", "b"]
+    stats = pool.stats()
+    assert (stats["chains"], stats["hits"], stats["misses"], stats["evictions"]) == (2, 2, 4, 2)
+
+
+def test_slow_build_does_not_block_other_lookups():
+    started, release = threading.Event(), threading.Event()
+
+    def build(key):
+        if key == "slow":
+            started.set()
+            release.wait(5)
+        return f"chain-{key}"
+
+    pool = ChainPool(build, gateway=FakeGateway())
+    pool.get("fast")
+    worker = threading.Thread(target=pool.get, args=("slow",))
+    worker.start()
+    assert started.wait(5)
+    # 다른 키 조회/생성은 느린 생성을 기다리지 않음
+    assert pool.get("fast") == "chain-fast"
+    assert pool.get("other") == "chain-other"
+    release.set()
+    worker.join(5)
+    assert pool.get("slow") == "chain-slow"
+
+
+def test_concurrent_builds_of_one_key_share_the_first_chain():
+    barrier = threading.Barrier(2)
+    pool = ChainPool(lambda key: barrier.wait(5) and object() or object(), gateway=FakeGateway())
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(pool.get("a"))) for _ in range(2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(5)
+    assert results[0] is results[1]
+    assert pool.stats()["chains"] == 1
+
+
+@pytest.mark.skipif(not sys.platform.startswith("linux"), reason="현재 RSS는 /proc 기준")
+def test_stats_report_memory_growth_per_chain():
+    pool = ChainPool(lambda key: b"x" * (32 * 1024 * 1024), gateway=FakeGateway())
+    pool.get("big")
+    stats = pool.stats()
+    assert stats["rss_per_chain_mb"] >= 16
+    assert stats["build_rss_mb"] == stats["rss_per_chain_mb"]
+    assert stats["rss_mb"] >= stats["build_rss_mb"]
+    assert abs(stats["rss_mb"] - resident_memory_mb()) < 16
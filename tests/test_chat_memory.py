@@ -0,0 +1,159 @@
+# -*- coding: utf-8 -*-
+import threading
+
+from langchain_core.chat_history import InMemoryChatMessageHistory
+from langchain_core.messages import AIMessage, HumanMessage
+
+from chat_memory import SUMMARY_PREFIX, SummaryState, WindowedChatHistory
+from chat_store import ChatStore, SQLiteChatMessageHistory
+from token_budget import estimate_message_tokens
+
+
+class RecordingSummarizer:
+    def __init__(self):
+        self.calls = []
+
+    def __call__(self, previous, messages):
+        self.calls.append((previous, list(messages)))
+        return f"요약{len(self.calls)}"
+
+
+def conversation(turns: int, length: int = 40):
+    history = InMemoryChatMessageHistory()
+    for i in range(turns):
+        history.add_message(HumanMessage(content=f"질문{i} " + "가" * length))
+        history.add_message(AIMessage(content=f"답변{i} " + "나" * length))
+    return history
+
+
+def test_short_history_is_sent_unchanged():
+    store = conversation(2)
+    memory = WindowedChatHistory(store, SummaryState(), RecordingSummarizer(), token_budget=1000)
+    assert memory.messages == store.messages
+    assert not memory.needs_compaction()
+
+
+def test_window_keeps_newest_messages_within_budget():
+    store = conversation(20)
+    memory = WindowedChatHistory(store, SummaryState(), RecordingSummarizer(), token_budget=200)
+    window = memory.messages
+    assert window[-1] == store.messages[-1]
+    assert window[0].type == "human"
+    assert estimate_message_tokens(window) <= 200
+    assert len(window) < len(store.messages)
+
+
+def test_compact_folds_overflow_into_summary():
+    store = conversation(20)
+    summarizer = RecordingSummarizer()
+    state = SummaryState()
+    memory = WindowedChatHistory(store, state, summarizer, token_budget=200)
+    assert memory.compact()
+    previous, folded = summarizer.calls[0]
+    assert previous == ""
+    assert folded == store.messages[:state.summarized]
+
+    window = memory.messages
+    assert window[0].content == SUMMARY_PREFIX + "요약1"
+    assert window[1:] == store.messages[state.summarized:][-len(window[1:]):]
+    assert estimate_message_tokens(window) <= 200
+
+
+def test_next_fold_only_summarizes_new_overflow():
+    store = conversation(20)
+    summarizer = RecordingSummarizer()
+    state = SummaryState()
+    memory = WindowedChatHistory(store, state, summarizer, token_budget=200)
+    memory.compact()
+    first_mark = state.summarized
+    for i in range(5):
+        store.add_message(HumanMessage(content=f"추가 질문{i} " + "다" * 40))
+        store.add_message(AIMessage(content=f"추가 답변{i} " + "라" * 40))
+    memory.compact()
+    previous, folded = summarizer.calls[1]
+    assert previous == "요약1"
+    assert folded == store.messages[first_mark:state.summarized]
+
+
+def test_failed_summary_keeps_state():
+    def broken(previous, messages):
+        raise RuntimeError("quota")
+
+    state = SummaryState()
+    memory = WindowedChatHistory(conversation(20), state, broken, token_budget=200)
+    assert not memory.compact()
+    assert state.snapshot() == ("", 0)
+
+
+def test_clearing_store_resets_summary():
+    store = conversation(20)
+    state = SummaryState()
+    memory = WindowedChatHistory(store, state, RecordingSummarizer(), token_budget=200)
+    memory.compact()
+    memory.clear()
+    assert state.snapshot() == ("", 0)
+    assert memory.messages == []
+
+
+def test_background_compaction_waits_for_high_water_and_folds_to_low_water():
+    store = conversation(2)
+    state = SummaryState()
+    summarizer = RecordingSummarizer()
+    memory = WindowedChatHistory(store, state, summarizer, token_budget=400)
+    assert memory.compact_in_background() is None
+
+    for i in range(20):
+        store.add_message(HumanMessage(content=f"질문 {i} " + "마" * 40))
+    assert memory.needs_compaction()
+    memory.compact_in_background().result(timeout=10)
+    assert len(summarizer.calls) == 1
+    # 낮은 수위까지 접었으므로 다음 답변 뒤에 바로 또 요약하지 않음
+    assert not memory.needs_compaction()
+
+
+def test_background_compaction_runs_once_per_session():
+    release = threading.Event()
+
+    def slow(previous, messages):
+        release.wait(10)
+        return "요약"
+
+    memory = WindowedChatHistory(conversation(20), SummaryState(), slow, token_budget=200)
+    first = memory.compact_in_background()
+    assert memory.compact_in_background() is first
+    release.set()
+    assert first.result(timeout=10)
+
+
+def test_summary_is_kept_in_the_chat_store(tmp_path):
+    store = ChatStore(str(tmp_path / "chat.sqlite"))
+    history = SQLiteChatMessageHistory(store, "app", "s1")
+    history.add_messages(conversation(20).messages)
+    summarizer = RecordingSummarizer()
+    WindowedChatHistory(history, SummaryState(), summarizer, token_budget=200).compact()
+
+    # 새로고침/재시작: session_state는 비었지만 요약은 DB에서 이어짐
+    reloaded = WindowedChatHistory(SQLiteChatMessageHistory(store, "app", "s1"), SummaryState(), summarizer,
+                                   token_budget=200)
+    assert reloaded.messages[0].content == SUMMARY_PREFIX + "요약1"
+    folded = len(summarizer.calls[0][1])
+    assert reloaded.compact()
+    previous, chunk = summarizer.calls[1]
+    assert previous == "요약1"
+    assert chunk[0] == history.messages[folded]
+
+
+def test_long_backlog_is_folded_in_bounded_chunks(tmp_path):
+    store = ChatStore(str(tmp_path / "chat.sqlite"))
+    history = SQLiteChatMessageHistory(store, "app", "s1")
+    history.add_messages(conversation(200).messages)
+    summarizer = RecordingSummarizer()
+    memory = WindowedChatHistory(history, SummaryState(), summarizer, token_budget=1500, fold_token_limit=1000)
+    assert memory.compact()
+    assert len(summarizer.calls) > 1
+    assert all(estimate_message_tokens(folded) <= 1000 for _, folded in summarizer.calls)
+    # 요약 호출마다 앞 요약을 이어받고, 창 밖 메시지는 빠짐없이 한 번씩 접힘
+    assert [previous for previous, _ in summarizer.calls[1:]] == [f"요약{i}" for i in range(1, len(summarizer.calls))]
+    folded = [message for _, chunk in summarizer.calls for message in chunk]
+    assert folded == history.messages[:len(folded)]
+    assert store.load_summary("app", "s1") == (f"요약{len(summarizer.calls)}", len(folded))
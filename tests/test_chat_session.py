@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+import sys
+import types
+
+import pytest
+import streamlit
+
+import chat_session
+from chat_session import (SESSION_COOKIE, SESSION_STATE_KEY, chat_session_id, cookie_session_id,
+                          is_valid_session_id, new_session_id, parse_cookie_header, session_label)
+
+
+@pytest.fixture
+def browser(monkeypatch):
+    """st.context.cookies와 쿠키 쓰기를 흉내 냄"""
+    state = types.SimpleNamespace(cookies={}, stored=[])
+    monkeypatch.setattr(streamlit, "context", state, raising=False)
+    monkeypatch.setattr(chat_session, "_store_cookie", state.stored.append)
+    return state
+
+
+def test_new_ids_are_random_and_valid():
+    first, second = new_session_id(), new_session_id()
+    assert first != second
+    assert is_valid_session_id(first)
+    assert not is_valid_session_id("abc")
+    assert not is_valid_session_id("x" * 40 + ";")
+
+
+def test_cookie_values_are_checked():
+    session_id = new_session_id()
+    assert parse_cookie_header(f"theme=dark; {SESSION_COOKIE}={session_id}") == {"theme": "dark", SESSION_COOKIE: session_id}
+    assert cookie_session_id({SESSION_COOKIE: session_id}) == session_id
+    assert cookie_session_id({SESSION_COOKIE: "short"}) is None
+    assert cookie_session_id(parse_cookie_header(None)) is None
+
+
+def test_new_browser_gets_a_cookie_not_a_url(browser):
+    query_params, session_state = {}, {}
+    session_id = chat_session_id(query_params, session_state)
+    assert query_params == {}
+    assert chat_session_id(query_params, session_state) == session_id
+    assert browser.stored == [session_id, session_id]
+
+
+def test_reload_reads_the_cookie_and_renews_it(browser):
+    session_id = new_session_id()
+    browser.cookies = {SESSION_COOKIE: session_id}
+    session_state = {}
+    assert chat_session_id({}, session_state) == session_id
+    assert session_state[SESSION_STATE_KEY] == session_id
+    # 돌아온 사용자도 보관 기간을 새로 씀
+    assert browser.stored == [session_id]
+
+
+def test_legacy_url_id_is_dropped_not_adopted(browser):
+    leaked = new_session_id()
+    query_params = {"sid": leaked, "profile": "1"}
+    assert chat_session_id(query_params, {}) != leaked
+    assert query_params == {"profile": "1"}
+
+
+def test_old_streamlit_reads_the_websocket_headers(monkeypatch):
+    session_id = new_session_id()
+    monkeypatch.delattr(streamlit, "context", raising=False)
+    headers = types.ModuleType("streamlit.web.server.websocket_headers")
+    headers._get_websocket_headers = lambda: {"Cookie": f"{SESSION_COOKIE}={session_id}"}
+    monkeypatch.setitem(sys.modules, "streamlit.web.server.websocket_headers", headers)
+    assert cookie_session_id(chat_session._request_cookies()) == session_id
+
+
+def test_missing_cookie_reader_is_an_error(monkeypatch):
+    monkeypatch.delattr(streamlit, "context", raising=False)
+    monkeypatch.setitem(sys.modules, "streamlit.web.server.websocket_headers", None)
+    monkeypatch.setattr(chat_session, "_store_cookie", lambda session_id: None)
+    with pytest.raises(RuntimeError):
+        chat_session_id({}, {})
+
+
+def test_label_does_not_reveal_the_id():
+    session_id = new_session_id()
+    label = session_label(session_id)
+    assert label and session_id not in label and len(label) == 12
+    assert session_label(None) is None
@@ -0,0 +1,120 @@
+# -*- coding: utf-8 -*-
+import sqlite3
+import time
+
+import pytest
+from langchain_core.messages import AIMessage, HumanMessage
+
+from chat_store import ChatStore, SQLiteChatMessageHistory
+
+
+@pytest.fixture
+def store(tmp_path):
+    return ChatStore(str(tmp_path / "chat.sqlite"))
+
+
+def messages(n, start=0):
+    return [HumanMessage(content=f"m{i}") if i % 2 == 0 else AIMessage(content=f"m{i}") for i in range(start, start + n)]
+
+
+def contents(items):
+    return [message.content for message in items]
+
+
+def test_append_count_and_read_pages(store):
+    store.append("app", "s1", messages(5))
+    store.append("app", "s1", messages(2, start=5))
+    assert store.count("app", "s1") == 7
+    assert contents(store.read("app", "s1")) == [f"m{i}" for i in range(7)]
+    assert contents(store.read("app", "s1", 2, 4)) == ["m2", "m3"]
+    assert store.read("app", "s1", 6, 100)[0].type == "human"
+    assert store.read("app", "s1", 7) == []
+
+
+def test_sessions_and_namespaces_are_separate(store):
+    store.append("app", "s1", messages(3))
+    store.append("other", "s1", messages(1))
+    assert store.count("app", "s2") == 0
+    assert store.count("other", "s1") == 1
+
+
+def rows(store):
+    return store._conn.execute("SELECT COUNT(*) FROM messages").fetchone()[0]
+
+
+def test_clear_restarts_numbering(store):
+    store.append("app", "s1", messages(4))
+    store.append("app", "s2", messages(2))
+    store.clear("app", "s1")
+    # 표시만 남기지 않고 메시지를 실제로 지움
+    assert rows(store) == 2
+    assert store.count("app", "s1") == 0
+    assert store.read("app", "s1") == []
+    store.append("app", "s1", messages(1, start=10))
+    assert contents(store.read("app", "s1")) == ["m10"]
+
+
+def test_history_loads_lazily_and_tracks_appends(store):
+    history = SQLiteChatMessageHistory(store, "app", "s1", page_size=2)
+    history.add_messages(messages(5))
+    reopened = SQLiteChatMessageHistory(store, "app", "s1", page_size=2)
+    assert contents(reopened.messages) == [f"m{i}" for i in range(5)]
+    assert contents(reopened.messages_from(3)) == ["m3", "m4"]
+    reopened.add_message(HumanMessage(content="m5"))
+    assert reopened.count() == 6 and reopened.messages[-1].content == "m5"
+
+
+def test_summary_survives_reopen_and_uses_compare_and_set(tmp_path):
+    path = str(tmp_path / "chat.sqlite")
+    store = ChatStore(path)
+    store.append("app", "s1", messages(10))
+    assert store.load_summary("app", "s1") == ("", 0)
+    assert store.save_summary("app", "s1", "요약", 6, expected=0)
+    # 다른 쪽이 먼저 반영한 뒤의 늦은 저장은 무시
+    assert not store.save_summary("app", "s1", "늦은 요약", 4, expected=0)
+    assert ChatStore(path).load_summary("app", "s1") == ("요약", 6)
+
+
+def test_clear_resets_summary(store):
+    store.append("app", "s1", messages(10))
+    store.save_summary("app", "s1", "요약", 6, expected=0)
+    store.clear("app", "s1")
+    assert store.load_summary("app", "s1") == ("", 0)
+    store.append("app", "s1", messages(4))
+    assert store.save_summary("app", "s1", "새 요약", 2, expected=0)
+    assert store.load_summary("app", "s1") == ("새 요약", 2)
+
+
+def test_old_sessions_table_is_migrated(tmp_path):
+    path = str(tmp_path / "chat.sqlite")
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE sessions (namespace TEXT NOT NULL, session_id TEXT NOT NULL, next_seq INTEGER NOT NULL,"
+                 " cleared_seq INTEGER NOT NULL, updated REAL NOT NULL, PRIMARY KEY (namespace, session_id))")
+    conn.execute("INSERT INTO sessions VALUES ('app', 's1', 8, 3, ?)", (time.time(),))
+    conn.commit()
+    conn.close()
+    store = ChatStore(path)
+    assert store.count("app", "s1") == 5
+    assert store.load_summary("app", "s1") == ("", 0)
+    assert store.save_summary("app", "s1", "요약", 2, expected=0)
+
+
+def test_idle_sessions_are_purged_after_retention(tmp_path):
+    store = ChatStore(str(tmp_path / "chat.sqlite"), retention_days=1)
+    store.append("app", "old", messages(3))
+    store.save_summary("app", "old", "요약", 2, expected=0)
+    store.append("app", "new", messages(2))
+    store._conn.execute("UPDATE sessions SET updated = updated - 2 * 86400 WHERE session_id = 'old'")
+    assert store.purge_expired() == 1
+    assert store.count("app", "old") == 0
+    assert store.load_summary("app", "old") == ("", 0)
+    assert store.count("app", "new") == 2
+    assert rows(store) == 2
+
+
+def test_retention_zero_keeps_everything(tmp_path):
+    store = ChatStore(str(tmp_path / "chat.sqlite"), retention_days=0)
+    store.append("app", "old", messages(3))
+    store._conn.execute("UPDATE sessions SET updated = 0")
+    assert store.purge_expired() == 0
+    assert store.count("app", "old") == 3
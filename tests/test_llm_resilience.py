@@ -0,0 +1,168 @@
+# -*- coding: utf-8 -*-
+"""
+복원력 계층을 로컬 가짜 Gemini 서버(fake_gemini_server.py)에 붙여서 재시도/헤징/폴백을 확인합니다.
+langchain-google-genai 1.0.x는 429를 클라이언트 안에서 오래 재시도하므로, 실패는 느린 응답(시도별 타임아웃)으로 만듭니다.
+"""
+import asyncio
+import threading
+import time
+from http.server import ThreadingHTTPServer
+
+import pytest
+
+pytest.importorskip("langchain_google_genai")
+
+import llm_gateway
+import llm_resilience
+from fake_gemini_server import FakeGeminiState, make_handler
+from llm_resilience import ResilienceStats, ResilientLLM, RetryPolicy, TokenBucket
+
+FAST = "gemini-2.5-flash"
+SLOW = "gemini-2.5-pro"
+
+
+@pytest.fixture
+def fake_server(monkeypatch):
+    state = FakeGeminiState(latency=0.02, slow_rate=0.0, slow_latency=1.0, error_rate=0.0, fail_models=())
+    server = ThreadingHTTPServer(("127.0.0.1", 0), make_handler(state))
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    monkeypatch.setenv("GOOGLE_API_KEY", "fake")
+    monkeypatch.setattr(llm_gateway, "API_ENDPOINT", f"http://127.0.0.1:{server.server_address[1]}")
+    # 모델별 버킷/지연 기록/통계는 프로세스 공용이므로 테스트마다 새로
+    monkeypatch.setattr(llm_resilience, "_buckets", {})
+    monkeypatch.setattr(llm_resilience, "_latency", {})
+    monkeypatch.setattr(llm_resilience, "stats", ResilienceStats())
+    yield state
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def gateway():
+    return llm_gateway.LLMGateway(max_concurrency=4)
+
+
+def make_llm(gateway, models=(FAST,), **policy):
+    policy.setdefault("base_delay", 0.01)
+    return ResilientLLM(list(models), policy=RetryPolicy(**policy), gateway=gateway)
+
+
+def test_invoke_and_stream(fake_server, gateway):
+    llm = make_llm(gateway)
+    assert llm.invoke("안녕").content == f"[{FAST}] 안녕"
+    assert "".join(chunk.content for chunk in llm.stream("스트리밍")) == f"[{FAST}] 스트리밍"
+    assert llm_resilience.stats.as_dict()["retries"] == 0
+
+
+def test_clients_are_ready_before_calls_reach_the_loop(fake_server, gateway):
+    make_llm(gateway, [FAST, SLOW])
+    assert gateway.stats()["clients"] == 2
+
+    async def build_on_loop():
+        return gateway.client("gemini-other")
+
+    # 루프 안에서 새로 만들면 그동안 모든 호출이 멈추므로 거부
+    with pytest.raises(RuntimeError):
+        asyncio.run_coroutine_threadsafe(build_on_loop(), gateway._loop).result(5)
+
+
+def test_timed_out_attempt_is_retried(fake_server, gateway):
+    fake_server.slow_first = 1
+    llm = make_llm(gateway, attempt_timeout=0.3, hedge=False)
+    assert llm.invoke("재시도").content == f"[{FAST}] 재시도"
+    assert llm_resilience.stats.retries == 1
+    assert fake_server.requests == 2
+
+
+def test_slow_call_is_hedged(fake_server, gateway):
+    tracker = llm_resilience._tracker(FAST, "invoke")
+    for _ in range(llm_resilience.MIN_LATENCY_SAMPLES):
+        tracker.record(0.05)
+    fake_server.slow_first = 1
+    llm = make_llm(gateway, min_hedge_delay=0.1, attempt_timeout=5)
+    started = time.monotonic()
+    assert llm.invoke("헤징").content == f"[{FAST}] 헤징"
+    assert time.monotonic() - started < fake_server.slow_latency
+    assert (llm_resilience.stats.hedges, llm_resilience.stats.hedge_wins) == (1, 1)
+
+
+def test_stream_and_invoke_latency_are_tracked_separately(fake_server, gateway):
+    llm = make_llm(gateway)
+    llm.invoke("a")
+    "".join(chunk.content for chunk in llm.stream("b"))
+    assert len(llm_resilience._tracker(FAST, "invoke").samples) == 1
+    assert len(llm_resilience._tracker(FAST, "stream").samples) == 1
+
+
+def test_falls_back_to_first_model(fake_server, gateway):
+    fake_server.slow_models = {SLOW}
+    llm = make_llm(gateway, models=(SLOW, FAST), max_attempts=2, attempt_timeout=0.3, hedge=False)
+    assert "".join(chunk.content for chunk in llm.stream("폴백")) == f"[{FAST}] 폴백"
+    stats = llm_resilience.stats
+    assert (stats.retries, stats.fallbacks, stats.failures) == (1, 1, 0)
+
+
+def test_gives_up_after_every_model_times_out(fake_server, gateway):
+    fake_server.slow_models = {FAST}
+    llm = make_llm(gateway, max_attempts=2, attempt_timeout=0.2, hedge=False)
+    with pytest.raises(asyncio.TimeoutError):
+        llm.invoke("실패")
+    assert llm_resilience.stats.failures == 1
+
+
+class NoGateway:
+    def client(self, model, **kwargs):
+        return None
+
+
+def test_hedge_loser_stream_is_closed(monkeypatch):
+    monkeypatch.setattr(llm_resilience, "_latency", {})
+    monkeypatch.setattr(llm_resilience, "stats", ResilienceStats())
+    tracker = llm_resilience._tracker("m", "stream")
+    for _ in range(llm_resilience.MIN_LATENCY_SAMPLES):
+        tracker.record(0.01)
+    delays = iter([0.5, 0.0])
+    closed = []
+
+    async def chunks(delay):
+        try:
+            await asyncio.sleep(delay)
+            yield f"after {delay}"
+            yield "more"
+        finally:
+            closed.append(delay)
+
+    def make_call():
+        return llm_resilience._first_chunk(chunks(next(delays)).__aiter__())
+
+    llm = ResilientLLM(["m"], policy=RetryPolicy(min_hedge_delay=0.05), gateway=NoGateway())
+
+    async def run():
+        first, stream = await llm._hedged("m", "stream", make_call, llm_resilience._close_stream)
+        closed_before = list(closed)
+        await stream.aclose()
+        return first, closed_before
+
+    first, closed_before = asyncio.run(run())
+    assert first == "after 0.0"
+    # 느린 첫 호출은 취소되면서 스트림이 닫히고, 이긴 스트림은 아직 열려 있음
+    assert closed_before == [0.5]
+    assert llm_resilience.stats.hedge_wins == 1
+
+
+def test_token_bucket_waits_when_empty():
+    bucket = TokenBucket(rate=20.0, capacity=2)
+
+    async def take(n):
+        for _ in range(n):
+            await bucket.acquire()
+
+    started = time.monotonic()
+    asyncio.run(take(4))
+    # 처음 2개는 바로, 나머지 2개는 초당 20개 속도로 채워지는 만큼 기다림
+    assert time.monotonic() - started >= 0.09
+    assert bucket.waited == 2
+    assert bucket.available() < 1
+    time.sleep(0.06)
+    assert 1 <= bucket.available() <= 2
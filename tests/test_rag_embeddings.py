@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*-
+import sqlite3
+
+import pytest
+
+from rag_embeddings import EmbeddingCache
+
+
+class FailingConnection:
+    """첫 INSERT executemany에서 디스크가 찬 것처럼 실패하는 연결"""
+
+    def __init__(self, conn):
+        self._conn = conn
+        self.fail = True
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    def executemany(self, sql, rows):
+        if self.fail and sql.startswith("INSERT"):
+            self.fail = False
+            raise sqlite3.OperationalError("database or disk is full")
+        return self._conn.executemany(sql, rows)
+
+
+def test_put_and_get_round_trip(tmp_path):
+    cache = EmbeddingCache(str(tmp_path / "emb.sqlite"))
+    cache.put_many("m", ["가", "나"], [[1.0, 2.0], [3.0, 4.0]])
+    assert [list(vector) if vector is not None else None for vector in cache.get_many("m", ["나", "다", "가"])] == [
+        [3.0, 4.0], None, [1.0, 2.0]]
+    assert cache._count == 2
+
+
+def test_oldest_entries_are_evicted(tmp_path):
+    cache = EmbeddingCache(str(tmp_path / "emb.sqlite"), max_entries=2)
+    for i, text in enumerate(["a", "b", "c"]):
+        cache.put_many("m", [text], [[float(i)]])
+    assert cache._count == 2
+    assert cache.get_many("m", ["a"]) == [None]
+
+
+def test_failed_write_is_rolled_back(tmp_path):
+    path = str(tmp_path / "emb.sqlite")
+    cache = EmbeddingCache(path)
+    cache._conn = FailingConnection(cache._conn)
+    with pytest.raises(sqlite3.OperationalError):
+        cache.put_many("m", ["가"], [[1.0]])
+    # 트랜잭션이 열린 채 남지 않고, 다음 쓰기는 바로 커밋되어 다른 연결에서도 보임
+    assert not cache._conn.in_transaction
+    cache.put_many("m", ["나"], [[2.0]])
+    assert sqlite3.connect(path).execute("SELECT COUNT(*) FROM embeddings").fetchone()[0] == 1
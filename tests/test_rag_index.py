@@ -0,0 +1,42 @@
+# -*- coding: utf-8 -*-
+import os
+
+import pytest
+
+from rag_index import build_index, current_version, list_versions, load_index
+
+HANDBOOK = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "my_highschool_handbook.pdf")
+
+
+class FakeEngine:
+    model_name = "fake-embedding"
+    batch_size = 8
+    workers = 1
+
+    def embed_documents(self, texts):
+        return [[float(len(text)), 1.0] for text in texts]
+
+
+@pytest.fixture
+def index_root(tmp_path):
+    return str(tmp_path / "indexes")
+
+
+def test_forced_rebuilds_in_the_same_second_get_distinct_versions(index_root):
+    first = build_index(HANDBOOK, "handbook", FakeEngine(), index_root, workers=1, force=True)
+    second = build_index(HANDBOOK, "handbook", FakeEngine(), index_root, workers=1, force=True)
+    assert first.version != second.version
+    assert current_version("handbook", index_root) == second.version
+    assert load_index("handbook", index_root).manifest["count"] == first.manifest["count"]
+
+
+def test_rebuild_keeps_only_newest_versions(index_root):
+    versions = [build_index(HANDBOOK, "handbook", FakeEngine(), index_root, workers=1, force=True, keep=2).version
+                for _ in range(4)]
+    assert list_versions("handbook", index_root) == sorted(versions[-2:])
+    assert current_version("handbook", index_root) == versions[-1]
+
+
+def test_unchanged_pdf_reuses_current_version(index_root):
+    first = build_index(HANDBOOK, "handbook", FakeEngine(), index_root, workers=1)
+    assert build_index(HANDBOOK, "handbook", FakeEngine(), index_root, workers=1).version == first.version
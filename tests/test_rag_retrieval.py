@@ -0,0 +1,149 @@
+# -*- coding: utf-8 -*-
+import logging
+
+from langchain_core.documents import Document
+from langchain_core.vectorstores import VectorStore
+
+from rag_retrieval import BM25Index, HybridRetriever, PackStats, pack_documents, tokenize_ko
+from token_budget import estimate_tokens
+
+
+class FakeVectorStore(VectorStore):
+    """
+    similarity_search가 미리 정한 순서대로 문서를 돌려주는 벡터 DB
+    """
+
+    def __init__(self, docs):
+        self.docs = docs
+
+    def add_texts(self, texts, metadatas=None, **kwargs):
+        raise NotImplementedError
+
+    @classmethod
+    def from_texts(cls, texts, embedding, metadatas=None, **kwargs):
+        raise NotImplementedError
+
+    def similarity_search(self, query, k=4, **kwargs):
+        return self.docs[:k]
+
+
+def make_doc(chunk_id, text, page=0):
+    return Document(page_content=text, metadata={"chunk_id": chunk_id, "source": "a.pdf", "page": page})
+
+
+CHUNKS = {
+    "c1": "도서 연체료는 하루에 100원입니다.",
+    "c2": "열람실은 오전 9시에 엽니다.",
+    "c3": "제12조 휴학은 두 학기를 넘을 수 없다.",
+    "c4": "졸업 요건은 130학점 이상입니다.",
+}
+
+
+def make_index():
+    ids = list(CHUNKS)
+    return BM25Index.build(ids, [CHUNKS[i] for i in ids], [make_doc(i, CHUNKS[i]).metadata for i in ids])
+
+
+def test_tokenize_ko_adds_bigrams_and_number_runs():
+    tokens = tokenize_ko("연체료는 제12조")
+    assert "연체료는" in tokens
+    assert {"연체", "체료", "료는"} <= set(tokens)
+    assert "제12조" in tokens and "12" in tokens
+
+
+def test_tokenize_ko_drops_thousands_separators():
+    assert "1000원" in tokenize_ko("1,000원")
+
+
+def test_bm25_ranks_exact_term_first():
+    results = make_index().search("연체료 얼마", k=2)
+    assert results[0][0] == "c1"
+    assert all(score > 0 for _, score in results)
+
+
+def test_bm25_matches_article_number():
+    assert make_index().search("12조")[0][0] == "c3"
+
+
+def test_bm25_save_and_load_round_trip(tmp_path):
+    index = make_index()
+    index.fingerprint = "abc"
+    path = str(tmp_path / "index.bm25.json")
+    index.save(path)
+    loaded = BM25Index.load(path)
+    assert loaded.fingerprint == "abc"
+    assert loaded.search("졸업 학점") == index.search("졸업 학점")
+    assert loaded.document("c2").page_content == CHUNKS["c2"]
+
+
+def test_bm25_load_rejects_missing_and_broken_files(tmp_path):
+    assert BM25Index.load(str(tmp_path / "missing.json")) is None
+    broken = tmp_path / "broken.json"
+    broken.write_text("{", encoding="utf-8")
+    assert BM25Index.load(str(broken)) is None
+
+
+def test_hybrid_retriever_fuses_ranks_with_rrf():
+    # 벡터 검색: c2, c4, c1 / BM25("연체료"): c1 → 두 목록 모두에 있는 c1이 1등
+    vectorstore = FakeVectorStore([make_doc(i, CHUNKS[i]) for i in ("c2", "c4", "c1")])
+    retriever = HybridRetriever(vectorstore=vectorstore, index=make_index(), k=2, fetch_k=3)
+    docs = retriever.invoke("연체료")
+    assert [doc.metadata["chunk_id"] for doc in docs] == ["c1", "c2"]
+
+
+def test_hybrid_retriever_returns_bm25_only_hits():
+    vectorstore = FakeVectorStore([make_doc("c2", CHUNKS["c2"])])
+    retriever = HybridRetriever(vectorstore=vectorstore, index=make_index(), k=3, fetch_k=3)
+    docs = {doc.metadata["chunk_id"]: doc for doc in retriever.invoke("제12조 휴학")}
+    # 벡터 검색에 없던 c3은 BM25 색인에 저장된 본문으로 채움
+    assert docs["c3"].page_content == CHUNKS["c3"]
+
+
+def page_chunk(text, page, index, source="a.pdf"):
+    return Document(page_content=text, metadata={
+        "source": source, "page": page, "chunk_index": index, "chunk_id": f"{source}:{page}:{index}",
+    })
+
+
+def test_pack_documents_merges_same_page_and_drops_overlap():
+    shared = "x" * 40
+    first = page_chunk("A" * 60 + shared, page=1, index=0)
+    second = page_chunk(shared + "B" * 60, page=1, index=1)
+    packed = pack_documents([second, first], token_budget=1000)
+    assert len(packed) == 1
+    assert packed[0].page_content == "A" * 60 + shared + "B" * 60
+    assert packed[0].metadata["chunk_ids"] == ["a.pdf:1:0", "a.pdf:1:1"]
+
+
+def test_pack_documents_joins_chunks_without_overlap():
+    packed = pack_documents([page_chunk("첫 청크", 1, 0), page_chunk("둘째 청크", 1, 1)], token_budget=1000)
+    assert packed[0].page_content == "첫 청크\n\n둘째 청크"
+
+
+def test_pack_documents_keeps_rank_order_across_pages():
+    docs = [page_chunk("p3", 3, 0), page_chunk("p1", 1, 0), page_chunk("p3 more", 3, 1)]
+    packed = pack_documents(docs, token_budget=1000)
+    assert [doc.metadata["page"] for doc in packed] == [3, 1]
+
+
+def test_pack_documents_trims_last_block_to_budget():
+    docs = [page_chunk("a" * 400, 1, 0), page_chunk("b" * 400, 2, 0), page_chunk("c" * 400, 3, 0)]
+    packed = pack_documents(docs, token_budget=160)
+    # 100토큰 + 남은 60토큰만큼 자른 블록, 세 번째는 버림
+    assert [estimate_tokens(doc.page_content) for doc in packed] == [100, 60]
+    assert packed[1].page_content == "b" * 240
+
+
+def test_pack_documents_drops_tiny_remainder():
+    docs = [page_chunk("a" * 400, 1, 0), page_chunk("b" * 400, 2, 0)]
+    assert len(pack_documents(docs, token_budget=120)) == 1
+
+
+def test_pack_documents_records_and_logs_saved_tokens(caplog):
+    stats = PackStats()
+    docs = [page_chunk("a" * 400, 1, 0), page_chunk("b" * 400, 2, 0)]
+    with caplog.at_level(logging.INFO, logger="rag_retrieval"):
+        pack_documents(docs, token_budget=100, stats=stats)
+    assert (stats.requests, stats.tokens_before, stats.tokens_after) == (1, 200, 100)
+    assert stats.avg_saved == 100
+    assert "saved 100" in caplog.text
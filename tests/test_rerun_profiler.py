@@ -0,0 +1,19 @@
+# -*- coding: utf-8 -*-
+import rerun_profiler
+
+
+def test_registered_stats_are_collected_and_failures_skipped(monkeypatch):
+    monkeypatch.setattr(rerun_profiler, "_stats_sources", {})
+    rerun_profiler.add_stats("gateway", lambda: {"in_flight": 1})
+    rerun_profiler.add_stats("broken", lambda: 1 / 0)
+    rerun_profiler.add_stats("gateway", lambda: {"in_flight": 2})
+    assert rerun_profiler.collect_stats() == {"gateway": {"in_flight": 2}}
+
+
+def test_shared_stats_are_registered_on_import():
+    import lazy_imports  # noqa: F401
+    import llm_resilience  # noqa: F401
+
+    stats = rerun_profiler.collect_stats()
+    assert {"calls", "retries", "hedges", "fallbacks", "p95_ms", "tokens"} <= set(stats["LLM 복원력"])
+    assert isinstance(stats["지연 import (ms)"], dict)
@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+import threading
+import time
+from concurrent.futures import Future
+
+from response_cache import ResponseCache
+
+
+class SlowGateway:
+    """submit마다 스레드 하나로 잠깐 걸려 답하고, 동시에 몇 개가 돌았는지 기록"""
+
+    def __init__(self, seconds=0.05):
+        self.seconds = seconds
+        self.running = 0
+        self.peak = 0
+        self.submitted = 0
+        self._lock = threading.Lock()
+
+    def submit(self, runnable, inputs, config=None):
+        future = Future()
+        with self._lock:
+            self.submitted += 1
+            self.running += 1
+            self.peak = max(self.peak, self.running)
+
+        def run():
+            time.sleep(self.seconds)
+            with self._lock:
+                self.running -= 1
+            future.set_result(runnable(inputs))
+
+        threading.Thread(target=run, daemon=True).start()
+        return future
+
+
+def jobs(cache, n):
+    return [(cache.key("m", 0.7, "tone", f"p{i}"), {"prompt": f"p{i}"}) for i in range(n)]
+
+
+def test_prewarm_fills_every_key_a_few_at_a_time():
+    gateway = SlowGateway()
+    cache = ResponseCache(gateway=gateway)
+    items = jobs(cache, 12)
+    cache.prewarm(items, lambda inputs: "답 " + inputs["prompt"], max_parallel=2, interval=0.01).join(5)
+    time.sleep(0.1)
+    assert gateway.peak <= 2
+    assert [cache.get(key) for key, _ in items] == [f"답 p{i}" for i in range(12)]
+
+
+def test_prewarm_waits_until_ready():
+    gateway = SlowGateway(seconds=0)
+    cache = ResponseCache(gateway=gateway)
+    ready = threading.Event()
+    thread = cache.prewarm(jobs(cache, 3), lambda inputs: "답", interval=0.01, ready=ready.is_set)
+    time.sleep(0.1)
+    # 속도 제한 몫이 모자란 동안에는 하나도 보내지 않음
+    assert gateway.submitted == 0
+    ready.set()
+    thread.join(5)
+    assert gateway.submitted == 3
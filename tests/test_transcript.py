@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+from langchain_core.messages import AIMessage, HumanMessage
+
+from transcript import Transcript, TranscriptEntry
+
+
+class PagedHistory:
+    """count()/page()만 있는 대화 기록. 읽은 구간을 기록"""
+
+    def __init__(self, n=0):
+        self.items = []
+        self.reads = []
+        self.add(n)
+
+    def add(self, n):
+        for _ in range(n):
+            i = len(self.items)
+            self.items.append(HumanMessage(content=f"m{i}") if i % 2 == 0 else AIMessage(content=f"m{i}"))
+
+    def count(self):
+        return len(self.items)
+
+    def page(self, start, stop=None):
+        self.reads.append((start, stop))
+        return self.items[start:stop]
+
+
+def shown(transcript):
+    return [entry.content for entry in transcript.state.entries if entry is not None]
+
+
+def test_first_sync_reads_only_the_visible_tail():
+    history = PagedHistory(100)
+    transcript = Transcript(history, {}, "t", visible=10)
+    transcript._sync(history.count())
+    assert history.reads == [(90, 100)]
+    assert shown(transcript) == [f"m{i}" for i in range(90, 100)]
+
+
+def test_later_syncs_read_only_new_messages():
+    history, session_state = PagedHistory(20), {}
+    Transcript(history, session_state, "t", visible=10)._sync(history.count())
+    history.add(2)
+    history.reads.clear()
+    # 재실행: 같은 session_state로 새 Transcript
+    transcript = Transcript(history, session_state, "t", visible=10)
+    transcript._sync(history.count())
+    assert history.reads == [(20, 22)]
+    assert shown(transcript) == [f"m{i}" for i in range(12, 22)]
+    transcript._sync(history.count())
+    assert history.reads == [(20, 22)]
+
+
+def test_showing_earlier_messages_reads_just_that_page():
+    history = PagedHistory(50)
+    transcript = Transcript(history, {}, "t", visible=10, step=10)
+    transcript._sync(history.count())
+    history.reads.clear()
+    transcript.state.visible += transcript.step
+    transcript._sync(history.count())
+    assert history.reads == [(30, 40)]
+    assert shown(transcript) == [f"m{i}" for i in range(30, 50)]
+
+
+def test_cleared_history_is_reread_from_scratch():
+    history, session_state = PagedHistory(20), {}
+    transcript = Transcript(history, session_state, "t", visible=10)
+    transcript._sync(history.count())
+    history.items.clear()
+    history.add(3)
+    transcript._sync(history.count())
+    assert shown(transcript) == ["m0", "m1", "m2"]
+
+
+def test_hidden_messages_are_skipped():
+    history = PagedHistory(4)
+    to_entry = lambda message: TranscriptEntry(message.type, message.content) if message.type == "ai" else None
+    transcript = Transcript(history, {}, "t", to_entry=to_entry, visible=10)
+    transcript._sync(history.count())
+    assert shown(transcript) == ["m1", "m3"]
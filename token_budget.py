@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+"""
+토큰 수 어림 계산
+- Gemini 토크나이저(네트워크 호출)를 쓰지 않고 로컬에서 빠르게 추정
+- 영문/숫자는 약 4글자당 1토큰, 한글 등 그 외 문자는 약 1.5글자당 1토큰으로 계산
+"""
+
+import math
+
+MESSAGE_OVERHEAD_TOKENS = 4
+
+
+def estimate_tokens(text: str) -> int:
+    if not text:
+        return 0
+    ascii_chars = sum(1 for ch in text if ord(ch) < 128)
+    return math.ceil(ascii_chars / 4 + (len(text) - ascii_chars) / 1.5)
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    # 앞에서부터 max_tokens 안에 들어가는 만큼만 남김
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    low, high = 0, len(text)
+    while low < high:
+        middle = (low + high + 1) // 2
+        if estimate_tokens(text[:middle]) <= max_tokens:
+            low = middle
+        else:
+            high = middle - 1
+    return text[:low]
+
+
+def estimate_message_tokens(messages) -> int:
+    return sum(estimate_tokens(str(message.content)) + MESSAGE_OVERHEAD_TOKENS for message in messages)
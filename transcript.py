@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+"""
+대화 기록 화면 출력 (재실행마다 전체 대화를 다시 읽고 그리지 않도록)
+- 화면에 보여줄 형태(역할, 아바타, 본문)로 바꾼 메시지를 세션별로 session_state에 보관
+  → 재실행 때는 저장소에서 새로 추가된 메시지만 읽어서 바꿈 (SQLiteChatMessageHistory.page)
+- 최근 visible개만 그리고, 그 앞은 "이전 대화 더 보기" 버튼 뒤에 숨김 (누를 때마다 step개씩 더)
+- 대화가 지워져서 메시지 수가 줄면 처음부터 다시 읽음
+"""
+
+import os
+from dataclasses import dataclass
+
+import streamlit as st
+
+DEFAULT_VISIBLE_MESSAGES = int(os.environ.get("TRANSCRIPT_VISIBLE_MESSAGES", 30))
+DEFAULT_LOAD_STEP = 30
+LOAD_EARLIER_LABEL = "⬆️ 이전 대화 {count}개 더 보기"
+
+
+@dataclass(frozen=True)
+class TranscriptEntry:
+    role: str
+    content: str
+    avatar: str = None
+
+
+def default_entry(message):
+    return TranscriptEntry(message.type, message.content)
+
+
+class _TranscriptState:
+    def __init__(self, visible: int):
+        self.start = 0        # entries[0]이 몇 번째 메시지인지
+        self.entries = []     # 메시지 번호 start부터의 화면용 항목 (숨기는 메시지는 None)
+        self.visible = visible
+
+    @property
+    def end(self) -> int:
+        return self.start + len(self.entries)
+
+
+class Transcript:
+    """
+    history: count()/page(start, stop)를 지원하는 대화 기록 (SQLiteChatMessageHistory)
+    to_entry(message) -> TranscriptEntry 또는 None(화면에 안 보임). 앱마다 역할/아바타 규칙을 넘깁니다.
+    """
+
+    def __init__(self, history, session_state, key: str, to_entry=default_entry,
+                 visible: int = DEFAULT_VISIBLE_MESSAGES, step: int = DEFAULT_LOAD_STEP):
+        self.history = history
+        self.key = key
+        self.to_entry = to_entry
+        self.step = step
+        if key not in session_state:
+            session_state[key] = _TranscriptState(visible)
+        self.state = session_state[key]
+
+    def _convert(self, messages):
+        return [self.to_entry(message) for message in messages]
+
+    def _sync(self, total: int) -> int:
+        state = self.state
+        if total < state.end:
+            # 대화가 지워짐
+            state.start, state.entries = 0, []
+        first = max(0, total - state.visible)
+        if not state.entries:
+            state.start = first
+            state.entries = self._convert(self.history.page(first, total))
+            return first
+        if state.end < total:
+            state.entries.extend(self._convert(self.history.page(state.end, total)))
+        if first < state.start:
+            state.entries[:0] = self._convert(self.history.page(first, state.start))
+        elif first > state.start:
+            # 창 밖으로 밀려난 항목은 버림 (다시 보여줄 때 그 부분만 다시 읽음)
+            del state.entries[:first - state.start]
+        state.start = first
+        return first
+
+    def render(self) -> None:
+        """
+        숨긴 앞부분이 있으면 "이전 대화 더 보기" 버튼을, 그 뒤로 최근 메시지를 그립니다.
+        """
+        total = self.history.count()
+        hidden = max(0, total - self.state.visible)
+        if hidden and st.button(LOAD_EARLIER_LABEL.format(count=min(hidden, self.step)), key=f"{self.key}_earlier"):
+            self.state.visible += self.step
+        self._sync(total)
+        for entry in self.state.entries:
+            if entry is not None:
+                st.chat_message(entry.role, avatar=entry.avatar).markdown(entry.content)